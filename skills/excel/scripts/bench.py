@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for excel.py - time its commands on synthetic workbooks.
+
+Usage:
+    bench.py generate <file.xlsx> [--rows N] [--cols N] [--sheets N] [--style-density F] [--formulas F] [--csv FILE]
+    bench.py run [--rows N] [--cols N] [--sheets N] [--style-density F] [--formulas F] [--workbook FILE]
+                 [--commands NAME,...] [--repeat N] [--output FILE] [--baseline FILE] [--threshold F]
+    bench.py compare <results.json> <baseline.json> [--threshold F]
+
+Each command runs in a fresh process with the daemon disabled; wall time and
+peak RSS come from os.wait4. Commands that modify the workbook run on a fresh
+copy each time (the copy is not timed). `run --baseline` and `compare` flag
+commands whose median wall time or peak RSS grew by more than --threshold
+(default 0.2, i.e. 20%) and exit with status 1 if any did.
+"""
+
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+try:
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill, Alignment
+    HAS_OPENPYXL = True
+except ImportError:
+    HAS_OPENPYXL = False
+
+
+EXCEL_PY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "excel.py")
+
+DEFAULT_ROWS = 50000
+DEFAULT_COLS = 8
+DEFAULT_REPEAT = 3
+DEFAULT_THRESHOLD = 0.2
+
+COLUMN_KINDS = ("int", "text", "category", "float", "float", "date")
+CATEGORIES = ("alpha", "beta", "gamma", "delta", "epsilon")
+NEEDLE = "needle"
+NEEDLE_RATE = 0.001     # share of text cells containing NEEDLE
+
+
+def ok(data: dict):
+    print(json.dumps({"success": True, **data}, indent=2, default=str))
+
+
+def fail(message: str, details: dict = None):
+    result = {"success": False, "error": message}
+    if details:
+        result.update(details)
+    print(json.dumps(result, indent=2, default=str))
+    sys.exit(1)
+
+
+def require_openpyxl():
+    if not HAS_OPENPYXL:
+        fail("openpyxl not installed. Run: pip install openpyxl")
+
+
+# ============================================================================
+# Synthetic workbooks
+# ============================================================================
+
+def column_kinds(cols: int) -> list:
+    return [COLUMN_KINDS[i % len(COLUMN_KINDS)] for i in range(cols)]
+
+
+def synthetic_rows(rows: int, kinds: list, rng: random.Random):
+    """Yield the header and `rows` data rows of mixed types."""
+    yield [f"{kind}_{i + 1}" for i, kind in enumerate(kinds)]
+    start = datetime(2024, 1, 1)
+    for r in range(rows):
+        row = []
+        for kind in kinds:
+            if kind == "int":
+                row.append(r + 1)
+            elif kind == "text":
+                word = NEEDLE if rng.random() < NEEDLE_RATE else f"item{rng.randrange(10000)}"
+                row.append(f"{word} {rng.randrange(100)}")
+            elif kind == "category":
+                row.append(rng.choice(CATEGORIES))
+            elif kind == "float":
+                row.append(round(rng.uniform(0, 10000), 2))
+            else:
+                row.append(start + timedelta(days=rng.randrange(3650)))
+        yield row
+
+
+def formula_for(kinds: list, row: int) -> str:
+    """A formula over the row's numeric cells."""
+    from openpyxl.utils import get_column_letter
+    numeric = [get_column_letter(i + 1) for i, kind in enumerate(kinds) if kind in ("int", "float")]
+    return "=" + "+".join(f"{col}{row}" for col in numeric[:3]) if numeric else "=ROW()"
+
+
+def generate_workbook(path: str, rows: int, cols: int, sheets: int = 1,
+                      style_density: float = 0.0, formulas: float = 0.0,
+                      csv_path: str = None, seed: int = 0) -> dict:
+    """Write a synthetic workbook (and optionally the first sheet as CSV)."""
+    require_openpyxl()
+    rng = random.Random(seed)
+    kinds = column_kinds(max(cols, 1))
+    styles = [
+        {"font": Font(bold=True)},
+        {"fill": PatternFill(start_color="FFFFFF00", end_color="FFFFFF00", fill_type="solid")},
+        {"font": Font(italic=True, color="FFFF0000"), "alignment": Alignment(horizontal="center")},
+        {"number_format": "#,##0.00"},
+    ]
+
+    wb = Workbook(write_only=True)
+    csv_file = open(csv_path, 'w', newline='', encoding='utf-8') if csv_path else None
+    styled = formula_rows = 0
+    try:
+        writer = csv.writer(csv_file) if csv_file else None
+        for s in range(max(sheets, 1)):
+            ws = wb.create_sheet(title=f"Sheet{s + 1}")
+            for r, values in enumerate(synthetic_rows(rows, kinds, rng), start=1):
+                if writer and s == 0:
+                    writer.writerow(v.isoformat(sep=" ") if isinstance(v, datetime) else v for v in values)
+                if r > 1 and formulas and rng.random() < formulas:
+                    values = values + [formula_for(kinds, r)]
+                    formula_rows += 1
+                if r > 1 and style_density:
+                    cells = []
+                    for value in values:
+                        if rng.random() < style_density:
+                            cell = WriteOnlyCell(ws, value=value)
+                            for attr, style in rng.choice(styles).items():
+                                setattr(cell, attr, style)
+                            cells.append(cell)
+                            styled += 1
+                        else:
+                            cells.append(value)
+                    values = cells
+                ws.append(values)
+        wb.save(path)
+    finally:
+        if csv_file:
+            csv_file.close()
+
+    result = {
+        "file": path,
+        "bytes": os.path.getsize(path),
+        "rows": rows,
+        "cols": len(kinds),
+        "sheets": max(sheets, 1),
+        "styled_cells": styled,
+        "formula_rows": formula_rows,
+    }
+    if csv_path:
+        result["csv"] = csv_path
+        result["csv_bytes"] = os.path.getsize(csv_path)
+    return result
+
+
+# ============================================================================
+# Timing
+# ============================================================================
+
+def data_rows(path: str) -> int:
+    """Rows below the header on a workbook's first sheet, from its stored dimension."""
+    require_openpyxl()
+    from openpyxl import load_workbook
+    try:
+        wb = load_workbook(path, read_only=True)
+    except Exception as e:
+        fail(f"Failed to open workbook: {e}")
+    rows = (wb.worksheets[0].max_row or 1) - 1
+    wb.close()
+    return max(rows, 1)
+
+
+def bench_commands(workbook: str, csv_path: str, workdir: str, rows: int) -> dict:
+    """name -> (argv after excel.py, modifies_workbook)."""
+    mid = max(rows // 2, 2)
+    return {
+        "info": (["info", workbook], False),
+        "read": (["read", workbook], False),
+        "read-range": (["read", workbook, "--range", f"A{mid}:E{mid + 99}"], False),
+        "find": (["find", workbook, NEEDLE], False),
+        "replace": (["replace", workbook, NEEDLE, "pin"], True),
+        "format": (["format", workbook, f"A1:E{rows + 1}", "--bold", "--bg-color", "YELLOW"], True),
+        "to-csv": (["to-csv", workbook, os.path.join(workdir, "out.csv")], False),
+        "to-json": (["to-json", workbook, os.path.join(workdir, "out.json")], False),
+        "from-csv": (["from-csv", csv_path, os.path.join(workdir, "from-csv.xlsx"), "--coerce"], False),
+    }
+
+
+def time_process(argv: list, env: dict) -> dict:
+    """Run argv to completion; wall seconds, peak RSS and exit status."""
+    started = time.perf_counter()
+    proc = subprocess.Popen(argv, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, env=env)
+    stderr = proc.stderr.read()
+    _, status, usage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - started
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    proc.stderr.close()
+    result = {
+        "wall_s": round(wall, 4),
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        "rss_mb": round(usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1),
+        "exit": proc.returncode,
+    }
+    if proc.returncode:
+        result["stderr"] = stderr.decode("utf-8", "replace")[-2000:]
+    return result
+
+
+def run_benchmarks(workbook: str, csv_path: str, workdir: str, rows: int,
+                   names: list, repeat: int) -> dict:
+    env = dict(os.environ, EXCEL_NO_DAEMON="1", EXCEL_CLI_CACHE=os.path.join(workdir, "cache"))
+    commands = bench_commands(workbook, csv_path, workdir, rows)
+    scratch = os.path.join(workdir, "scratch" + os.path.splitext(workbook)[1])
+
+    results = {}
+    for name in names:
+        args, modifies = commands[name]
+        runs = []
+        for _ in range(max(repeat, 1)):
+            if modifies:
+                shutil.copyfile(workbook, scratch)
+                args = [scratch if a == workbook else a for a in commands[name][0]]
+            runs.append(time_process([sys.executable, EXCEL_PY] + args, env))
+        walls = [r["wall_s"] for r in runs]
+        results[name] = {
+            "argv": args,
+            "runs": len(runs),
+            "wall_s": walls,
+            "wall_min": min(walls),
+            "wall_median": round(statistics.median(walls), 4),
+            "rss_mb": max(r["rss_mb"] for r in runs),
+            "exit": max(r["exit"] for r in runs),
+        }
+        errors = [r["stderr"] for r in runs if "stderr" in r]
+        if errors:
+            results[name]["stderr"] = errors[-1]
+    return results
+
+
+def compare_results(current: dict, baseline: dict, threshold: float) -> dict:
+    """Per-command ratios against the baseline; regressions past threshold."""
+    rows, regressions = [], []
+    for name, result in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        entry = {"command": name}
+        for metric in ("wall_median", "rss_mb"):
+            if base.get(metric):
+                ratio = round(result[metric] / base[metric], 3)
+                entry[metric] = {"baseline": base[metric], "current": result[metric], "ratio": ratio}
+                if ratio > 1 + threshold:
+                    regressions.append(f"{name}: {metric} {base[metric]} -> {result[metric]} (x{ratio})")
+        rows.append(entry)
+    return {"threshold": threshold, "comparison": rows, "regressions": regressions}
+
+
+def load_results(path: str) -> dict:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        fail(f"Failed to read results {path}: {e}")
+
+
+# ============================================================================
+# Commands
+# ============================================================================
+
+def cmd_generate(args):
+    """Write a synthetic workbook."""
+    ok(generate_workbook(args.file, args.rows, args.cols, args.sheets,
+                         args.style_density, args.formulas, args.csv, args.seed))
+
+
+def cmd_run(args):
+    """Generate (or take) a workbook, time each command, write results."""
+    names = [n.strip() for n in args.commands.split(",")] if args.commands else None
+    known = list(bench_commands("", "", "", 1))
+    unknown = [n for n in names or [] if n not in known]
+    if unknown:
+        fail(f"Unknown benchmark command(s): {', '.join(unknown)}", {"available": known})
+
+    workdir = tempfile.mkdtemp(prefix="excel-bench-")
+    try:
+        csv_path = os.path.join(workdir, "data.csv")
+        rows = args.rows
+        if args.workbook:
+            workbook = args.workbook
+            generated = None
+            rows = data_rows(workbook)
+            if not names:
+                names = [n for n in known if n != "from-csv"]
+            elif "from-csv" in names:
+                fail("from-csv needs a generated workbook; drop --workbook or the command")
+        else:
+            workbook = os.path.join(workdir, "bench.xlsx")
+            generated = generate_workbook(workbook, args.rows, args.cols, args.sheets,
+                                          args.style_density, args.formulas, csv_path, args.seed)
+
+        results = run_benchmarks(workbook, csv_path, workdir, rows, names or known, args.repeat)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "workbook": generated or {"file": args.workbook},
+        "repeat": args.repeat,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        report["output"] = args.output
+
+    comparison = None
+    if args.baseline:
+        comparison = compare_results(report, load_results(args.baseline), args.threshold)
+        report.update(comparison)
+    failed = [name for name, r in results.items() if r["exit"]]
+    if failed:
+        report["failed"] = failed
+    ok(report)
+    if failed or (comparison and comparison["regressions"]):
+        sys.exit(1)
+
+
+def cmd_compare(args):
+    """Compare a results file with a baseline."""
+    comparison = compare_results(load_results(args.results), load_results(args.baseline), args.threshold)
+    ok(comparison)
+    if comparison["regressions"]:
+        sys.exit(1)
+
+
+def add_workbook_args(p):
+    p.add_argument("--rows", type=int, default=DEFAULT_ROWS, help="Data rows per sheet")
+    p.add_argument("--cols", type=int, default=DEFAULT_COLS, help="Columns")
+    p.add_argument("--sheets", type=int, default=1, help="Sheets")
+    p.add_argument("--style-density", type=float, default=0.0, help="Share of cells given a style (0-1)")
+    p.add_argument("--formulas", type=float, default=0.0, help="Share of rows with a formula column (0-1)")
+    p.add_argument("--seed", type=int, default=0, help="Random seed")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks for excel.py",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    subparsers = parser.add_subparsers(dest="command", help="Commands")
+
+    # generate
+    p = subparsers.add_parser("generate", help="Write a synthetic workbook")
+    p.add_argument("file", help="Output workbook")
+    add_workbook_args(p)
+    p.add_argument("--csv", help="Also write the first sheet's data to this CSV")
+
+    # run
+    p = subparsers.add_parser("run", help="Time excel.py commands")
+    add_workbook_args(p)
+    p.add_argument("--workbook", help="Benchmark this workbook instead of a generated one")
+    p.add_argument("--commands", help="Comma-separated subset (default: all)")
+    p.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Runs per command")
+    p.add_argument("--output", "-o", help="Write results JSON here")
+    p.add_argument("--baseline", help="Compare with this results file")
+    p.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Allowed slowdown ratio")
+
+    # compare
+    p = subparsers.add_parser("compare", help="Compare results with a baseline")
+    p.add_argument("results", help="Results JSON")
+    p.add_argument("baseline", help="Baseline results JSON")
+    p.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Allowed slowdown ratio")
+
+    return parser
+
+
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+    if not args.command:
+        parser.print_help()
+        sys.exit(1)
+
+    commands = {
+        "generate": cmd_generate,
+        "run": cmd_run,
+        "compare": cmd_compare,
+    }
+    commands[args.command](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,14 +6,19 @@ Excel CLI - Comprehensive Excel file manipulation.
 Read, write, edit, and format Excel files (.xlsx, .xls).
 
 Usage:
-    excel.py info <file>
-    excel.py read <file> [--sheet NAME] [--range A1:B10] [--format json|csv|markdown]
+    excel.py info <file> [--scan]
+    excel.py read <file> [--sheet NAME] [--range A1:B10[,D1:D10]] [--format json|ndjson|csv|markdown] [--chunk-size N]
+        [--page N [--page-size M]] [--max-width N]
     excel.py cell <file> <cell> [--sheet NAME]
     excel.py create <file> [--sheets NAME,NAME2]
     excel.py write <file> --data JSON [--sheet NAME] [--start A1]
-    excel.py from-csv <csv_file> <excel_file> [--sheet NAME]
-    excel.py from-json <json_file> <excel_file> [--sheet NAME]
-    excel.py edit <file> <cell> <value> [--sheet NAME] [--formula]
+    excel.py from-csv <csv_file>... <excel_file> [--sheet NAME] [--coerce] [--max-rows N] [--repeat-header] [--workers N]
+    excel.py append <file> --data ROWS.jsonl|-|JSON [--sheet NAME] [--coerce]
+    excel.py sort <file> --by COL[,-COL] [--sheet NAME] [--header] [--output FILE] [--memory-mb N]
+    excel.py dedupe <file> [--sheet NAME] [--key COLS] [--keep first|last] [--verify] [--report FILE] [--output FILE] [--dry-run]
+    excel.py from-json <json_file> <excel_file> [--sheet NAME] [--ndjson] [--max-rows N] [--repeat-header]
+    excel.py edit <file> <cell> <value> [--sheet NAME] [--formula] [--recalc]
+    excel.py recalc <file>
     excel.py add-sheet <file> <name> [--position N]
     excel.py rename-sheet <file> <old_name> <new_name>
     excel.py delete-sheet <file> <name>
@@ -27,28 +32,140 @@ Usage:
     excel.py format <file> <range> [--sheet NAME] [options...]
     excel.py resize <file> [--row N:HEIGHT] [--col A:WIDTH] [--sheet NAME]
     excel.py freeze <file> <cell> [--sheet NAME]
-    excel.py find <file> <text> [--sheet NAME]
-    excel.py replace <file> <old> <new> [--sheet NAME]
-    excel.py to-csv <file> <output> [--sheet NAME]
-    excel.py to-json <file> <output> [--sheet NAME]
-    excel.py to-markdown <file> [--sheet NAME]
+    excel.py find <file> <text> [--sheet NAME] [--columns A,C:E] [--max-results N] [--regex] [--whole-cell] [--index]
+    excel.py replace <file> [<old> <new>] [--map FILE] [--sheet NAME | --all-sheets] [--range A1:D10] [--regex] [--dry-run]
+    excel.py profile <file> [--sheet NAME] [--top K] [--sample N] [--seed N] [--no-header]
+    excel.py aggregate <file> [--group-by COLS] [--count] [--sum COLS] [--mean COLS] [--min COLS] [--max COLS] [--out SHEET] [--output FILE]
+    excel.py query <file> <sql> [--format json|ndjson|csv|markdown] [--no-header] [--no-cache]
+    excel.py diff <old> <new> [--key COL[,COL]] [--sheet NAME] [--sheet-b NAME] [--no-header] [--values]
+    excel.py join <left> <right> --on KEY[,KEY|LEFT=RIGHT] [--how left|inner|anti] [--output FILE] [--sheet NAME] [--right-sheet NAME]
+    excel.py apply-diff <file> <diff.json> [--sheet NAME] [--force]
+    excel.py to-csv <file> <output> [--sheet NAME | --all-sheets [--workers N]] [--chunk-size N]
+    excel.py to-json <file> <output> [--sheet NAME | --all-sheets [--workers N]] [--ndjson] [--chunk-size N]
+    excel.py to-markdown <file> [--sheet NAME | --all-sheets --output-dir DIR [--workers N]]
+        [--page N [--page-size M]] [--max-width N]
+    excel.py to-parquet <file> <output> [--sheet NAME] [--batch-size N] [--types COL=TYPE,...]
+    excel.py to-arrow <file> <output> [--sheet NAME] [--batch-size N] [--types COL=TYPE,...]
+    excel.py batch <file> [--ops FILE] [--dry-run]
+    excel.py serve [--socket PATH] [--memory-mb N] [--status|--stop]
 """
 
 import argparse
+import bisect
 import csv
+import hashlib
+import html
+import io
 import json
+import math
+import operator
 import os
 import re
+import socket
+import struct
 import sys
+import time
+import zipfile
+import zlib
+import xml.etree.ElementTree as ET
+from datetime import date, datetime, time as dt_time, timedelta
+from decimal import Decimal
+from collections import OrderedDict
+from contextlib import redirect_stderr, redirect_stdout
+from itertools import chain as iter_chain, islice
 from pathlib import Path
 from typing import Any, Optional, Union
 
+# ============================================================================
+# Daemon client
+# ============================================================================
+#
+# `excel.py serve` keeps workbooks parsed between calls. While it is running,
+# ordinary invocations send their argv over a Unix socket and print the
+# daemon's output instead of parsing the file themselves. Set EXCEL_NO_DAEMON=1
+# to bypass it. This part only needs the standard library and runs before the
+# openpyxl import below, so forwarded calls never pay for that import.
+
+def cache_dir() -> Path:
+    """Directory for the daemon socket and other cached state."""
+    return Path(os.environ.get("EXCEL_CLI_CACHE", Path.home() / ".cache" / "excel-cli"))
+
+
+def daemon_socket_path() -> str:
+    return os.environ.get("EXCEL_DAEMON_SOCKET", str(cache_dir() / "excel.sock"))
+
+
+def daemon_request(request: dict, socket_path: Optional[str] = None,
+                   timeout: Optional[float] = None) -> Optional[dict]:
+    """Send one request to the daemon; None if no daemon is listening."""
+    socket_path = socket_path or daemon_socket_path()
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(socket_path):
+        return None
+    
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.settimeout(timeout)
+            conn.connect(socket_path)
+            conn.sendall(json.dumps(request).encode("utf-8") + b"\n")
+            conn.shutdown(socket.SHUT_WR)
+            chunks = []
+            while True:
+                chunk = conn.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+    except OSError:
+        return None
+    
+    try:
+        return json.loads(b"".join(chunks))
+    except json.JSONDecodeError:
+        return None
+
+
+def should_forward(argv: list) -> bool:
+    """Whether this invocation can be answered by a running daemon."""
+    if os.environ.get("EXCEL_NO_DAEMON") or not argv:
+        return False
+    if argv[0] in ("serve", "-h", "--help") or "-h" in argv or "--help" in argv:
+        return False
+    # batch reads its operations from stdin unless --ops names a file
+    if argv[0] == "batch" and ("--ops" not in argv or "-" in argv):
+        return False
+    if argv[0] in ("apply-diff", "append") and "-" in argv:
+        return False
+    return True
+
+
+def forward_to_daemon(argv: list) -> bool:
+    """Run argv in the daemon and replay its output; False if unavailable."""
+    if not should_forward(argv):
+        return False
+    
+    response = daemon_request({"argv": argv, "cwd": os.getcwd()})
+    if response is None or "code" not in response:
+        return False
+    
+    sys.stdout.write(response.get("stdout", ""))
+    sys.stderr.write(response.get("stderr", ""))
+    sys.stdout.flush()
+    sys.exit(response["code"])
+
+
+if __name__ == "__main__":
+    forward_to_daemon(sys.argv[1:])
+
+
 try:
     from openpyxl import Workbook, load_workbook
     from openpyxl.utils import get_column_letter, column_index_from_string
     from openpyxl.utils.cell import coordinate_from_string
     from openpyxl.styles import Font, PatternFill, Border, Side, Alignment
     from openpyxl.styles.colors import Color
+    from openpyxl.styles.cell_style import StyleArray
+    from openpyxl.formula.tokenizer import Tokenizer, Token
+    from openpyxl.formula.translate import Translator
+    from openpyxl.utils.datetime import to_excel, from_excel
     OPENPYXL_AVAILABLE = True
 except ImportError:
     OPENPYXL_AVAILABLE = False
@@ -56,8 +173,11 @@ except ImportError:
 try:
     import xlrd
     XLRD_AVAILABLE = True
+    # What xlrd raises for a file it can't parse
+    XLS_ERRORS = (xlrd.XLRDError, xlrd.compdoc.CompDocError)
 except ImportError:
     XLRD_AVAILABLE = False
+    XLS_ERRORS = ()
 
 
 def require_openpyxl():
@@ -66,6 +186,18 @@ def require_openpyxl():
         sys.exit(1)
 
 
+def require_pyarrow():
+    """Import pyarrow on demand; it is slow to import and only used for columnar export."""
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        print("Error: pyarrow required. Install with: pip install pyarrow", file=sys.stderr)
+        sys.exit(1)
+    return pyarrow
+
+
 def ok(data: Any):
     """Output success JSON."""
     print(json.dumps({"success": True, **data}, indent=2, default=str))
@@ -112,57 +244,125 @@ def get_sheet(wb, sheet_name: Optional[str] = None):
     if sheet_name:
         if sheet_name not in wb.sheetnames:
             fail(f"Sheet '{sheet_name}' not found", {"available": wb.sheetnames})
-        return wb[sheet_name]
-    return wb.active
+        ws = wb[sheet_name]
+    else:
+        ws = wb.active
+    touch_sheet(wb, ws)
+    return ws
+
+
+def sheet_dimensions(ws) -> Optional[str]:
+    """Return the used range (e.g. A1:D10); read-only sheets use their stored dimension."""
+    if hasattr(ws, "dimensions"):
+        return ws.dimensions
+    try:
+        return ws.calculate_dimension()
+    except ValueError:
+        return None
 
 
-def read_sheet_data(ws, range_str: Optional[str] = None) -> list:
-    """Read sheet data as list of lists."""
+def iter_bounded_rows(ws, min_row: int, max_row: int, min_col: int, max_col: int):
+    """Yield fixed-width value tuples for a rectangular block of the sheet.
+
+    iter_rows stops parsing once it passes max_row, so a small range near the
+    top of a huge sheet never reads the rest of it. Rows missing from the sheet
+    are yielded as blanks to keep the block rectangular.
+    """
+    width = max_col - min_col + 1
+    expected = min_row
+    for row in ws.iter_rows(min_row=min_row, max_row=max_row,
+                            min_col=min_col, max_col=max_col, values_only=True):
+        if len(row) < width:
+            row = tuple(row) + (None,) * (width - len(row))
+        expected += 1
+        yield row
+    for _ in range(expected, max_row + 1):
+        yield (None,) * width
+
+
+def iter_sheet_rows(ws, range_str: Optional[str] = None):
+    """Yield sheet rows as lists without materializing the sheet."""
     if range_str:
         (start_row, start_col), (end_row, end_col) = parse_range(range_str)
-        data = []
-        for row in range(start_row, end_row + 1):
-            row_data = []
-            for col in range(start_col, end_col + 1):
-                cell = ws.cell(row=row, column=col)
-                row_data.append(cell.value)
-            data.append(row_data)
-        return data
+        for row in iter_bounded_rows(ws, start_row, end_row, start_col, end_col):
+            yield list(row)
     else:
-        data = []
         for row in ws.iter_rows(values_only=True):
-            data.append(list(row))
-        return data
-
-
-def data_to_markdown(data: list, headers: bool = True) -> str:
-    """Convert data to markdown table."""
-    if not data:
-        return "*Empty*"
-    
-    # Calculate column widths
-    widths = []
-    for col_idx in range(len(data[0])):
-        max_width = 3
-        for row in data:
-            if col_idx < len(row):
-                val = str(row[col_idx]) if row[col_idx] is not None else ""
-                max_width = max(max_width, len(val))
-        widths.append(max_width)
-    
-    lines = []
-    for i, row in enumerate(data):
-        cells = []
+            yield list(row)
+
+
+def split_ranges(range_str: Optional[str]) -> list:
+    """Split "A1:C10,F1:F10" into normalized range strings."""
+    if not range_str:
+        return []
+    return [r.strip().upper() for r in range_str.split(",") if r.strip()]
+
+
+def read_ranges(ws, ranges: list) -> list:
+    """Read several ranges in a single pass over their combined row span."""
+    bounds = [parse_range(r) for r in ranges]
+    min_row = min(start[0] for start, _ in bounds)
+    max_row = max(end[0] for _, end in bounds)
+    min_col = min(start[1] for start, _ in bounds)
+    max_col = max(end[1] for _, end in bounds)
+    
+    results = [[] for _ in bounds]
+    rows = iter_bounded_rows(ws, min_row, max_row, min_col, max_col)
+    for row_idx, row in enumerate(rows, start=min_row):
+        for ((start_row, start_col), (end_row, end_col)), out in zip(bounds, results):
+            if start_row <= row_idx <= end_row:
+                out.append(list(row[start_col - min_col:end_col - min_col + 1]))
+    return results
+
+
+def iter_records(rows):
+    """Yield dicts keyed by the first row's headers."""
+    headers = None
+    for i, row in enumerate(rows):
+        if i == 0:
+            headers = list(row)
+            continue
+        row_dict = {}
         for j, val in enumerate(row):
-            val_str = str(val) if val is not None else ""
-            cells.append(val_str.ljust(widths[j]))
-        lines.append("| " + " | ".join(cells) + " |")
-        
-        if i == 0 and headers:
-            sep = ["-" * w for w in widths]
-            lines.append("| " + " | ".join(sep) + " |")
-    
-    return "\n".join(lines)
+            if j < len(headers) and headers[j]:
+                row_dict[headers[j]] = val
+        yield row_dict
+
+
+def count_rows(rows, stats: dict):
+    """Pass rows through, recording the row count and first-row width in stats."""
+    for row in rows:
+        if not stats["rows"]:
+            stats["columns"] = len(row)
+        stats["rows"] += 1
+        yield row
+
+
+def page_rows(rows, page: int, page_size: int, info: dict, header: bool = True):
+    """Yield the header (if any) and one page of the rows that follow it.
+
+    Stops reading at the end of the page; `info["more"]` records whether any
+    row came after it.
+    """
+    rows = iter(rows)
+    if header:
+        first = next(rows, None)
+        if first is None:
+            return
+        yield first
+    skip = (page - 1) * page_size
+    yield from islice(rows, skip, skip + page_size)
+    info["more"] = next(rows, None) is not None
+
+
+def chunked(iterable, size: int):
+    """Yield lists of up to `size` items from iterable."""
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, max(size, 1)))
+        if not chunk:
+            return
+        yield chunk
 
 
 def parse_color(color_str: str) -> str:
@@ -200,36 +400,785 @@ def parse_color(color_str: str) -> str:
     return "FF000000"  # Default black
 
 
+# ============================================================================
+# Streaming writers
+# ============================================================================
+#
+# Each writer consumes an iterator, writes it in chunks of `chunk_size` items
+# and returns the number of items written, so memory stays bounded by one
+# chunk regardless of sheet size.
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def write_csv_stream(rows, stream, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """Write rows as CSV."""
+    writer = csv.writer(stream)
+    count = 0
+    for chunk in chunked(rows, chunk_size):
+        writer.writerows(chunk)
+        count += len(chunk)
+    return count
+
+
+def write_ndjson_stream(items, stream, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """Write one compact JSON document per line."""
+    count = 0
+    for chunk in chunked(items, chunk_size):
+        stream.write("".join(json.dumps(item, default=str) + "\n" for item in chunk))
+        count += len(chunk)
+    return count
+
+
+MARKDOWN_SAMPLE_ROWS = 1000
+
+
+def markdown_cell(value, max_width: Optional[int] = None) -> str:
+    """Render a value as table cell text, escaped and optionally truncated."""
+    text = "" if value is None else str(value)
+    if "|" in text or "\n" in text:
+        text = text.replace("|", "\\|").replace("\r\n", "\n").replace("\n", "<br>")
+    if max_width and len(text) > max_width:
+        text = text[:max(max_width - 1, 0)] + "…"
+    return text
+
+
+def write_markdown_stream(rows, stream, headers: bool = True, max_width: Optional[int] = None,
+                          sample_size: int = MARKDOWN_SAMPLE_ROWS,
+                          chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """Write rows as a markdown table.
+
+    Column widths and the column count come from the first `sample_size`
+    rows; later rows that are wider than that are written unpadded, and
+    short rows get empty cells.
+    """
+    rows = iter(rows)
+    sample = [[markdown_cell(v, max_width) for v in row] for row in islice(rows, max(sample_size, 1))]
+    if not sample:
+        stream.write("*Empty*\n")
+        return 0
+    
+    widths = [3] * max(len(cells) for cells in sample)
+    for cells in sample:
+        for j, text in enumerate(cells):
+            if len(text) > widths[j]:
+                widths[j] = len(text)
+    n = len(widths)
+    blanks = [" " * w for w in widths]
+    
+    def render(cells):
+        padded = [text.ljust(widths[j]) if j < n else text for j, text in enumerate(cells)]
+        padded.extend(blanks[len(cells):])
+        return "| " + " | ".join(padded) + " |\n"
+    
+    rest = ([markdown_cell(v, max_width) for v in row] for row in rows)
+    count = 0
+    for chunk in chunked(iter_chain(sample, rest), chunk_size):
+        lines = [render(cells) for cells in chunk]
+        if not count and headers:
+            lines.insert(1, "| " + " | ".join("-" * w for w in widths) + " |\n")
+        stream.write("".join(lines))
+        count += len(chunk)
+    return count
+
+
+def write_json_array_stream(items, stream, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                            indent: Optional[int] = 2, level: int = 0) -> int:
+    """Write items as a JSON array.
+
+    With `indent`, the layout matches json.dump(items, indent=indent); without
+    it, each item is written compactly on its own line.
+    """
+    step = " " * indent if indent else "  "
+    pad = step * (level + 1)
+    count = 0
+    stream.write("[")
+    for chunk in chunked(items, chunk_size):
+        parts = []
+        for item in chunk:
+            text = json.dumps(item, indent=indent, default=str)
+            if indent:
+                text = text.replace("\n", "\n" + pad)
+            parts.append("\n" + pad + text)
+        stream.write(("," if count else "") + ",".join(parts))
+        count += len(chunk)
+    if count:
+        stream.write("\n" + step * level)
+    stream.write("]")
+    return count
+
+
+def write_ok_stream(fields: dict, key: str, items, stream, trailer=None,
+                    chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """Stream a success envelope whose `key` holds a large array.
+
+    `trailer` is called once the array is written and returns extra fields
+    (e.g. counts that are only known at the end).
+    """
+    stream.write("{\n")
+    for name, value in {"success": True, **fields}.items():
+        stream.write(f"  {json.dumps(name)}: {json.dumps(value, default=str)},\n")
+    stream.write(f"  {json.dumps(key)}: ")
+    write_json_array_stream(items, stream, chunk_size, indent=None, level=1)
+    for name, value in (trailer() if trailer else {}).items():
+        stream.write(f",\n  {json.dumps(name)}: {json.dumps(value, default=str)}")
+    stream.write("\n}\n")
+
+
+# ============================================================================
+# Workbook access
+# ============================================================================
+#
+# All commands open and save workbooks through open_workbook/save_workbook so
+# that `excel.py serve` can answer repeated calls from its in-memory cache.
+
+# Rough in-memory size of a parsed workbook relative to its .xlsx file size
+WORKBOOK_MEMORY_FACTOR = 50
+DEFAULT_DAEMON_MEMORY_MB = 1024
+
+
+class WorkbookCache:
+    """LRU cache of parsed workbooks keyed by path, mtime and size."""
+    
+    def __init__(self, budget_bytes: int):
+        self.budget = budget_bytes
+        self.entries = OrderedDict()  # key -> (workbook, estimated bytes)
+        self.used = 0
+        self.hits = 0
+        self.misses = 0
+        self.touched = set()
+    
+    @staticmethod
+    def key(path: str, data_only: bool) -> tuple:
+        st = os.stat(path)
+        return (os.path.abspath(path), st.st_mtime_ns, st.st_size, data_only)
+    
+    def get(self, path: str, data_only: bool):
+        key = self.key(path, data_only)
+        self.touched.add(key[0])
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+        
+        self.misses += 1
+        self.discard(key[0], data_only)
+        wb = load_workbook(path, data_only=data_only)
+        if not data_only:
+            track_changes(wb, path)
+        self.put(key, wb)
+        return wb
+    
+    def put(self, key: tuple, wb):
+        size = key[2] * WORKBOOK_MEMORY_FACTOR
+        self.entries[key] = (wb, size)
+        self.used += size
+        while self.used > self.budget and len(self.entries) > 1:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.used -= evicted
+    
+    def saved(self, path: str, wb):
+        """Keep a just-saved workbook cached under the file's new mtime/size."""
+        self.discard(os.path.abspath(path))
+        self.put(self.key(path, False), wb)
+    
+    def discard(self, abs_path: str, data_only: Optional[bool] = None):
+        for key in [k for k in self.entries if k[0] == abs_path and data_only in (None, k[3])]:
+            self.used -= self.entries.pop(key)[1]
+    
+    def stats(self) -> dict:
+        return {
+            "workbooks": len(self.entries),
+            "estimated_mb": round(self.used / 1024 / 1024, 1),
+            "budget_mb": round(self.budget / 1024 / 1024, 1),
+            "hits": self.hits,
+            "misses": self.misses,
+            "cached": [k[0] for k in self.entries],
+        }
+
+
+# Set by `excel.py serve`; None in a normal one-shot process
+_workbook_cache: Optional[WorkbookCache] = None
+
+
+def open_workbook(path: str, read_only: bool = False, data_only: bool = False):
+    """Open a workbook, from the daemon cache when running under `serve`.
+    
+    Legacy .xls files open read-only through xlrd; asking to open one for
+    editing fails.
+    """
+    if is_xls(path):
+        if not read_only:
+            reject_xls(path)
+        return XlsWorkbook(path)
+    reject_encrypted(path)
+    if _workbook_cache is not None:
+        return _workbook_cache.get(path, data_only)
+    wb = load_workbook(path, read_only=read_only, data_only=data_only)
+    if not read_only and not data_only:
+        track_changes(wb, path)
+    return wb
+
+
+def open_read_only(path: str):
+    """Open a workbook read-only for a one-off pass, bypassing the daemon cache."""
+    if is_xls(path):
+        return XlsWorkbook(path)
+    reject_encrypted(path)
+    return load_workbook(path, read_only=True, data_only=True)
+
+
+def save_workbook(wb, path: str):
+    """Save a workbook and keep the daemon cache in step with the file.
+    
+    Workbooks loaded from the same file are saved surgically when possible.
+    Formula results computed by recalc are written in as cached values, which
+    openpyxl itself never saves.
+    """
+    if not surgical_save(wb, path):
+        wb.save(path)
+    if getattr(wb, "formula_values", None):
+        write_formula_values(path, wb.formula_values)
+    if not wb.write_only:
+        track_changes(wb, path)
+    if _workbook_cache is not None:
+        if wb.write_only:
+            _workbook_cache.discard(os.path.abspath(path))
+        else:
+            _workbook_cache.saved(path, wb)
+
+
+# ============================================================================
+# Legacy .xls
+# ============================================================================
+#
+# openpyxl only reads .xlsx, so .xls files are opened through xlrd and wrapped
+# in the small part of the read-only worksheet API that the read/export/find
+# code paths use (sheetnames, active, [name], iter_rows, close). Sheets are
+# parsed only when first accessed.
+
+# Compound File Binary signature that every BIFF (.xls) workbook starts with
+OLE2_SIGNATURE = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+# Password-protected .xlsx files are Compound File Binary containers too
+OOXML_EXTENSIONS = (".xlsx", ".xlsm", ".xltx", ".xltm")
+
+
+def require_xlrd():
+    if not XLRD_AVAILABLE:
+        print("Error: xlrd required for .xls files. Install with: pip install xlrd", file=sys.stderr)
+        sys.exit(1)
+
+
+def is_ole2(path: str) -> bool:
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(OLE2_SIGNATURE)) == OLE2_SIGNATURE
+    except OSError:
+        return False
+
+
+def is_xls(path: str) -> bool:
+    """True for legacy .xls workbooks, detected by content rather than
+    extension - except that an OLE2 file named like an .xlsx is taken for an
+    encrypted one (see reject_encrypted)."""
+    return is_ole2(path) and not path.lower().endswith(OOXML_EXTENSIONS)
+
+
+def reject_encrypted(path: str):
+    """Fail cleanly for a password-protected .xlsx, which neither openpyxl nor xlrd reads."""
+    if path.lower().endswith(OOXML_EXTENSIONS) and is_ole2(path):
+        fail(f"'{path}' is encrypted (password-protected)",
+             {"hint": "Remove the password in Excel (File > Info > Protect Workbook) and try again"})
+
+
+def reject_xls(path: str, command: Optional[str] = None):
+    """Fail cleanly for commands that need an .xlsx workbook."""
+    if is_xls(path):
+        message = (f"'{command}' does not support legacy .xls files" if command
+                   else "Legacy .xls files are read-only")
+        fail(message, {"hint": "Convert first, e.g. to-csv then from-csv, or save as .xlsx in Excel"})
+    reject_encrypted(path)
+
+
+class XlsSheet:
+    """Read-only worksheet over an xlrd sheet, yielding openpyxl-style values."""
+    
+    def __init__(self, book, sheet):
+        self.book = book
+        self.sheet = sheet
+        self.title = sheet.name
+        self.max_row = sheet.nrows
+        self.max_column = sheet.ncols
+    
+    def calculate_dimension(self) -> str:
+        return f"A1:{coords_to_cell(max(self.max_row, 1), max(self.max_column, 1))}"
+    
+    def convert(self, ctype: int, value):
+        if ctype == xlrd.XL_CELL_TEXT:
+            return value
+        if ctype == xlrd.XL_CELL_NUMBER:
+            return int(value) if value.is_integer() else value
+        if ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK):
+            return None
+        if ctype == xlrd.XL_CELL_DATE:
+            try:
+                converted = xlrd.xldate_as_datetime(value, self.book.datemode)
+            except (xlrd.xldate.XLDateError, OverflowError):
+                return value
+            return converted.time() if 0 <= value < 1 else converted
+        if ctype == xlrd.XL_CELL_BOOLEAN:
+            return bool(value)
+        if ctype == xlrd.XL_CELL_ERROR:
+            return xlrd.error_text_from_code.get(value, "#ERR")
+        return value
+    
+    def iter_rows(self, min_row: Optional[int] = None, max_row: Optional[int] = None,
+                  min_col: Optional[int] = None, max_col: Optional[int] = None,
+                  values_only: bool = True):
+        sheet, convert = self.sheet, self.convert
+        first_col = (min_col or 1) - 1
+        last_col = max_col or self.max_column
+        width = max(last_col - first_col, 0)
+        plain = (xlrd.XL_CELL_TEXT, xlrd.XL_CELL_EMPTY)
+        for rowx in range((min_row or 1) - 1, min(max_row or self.max_row, self.max_row)):
+            end = min(last_col, self.max_column)
+            types = sheet.row_types(rowx, first_col, end)
+            values = sheet.row_values(rowx, first_col, end)
+            row = tuple(
+                value if ctype in plain and value != "" else convert(ctype, value)
+                for ctype, value in zip(types, values)
+            )
+            if len(row) < width:
+                row += (None,) * (width - len(row))
+            yield row
+
+
+class XlsWorkbook:
+    """Read-only workbook over xlrd with on-demand sheet loading."""
+    
+    write_only = False
+    
+    def __init__(self, path: str):
+        require_xlrd()
+        self.book = xlrd.open_workbook(path, on_demand=True)
+        self.sheetnames = self.book.sheet_names()
+        self.loaded = {}
+    
+    def __getitem__(self, name: str) -> XlsSheet:
+        if name not in self.loaded:
+            if name not in self.sheetnames:
+                raise KeyError(f"Worksheet {name} does not exist.")
+            self.loaded[name] = XlsSheet(self.book, self.book.sheet_by_name(name))
+        return self.loaded[name]
+    
+    @property
+    def worksheets(self) -> list:
+        return [self[name] for name in self.sheetnames]
+    
+    @property
+    def active(self) -> Optional[XlsSheet]:
+        # xlrd has no workbook-level active index; the first sheet is used, as
+        # openpyxl does for workbooks without one
+        return self[self.sheetnames[0]] if self.sheetnames else None
+    
+    def close(self):
+        self.book.release_resources()
+
+
+def read_xls_metadata(path: str) -> dict:
+    """Sheet names, used ranges and visibility of an .xls workbook."""
+    wb = XlsWorkbook(path)
+    sheets = []
+    active = None
+    try:
+        for index, name in enumerate(wb.sheetnames):
+            sheet = wb.book.sheet_by_index(index)
+            info = {"name": name}
+            if sheet.visibility:
+                info["state"] = "hidden" if sheet.visibility == 1 else "veryHidden"
+            if sheet.sheet_visible and active is None:
+                active = name
+            info.update({
+                "dimensions": XlsSheet(wb.book, sheet).calculate_dimension(),
+                "max_row": sheet.nrows,
+                "max_column": sheet.ncols,
+                "dimension_source": "xls",
+            })
+            wb.book.unload_sheet(index)
+            sheets.append(info)
+    finally:
+        wb.close()
+    return {"sheets": sheets, "active_sheet": active or (sheets[0]["name"] if sheets else None)}
+
+
+# ============================================================================
+# Workbook metadata
+# ============================================================================
+#
+# Reads sheet names and used ranges straight from the .xlsx zip: workbook.xml
+# for the sheet list and each worksheet's <dimension> element, which sits at
+# the top of the sheet XML, so parsing stops long before the cell data.
+
+NS_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+NS_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+NS_PKG_REL = "http://schemas.openxmlformats.org/package/2006/relationships"
+REL_OFFICE_DOCUMENT = NS_REL + "/officeDocument"
+
+
+def zip_part_path(base: str, target: str) -> str:
+    """Resolve a relationship target relative to the part that references it."""
+    if target.startswith("/"):
+        return target.lstrip("/")
+    parts = base.split("/")[:-1]
+    for piece in target.split("/"):
+        if piece == "..":
+            if parts:
+                parts.pop()
+        elif piece and piece != ".":
+            parts.append(piece)
+    return "/".join(parts)
+
+
+def read_relationships(zf, rels_path: str, base: str) -> dict:
+    """Map relationship ids to (type, part path) from a .rels part."""
+    if rels_path not in zf.namelist():
+        return {}
+    root = ET.fromstring(zf.read(rels_path))
+    return {
+        rel.get("Id"): (rel.get("Type"), zip_part_path(base, rel.get("Target")))
+        for rel in root.iter(f"{{{NS_PKG_REL}}}Relationship")
+    }
+
+
+def parse_part(data: bytes):
+    """Parse an XML part, registering its namespace prefixes so that
+    ET.tostring writes them back as-is rather than as ns0, ns1, ..."""
+    events = ET.iterparse(io.BytesIO(data), events=("start-ns",))
+    for _, (prefix, uri) in events:
+        ET.register_namespace(prefix, uri)
+    return events.root
+
+
+def workbook_part_path(zf) -> str:
+    """Path of the main workbook part (normally xl/workbook.xml)."""
+    for rel_type, path in read_relationships(zf, "_rels/.rels", "").values():
+        if rel_type == REL_OFFICE_DOCUMENT:
+            return path
+    return "xl/workbook.xml"
+
+
+def list_sheet_parts(zf) -> tuple:
+    """Return ([{name, path, kind, state}], active index) from workbook.xml."""
+    wb_path = workbook_part_path(zf)
+    rels_path = zip_part_path(wb_path, "_rels/" + wb_path.rsplit("/", 1)[-1] + ".rels")
+    rels = read_relationships(zf, rels_path, wb_path)
+    root = ET.fromstring(zf.read(wb_path))
+    
+    sheets = []
+    for sheet in root.iter(f"{{{NS_MAIN}}}sheet"):
+        rel_type, path = rels.get(sheet.get(f"{{{NS_REL}}}id"), ("", None))
+        sheets.append({
+            "name": sheet.get("name"),
+            "path": path,
+            "kind": rel_type.rsplit("/", 1)[-1] or "worksheet",
+            "state": sheet.get("state", "visible"),
+        })
+    
+    view = root.find(f"{{{NS_MAIN}}}bookViews/{{{NS_MAIN}}}workbookView")
+    active = int(view.get("activeTab", 0)) if view is not None else 0
+    return sheets, active
+
+
+def scan_sheet_dimension(zf, path: str, scan: bool = False) -> tuple:
+    """Return (ref, source) for a worksheet part.
+
+    Uses the <dimension> element unless it is missing (or has no ref) or scan
+    is set, in which case every cell is streamed to find the used range. Rows
+    and cells may leave out their r attribute, following on from the previous
+    one. An empty sheet reports "A1".
+    """
+    min_row = min_col = None
+    max_row = max_col = 0
+    row = col = 0
+    with zf.open(path) as f:
+        for event, elem in ET.iterparse(f, events=("start", "end")):
+            tag = elem.tag.rsplit("}", 1)[-1]
+            if event == "end":
+                if tag == "row":
+                    elem.clear()
+                continue
+            if tag == "dimension" and not scan and elem.get("ref"):
+                return elem.get("ref"), "dimension"
+            if tag == "row":
+                row = int(elem.get("r")) if elem.get("r") else row + 1
+                col = 0
+            elif tag == "c":
+                if elem.get("r"):
+                    col_str, row = coordinate_from_string(elem.get("r"))
+                    col = column_index_from_string(col_str)
+                else:
+                    col += 1
+                min_row = row if min_row is None else min(min_row, row)
+                min_col = col if min_col is None else min(min_col, col)
+                max_row, max_col = max(max_row, row), max(max_col, col)
+    
+    if min_row is None:
+        return "A1", "scan"
+    return f"{coords_to_cell(min_row, min_col)}:{coords_to_cell(max_row, max_col)}", "scan"
+
+
+def read_workbook_metadata(path: str, scan: bool = False) -> dict:
+    """Sheet names, used ranges and the active sheet, read from the zip directly."""
+    with zipfile.ZipFile(path) as zf:
+        parts, active = list_sheet_parts(zf)
+        sheets = []
+        for part in parts:
+            info = {"name": part["name"]}
+            if part["kind"] != "worksheet":
+                info["type"] = part["kind"]
+            if part["state"] != "visible":
+                info["state"] = part["state"]
+            if part["kind"] == "worksheet" and part["path"] in zf.namelist():
+                ref, source = scan_sheet_dimension(zf, part["path"], scan)
+                start, _, end = ref.partition(":")
+                if start == end:
+                    ref = start     # an empty sheet's "A1:A1"
+                (_, _), (max_row, max_col) = parse_range(ref)
+                info.update({
+                    "dimensions": ref,
+                    "max_row": max_row,
+                    "max_column": max_col,
+                    "dimension_source": source,
+                })
+            sheets.append(info)
+    
+    return {
+        "sheets": sheets,
+        "active_sheet": parts[active]["name"] if 0 <= active < len(parts) else None,
+    }
+
+
+# ============================================================================
+# Surgical save
+# ============================================================================
+#
+# A workbook opened for editing remembers the file it came from. On save, if
+# the sheet list is unchanged, only the sheets that commands touched (through
+# get_sheet or touch_sheet) are serialised by openpyxl; every other zip member
+# is copied across still compressed. styles.xml is rewritten only when new
+# styles were added (openpyxl keeps existing style indexes in place, so
+# untouched sheets stay valid), and calcChain.xml is dropped for Excel to
+# rebuild. Anything the shortcut can't express - sheets with relationships
+# (drawings, comments, tables, external links), pivots, new or renamed sheets
+# - falls back to a full openpyxl save.
+
+REL_CALC_CHAIN = NS_REL + "/calcChain"
+NS_CONTENT_TYPES = "http://schemas.openxmlformats.org/package/2006/content-types"
+ZIP_LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+ZIP_DATA_DESCRIPTOR_FLAG = 0x08
+ZIP_ENCRYPTED_FLAG = 0x01
+
+
+class SurgicalSaveUnsupported(Exception):
+    """The changes need a full save."""
+
+
+def style_counts(wb) -> tuple:
+    return tuple(len(items) for items in (
+        wb._cell_styles, wb._fonts, wb._fills, wb._borders, wb._number_formats,
+        wb._alignments, wb._protections, wb._differential_styles.styles, wb._named_styles,
+    ))
+
+
+def track_changes(wb, path: str):
+    """Record the on-disk state a loaded workbook matches, for surgical saves."""
+    st = os.stat(path)
+    wb.saved_state = {
+        "path": os.path.abspath(path),
+        "stat": (st.st_mtime_ns, st.st_size),
+        "sheets": list(wb.sheetnames),
+        # The sheet objects themselves, not just titles: a sheet deleted and
+        # re-created under the same name must not pass for the original
+        "sheet_objects": list(wb._sheets),
+        "styles": style_counts(wb),
+    }
+    wb.touched_sheets = set()
+
+
+def touch_sheet(wb, ws):
+    """Mark a sheet as modified so a surgical save re-serialises it."""
+    touched = getattr(wb, "touched_sheets", None)
+    if touched is not None:
+        touched.add(ws.title)
+
+
+def copy_zip_member_raw(zin, zout, info):
+    """Copy a member's compressed bytes from zin to zout without recompressing.
+
+    zipfile has no public API for this, so it writes the local header itself
+    and registers the entry the way ZipFile.writestr does.
+    """
+    if info.flag_bits & ZIP_ENCRYPTED_FLAG:
+        raise zipfile.BadZipFile(f"encrypted member {info.filename}")
+    zin.fp.seek(info.header_offset)
+    header = ZIP_LOCAL_HEADER.unpack(zin.fp.read(ZIP_LOCAL_HEADER.size))
+    if header[0] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile(f"bad local header for {info.filename}")
+    zin.fp.seek(info.header_offset + ZIP_LOCAL_HEADER.size + header[-2] + header[-1])
+    
+    out = zipfile.ZipInfo(info.filename, info.date_time)
+    out.compress_type = info.compress_type
+    out.flag_bits = info.flag_bits & ~ZIP_DATA_DESCRIPTOR_FLAG
+    out.external_attr = info.external_attr
+    out.create_system = info.create_system
+    out.CRC, out.compress_size, out.file_size = info.CRC, info.compress_size, info.file_size
+    
+    def blocks():
+        remaining = info.compress_size
+        while remaining:
+            block = zin.fp.read(min(remaining, APPEND_CHUNK_SIZE))
+            if not block:
+                raise zipfile.BadZipFile(f"truncated member {info.filename}")
+            yield block
+            remaining -= len(block)
+    
+    write_raw_member(zout, out, blocks())
+
+
+def write_raw_member(zout, out, blocks):
+    """Write an entry from blocks of already-compressed bytes, its CRC and
+    sizes set on `out`, and register it the way ZipFile.writestr does."""
+    out.header_offset = zout.fp.tell()
+    zout.fp.write(out.FileHeader())
+    for block in blocks:
+        zout.fp.write(block)
+    zout.start_dir = zout.fp.tell()
+    zout.filelist.append(out)
+    zout.NameToInfo[out.filename] = out
+
+
+def serialise_sheet(ws) -> str:
+    """Write one worksheet's XML to a temporary file; returns its path."""
+    from openpyxl.drawing.spreadsheet_drawing import SpreadsheetDrawing
+    from openpyxl.worksheet._writer import WorksheetWriter
+    if ws._charts or ws._images or ws._pivots or ws.tables or ws.legacy_drawing is not None:
+        raise SurgicalSaveUnsupported(f"sheet '{ws.title}' has related parts")
+    ws._drawing = SpreadsheetDrawing()
+    writer = WorksheetWriter(ws)
+    writer.write()
+    if len(writer._rels) or ws._comments:
+        writer.cleanup()
+        raise SurgicalSaveUnsupported(f"sheet '{ws.title}' needs relationships")
+    return writer.out
+
+
+def drop_calc_chain(zin) -> tuple:
+    """({part: new bytes}, {parts to drop}) that remove calcChain.xml, if any."""
+    wb_path = workbook_part_path(zin)
+    rels_path = zip_part_path(wb_path, "_rels/" + wb_path.rsplit("/", 1)[-1] + ".rels")
+    calc = workbook_part_of_type(zin, REL_CALC_CHAIN)
+    if not calc:
+        return {}, set()
+
+    # Both parts use a default namespace, and registering one replaces the
+    # other, so serialise each before parsing the next.
+    rels = parse_part(zin.read(rels_path))
+    for rel in list(rels):
+        if rel.get("Type") == REL_CALC_CHAIN:
+            rels.remove(rel)
+    rels_xml = ET.tostring(rels, encoding="UTF-8", xml_declaration=True)
+    types = parse_part(zin.read("[Content_Types].xml"))
+    for override in list(types):
+        if override.get("PartName") == "/" + calc:
+            types.remove(override)
+    types_xml = ET.tostring(types, encoding="UTF-8", xml_declaration=True)
+    return {rels_path: rels_xml, "[Content_Types].xml": types_xml}, {calc}
+
+
+def surgical_save(wb, path: str) -> bool:
+    """Save by rewriting only changed parts of the original file; False if a full save is needed."""
+    state = getattr(wb, "saved_state", None)
+    if (not state or wb.write_only or state["path"] != os.path.abspath(path)
+            or not os.path.exists(path) or list(wb.sheetnames) != state["sheets"]
+            or any(a is not b for a, b in zip(wb._sheets, state["sheet_objects"]))):
+        return False
+    st = os.stat(path)
+    if (st.st_mtime_ns, st.st_size) != state["stat"]:
+        return False
+    
+    temp_files = []
+    tmp_path = f"{path}.tmp"
+    try:
+        with zipfile.ZipFile(path) as zin:
+            parts = {part["name"]: part["path"] for part in list_sheet_parts(zin)[0]}
+            names = set(zin.namelist())
+            replaced, dropped = {}, set()
+            for title in sorted(wb.touched_sheets):
+                part = parts.get(title)
+                if part is None or title not in wb.sheetnames or not hasattr(wb[title], "_cells"):
+                    return False
+                if zip_part_path(part, "_rels/" + part.rsplit("/", 1)[-1] + ".rels") in names:
+                    return False
+                temp_files.append(serialise_sheet(wb[title]))
+                replaced[part] = temp_files[-1]
+            
+            styles = None
+            if style_counts(wb) != state["styles"]:
+                from openpyxl.styles.stylesheet import write_stylesheet
+                from openpyxl.xml.functions import tostring
+                styles = (workbook_part_of_type(zin, REL_STYLES), tostring(write_stylesheet(wb)))
+                if styles[0] is None:
+                    return False
+            if not replaced and styles is None:
+                return True
+            patched, dropped = drop_calc_chain(zin) if replaced else ({}, set())
+            if styles:
+                patched[styles[0]] = styles[1]
+            
+            with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED, allowZip64=True) as zout:
+                for info in zin.infolist():
+                    name = info.filename
+                    if name in dropped:
+                        continue
+                    if name in replaced:
+                        zout.write(replaced[name], name)
+                    elif name in patched:
+                        zout.writestr(zipfile.ZipInfo(name, info.date_time), patched[name], zipfile.ZIP_DEFLATED)
+                    else:
+                        copy_zip_member_raw(zin, zout, info)
+    except (SurgicalSaveUnsupported, zipfile.BadZipFile, KeyError, ET.ParseError):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+    finally:
+        for temp in temp_files:
+            if os.path.exists(temp):
+                os.remove(temp)
+    os.replace(tmp_path, path)
+    return True
+
+
 # ============================================================================
 # Commands
 # ============================================================================
 
 def cmd_info(args):
-    """Get workbook information."""
-    require_openpyxl()
-    
+    """Get workbook information from its metadata, without loading cell data."""
     try:
-        wb = load_workbook(args.file, read_only=False, data_only=True)
-    except Exception as e:
+        if is_xls(args.file):
+            meta = read_xls_metadata(args.file)
+        else:
+            reject_encrypted(args.file)
+            meta = read_workbook_metadata(args.file, scan=args.scan)
+    except (OSError, zipfile.BadZipFile, KeyError, ET.ParseError, *XLS_ERRORS) as e:
         fail(f"Failed to open file: {e}")
     
-    sheets_info = []
-    for name in wb.sheetnames:
-        ws = wb[name]
-        sheets_info.append({
-            "name": name,
-            "dimensions": ws.dimensions or "A1",
-            "max_row": ws.max_row,
-            "max_column": ws.max_column,
-        })
-    
     ok({
         "file": args.file,
-        "sheets": sheets_info,
-        "sheet_count": len(wb.sheetnames),
-        "active_sheet": wb.active.title if wb.active else None,
+        "sheets": meta["sheets"],
+        "sheet_count": len(meta["sheets"]),
+        "active_sheet": meta["active_sheet"],
     })
-    wb.close()
 
 
 def cmd_read(args):
@@ -237,40 +1186,90 @@ def cmd_read(args):
     require_openpyxl()
     
     try:
-        wb = load_workbook(args.file, read_only=True, data_only=True)
+        wb = open_workbook(args.file, read_only=True, data_only=True)
     except Exception as e:
         fail(f"Failed to open file: {e}")
     
     ws = get_sheet(wb, args.sheet)
-    data = read_sheet_data(ws, args.range)
+    ranges = split_ranges(args.range)
+    check_page_args(args)
+    
+    if len(ranges) > 1:
+        if args.page:
+            fail("--page works with a single range")
+        read_multiple_ranges(ws, ranges, args.format, args.max_width)
+        wb.close()
+        return
+    
+    range_str = ranges[0] if ranges else None
+    rows = iter_sheet_rows(ws, range_str)
+    page = {}
+    if args.page:
+        page = {"page": args.page, "page_size": args.page_size, "more": False}
+        rows = page_rows(rows, args.page, args.page_size, page)
     
     if args.format == "csv":
-        import io
-        output = io.StringIO()
-        writer = csv.writer(output)
-        for row in data:
-            writer.writerow(row)
-        print(output.getvalue())
+        write_csv_stream(rows, sys.stdout, args.chunk_size)
+    elif args.format == "ndjson":
+        write_ndjson_stream(rows, sys.stdout, args.chunk_size)
     elif args.format == "markdown":
-        print(data_to_markdown(data))
+        write_markdown_stream(rows, sys.stdout, max_width=args.max_width, chunk_size=args.chunk_size)
+        if page:
+            print(markdown_page_footer(page))
+    else:  # json
+        stats = {"rows": 0, "columns": 0}
+        fields = {"sheet": ws.title, "range": range_str or sheet_dimensions(ws)}
+        if page:
+            fields.update(page=args.page, page_size=args.page_size)
+        write_ok_stream(
+            fields, "data", count_rows(rows, stats), sys.stdout,
+            trailer=lambda: {**stats, **({"more": page["more"]} if page else {})},
+            chunk_size=args.chunk_size,
+        )
+    
+    wb.close()
+
+
+def read_multiple_ranges(ws, ranges: list, fmt: str, max_width: Optional[int] = None):
+    """Output several ranges read in one pass."""
+    blocks = read_ranges(ws, ranges)
+    
+    if fmt == "csv":
+        for i, (range_str, data) in enumerate(zip(ranges, blocks)):
+            if i:
+                print()
+            write_csv_stream(data, sys.stdout)
+    elif fmt == "ndjson":
+        for range_str, data in zip(ranges, blocks):
+            write_ndjson_stream(({"range": range_str, "row": row} for row in data), sys.stdout)
+    elif fmt == "markdown":
+        for i, (range_str, data) in enumerate(zip(ranges, blocks)):
+            if i:
+                print()
+            print(f"**{range_str}**\n")
+            write_markdown_stream(data, sys.stdout, max_width=max_width)
     else:  # json
         ok({
             "sheet": ws.title,
-            "range": args.range or ws.dimensions,
-            "rows": len(data),
-            "columns": len(data[0]) if data else 0,
-            "data": data,
+            "ranges": [
+                {
+                    "range": range_str,
+                    "rows": len(data),
+                    "columns": len(data[0]) if data else 0,
+                    "data": data,
+                }
+                for range_str, data in zip(ranges, blocks)
+            ],
         })
-    
-    wb.close()
 
 
 def cmd_cell(args):
     """Read a specific cell."""
     require_openpyxl()
+    reject_xls(args.file, "cell")
     
     try:
-        wb = load_workbook(args.file, read_only=True, data_only=False)
+        wb = open_workbook(args.file, read_only=True, data_only=False)
     except Exception as e:
         fail(f"Failed to open file: {e}")
     
@@ -302,7 +1301,7 @@ def cmd_create(args):
             wb.create_sheet(title=name)
     
     try:
-        wb.save(args.file)
+        save_workbook(wb, args.file)
     except Exception as e:
         fail(f"Failed to save file: {e}")
     
@@ -313,16 +1312,8 @@ def cmd_create(args):
     })
 
 
-def cmd_write(args):
+def op_write(wb, args) -> dict:
     """Write data to cells."""
-    require_openpyxl()
-    
-    # Load or create workbook
-    if os.path.exists(args.file):
-        wb = load_workbook(args.file)
-    else:
-        wb = Workbook()
-    
     ws = get_sheet(wb, args.sheet)
     
     # Parse data
@@ -357,93 +1348,221 @@ def cmd_write(args):
     else:
         ws.cell(row=start_row, column=start_col, value=data)
     
-    wb.save(args.file)
-    ok({
+    return {
         "file": args.file,
         "sheet": ws.title,
         "start": args.start,
         "written": True,
-    })
+    }
+
+
+# Several CSVs become one sheet each. Worker processes parse (and coerce) the
+# files in parallel, pickling row chunks to spool files; the parent feeds the
+# spools to the write-only workbook in input order, starting on each file as
+# soon as its worker is done.
+
+CSV_SHEET_INVALID_RE = re.compile(r'[\\/*?:\[\]]+')
+
+
+def expand_csv_paths(specs: list) -> list:
+    """Expand glob patterns (in input order, each sorted), dropping duplicates."""
+    import glob
+    paths, seen = [], set()
+    for spec in specs:
+        if glob.has_magic(spec):
+            matches = sorted(glob.glob(spec))
+            if not matches:
+                fail(f"No files match: {spec}")
+        elif os.path.isfile(spec):
+            matches = [spec]
+        else:
+            fail(f"CSV file not found: {spec}")
+        for path in matches:
+            key = os.path.abspath(path)
+            if key not in seen:
+                seen.add(key)
+                paths.append(path)
+    return paths
+
+
+def csv_sheet_titles(paths: list) -> list:
+    """Unique sheet titles from the CSV file names."""
+    titles, seen = [], set()
+    for path in paths:
+        base = CSV_SHEET_INVALID_RE.sub("_", Path(path).stem).strip("'") or "Sheet"
+        title, n = base[:31], 2
+        while title.lower() in seen:
+            suffix = f"_{n}"
+            title = base[:31 - len(suffix)] + suffix
+            n += 1
+        seen.add(title.lower())
+        titles.append(title)
+    return titles
+
+
+def iter_csv_rows(f, coerce: bool):
+    rows = csv.reader(f)
+    if coerce:
+        rows = (coerce_csv_row(row) for row in rows)
+    return rows
+
+
+def spool_csv(path: str, coerce: bool, spool: str, chunk_size: int) -> dict:
+    """Parse a CSV into a spool file of pickled row chunks.
+
+    Runs inside pool workers, so it must not rely on state from the parent.
+    """
+    import pickle
+    started = time.perf_counter()
+    rows = 0
+    with open(path, 'r', newline='', encoding='utf-8-sig') as f, open(spool, 'wb') as out:
+        for chunk in chunked(iter_csv_rows(f, coerce), chunk_size):
+            pickle.dump(chunk, out, pickle.HIGHEST_PROTOCOL)
+            rows += len(chunk)
+    return {"spool": spool, "rows": rows, "parse_ms": round((time.perf_counter() - started) * 1000, 3)}
+
+
+def read_spool(spool: str):
+    """Yield the rows in a spool file written by spool_csv."""
+    import pickle
+    with open(spool, 'rb') as f:
+        while True:
+            try:
+                chunk = pickle.load(f)
+            except EOFError:
+                return
+            yield from chunk
+
+
+def csv_throughput(size: int, rows: int, started: float) -> dict:
+    seconds = max(time.perf_counter() - started, 1e-9)
+    return {
+        "bytes": size,
+        "ms": round(seconds * 1000, 3),
+        "rows_per_sec": round(rows / seconds),
+        "mb_per_sec": round(size / seconds / 1e6, 3),
+    }
 
 
 def cmd_from_csv(args):
-    """Create Excel from CSV."""
+    """Create Excel from CSV, streaming rows into a write-only workbook."""
     require_openpyxl()
     
-    wb = Workbook()
-    ws = wb.active
-    if args.sheet:
-        ws.title = args.sheet
+    started = time.perf_counter()
+    paths = expand_csv_paths(args.csv_files)
+    if len(paths) > 1:
+        from_csv_files(args, paths, started)
+        return
+    
+    wb = Workbook(write_only=True)
+    writer = StreamingSheetWriter(wb, args.sheet or "Sheet", args.max_rows, args.repeat_header)
     
     try:
-        with open(args.csv_file, 'r', newline='', encoding='utf-8-sig') as f:
-            reader = csv.reader(f)
-            for row in reader:
-                ws.append(row)
+        with open(paths[0], 'r', newline='', encoding='utf-8-sig') as f:
+            writer.extend(iter_csv_rows(f, args.coerce))
     except Exception as e:
         fail(f"Failed to read CSV: {e}")
     
-    wb.save(args.excel_file)
+    save_workbook(wb, args.excel_file)
+    summary = writer.summary()
     ok({
-        "source": args.csv_file,
+        "source": paths[0],
         "output": args.excel_file,
-        "sheet": ws.title,
-        "rows": ws.max_row,
+        **summary,
+        **csv_throughput(os.path.getsize(paths[0]), summary["rows"], started),
+    })
+
+
+def from_csv_files(args, paths: list, started: float):
+    """Write several CSVs into one workbook, one sheet (or rollover group) per file."""
+    import shutil
+    import tempfile
+    if args.sheet:
+        fail("--sheet applies to a single CSV; with several files sheets are named after them")
+    
+    titles = csv_sheet_titles(paths)
+    workers = max(1, min(args.workers or os.cpu_count() or 1, len(paths)))
+    wb = Workbook(write_only=True)
+    results = []
+    
+    def write_file(path, title, rows, info):
+        writer = StreamingSheetWriter(wb, title, args.max_rows, args.repeat_header)
+        writer.extend(rows)
+        summary = writer.summary()
+        entry = {"source": path, "sheet": summary["sheet"], "rows": summary["rows"],
+                 "bytes": os.path.getsize(path), **info}
+        if "sheets" in summary:
+            entry["sheets"] = summary["sheets"]
+        results.append(entry)
+    
+    if workers == 1:
+        for path, title in zip(paths, titles):
+            try:
+                with open(path, 'r', newline='', encoding='utf-8-sig') as f:
+                    write_file(path, title, iter_csv_rows(f, args.coerce), {})
+            except Exception as e:
+                fail(f"Failed to read CSV {path}: {e}")
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        spool_dir = tempfile.mkdtemp(prefix="excel-csv-")
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [
+                    pool.submit(spool_csv, path, args.coerce,
+                                os.path.join(spool_dir, f"{i}.pickle"), args.chunk_size)
+                    for i, path in enumerate(paths)
+                ]
+                for path, title, future in zip(paths, titles, futures):
+                    try:
+                        info = future.result()
+                    except Exception as e:
+                        for pending in futures:
+                            pending.cancel()
+                        fail(f"Failed to read CSV {path}: {e}")
+                    spool = info.pop("spool")
+                    write_file(path, title, read_spool(spool), info)
+                    os.remove(spool)
+        finally:
+            shutil.rmtree(spool_dir, ignore_errors=True)
+    
+    save_workbook(wb, args.excel_file)
+    ok({
+        "output": args.excel_file,
+        "workers": workers,
+        "files": results,
+        "rows": sum(r["rows"] for r in results),
+        **csv_throughput(sum(r["bytes"] for r in results), sum(r["rows"] for r in results), started),
     })
 
 
 def cmd_from_json(args):
-    """Create Excel from JSON."""
+    """Create Excel from JSON (or NDJSON, read line by line), streaming rows to disk."""
     require_openpyxl()
     
+    ndjson = args.ndjson or args.json_file.lower().endswith((".jsonl", ".ndjson"))
+    wb = Workbook(write_only=True)
+    writer = StreamingSheetWriter(wb, args.sheet or "Sheet", args.max_rows, args.repeat_header)
+    
     try:
-        with open(args.json_file, 'r') as f:
-            data = json.load(f)
+        with open(args.json_file, 'r', encoding='utf-8') as f:
+            if ndjson:
+                items = (json.loads(line) for line in f if line.strip())
+                writer.extend(iter_json_rows(items))
+            else:
+                writer.extend(iter_json_rows(json.load(f)))
     except Exception as e:
         fail(f"Failed to read JSON: {e}")
     
-    wb = Workbook()
-    ws = wb.active
-    if args.sheet:
-        ws.title = args.sheet
-    
-    if isinstance(data, list):
-        if data and isinstance(data[0], dict):
-            # List of dicts - use keys as headers
-            headers = list(data[0].keys())
-            ws.append(headers)
-            for item in data:
-                ws.append([item.get(h) for h in headers])
-        else:
-            # List of lists or values
-            for row in data:
-                if isinstance(row, list):
-                    ws.append(row)
-                else:
-                    ws.append([row])
-    elif isinstance(data, dict):
-        if "headers" in data and "rows" in data:
-            ws.append(data["headers"])
-            for row in data["rows"]:
-                ws.append(row)
-        else:
-            for key, val in data.items():
-                ws.append([key, val])
-    
-    wb.save(args.excel_file)
+    save_workbook(wb, args.excel_file)
     ok({
         "source": args.json_file,
         "output": args.excel_file,
-        "sheet": ws.title,
-        "rows": ws.max_row,
+        **writer.summary(),
     })
 
 
-def cmd_edit(args):
+def op_edit(wb, args) -> dict:
     """Edit a cell value or formula."""
-    require_openpyxl()
-    
-    wb = load_workbook(args.file)
     ws = get_sheet(wb, args.sheet)
     
     cell = ws[args.cell.upper()]
@@ -466,21 +1585,19 @@ def cmd_edit(args):
         except ValueError:
             cell.value = args.value
     
-    wb.save(args.file)
-    ok({
+    result = {
         "cell": args.cell.upper(),
         "old_value": old_value,
         "new_value": cell.value,
         "is_formula": args.formula,
-    })
+    }
+    if getattr(args, "recalc", False):
+        result["recalc"] = recalculate(wb, args.file, changed=[(ws.title, cell.row, cell.column)])
+    return result
 
 
-def cmd_add_sheet(args):
+def op_add_sheet(wb, args) -> dict:
     """Add a new sheet."""
-    require_openpyxl()
-    
-    wb = load_workbook(args.file)
-    
     if args.name in wb.sheetnames:
         fail(f"Sheet '{args.name}' already exists")
     
@@ -489,19 +1606,14 @@ def cmd_add_sheet(args):
     else:
         wb.create_sheet(title=args.name)
     
-    wb.save(args.file)
-    ok({
+    return {
         "added": args.name,
         "sheets": wb.sheetnames,
-    })
+    }
 
 
-def cmd_rename_sheet(args):
+def op_rename_sheet(wb, args) -> dict:
     """Rename a sheet."""
-    require_openpyxl()
-    
-    wb = load_workbook(args.file)
-    
     if args.old_name not in wb.sheetnames:
         fail(f"Sheet '{args.old_name}' not found")
     
@@ -509,21 +1621,15 @@ def cmd_rename_sheet(args):
         fail(f"Sheet '{args.new_name}' already exists")
     
     wb[args.old_name].title = args.new_name
-    wb.save(args.file)
-    
-    ok({
+    return {
         "old_name": args.old_name,
         "new_name": args.new_name,
         "sheets": wb.sheetnames,
-    })
+    }
 
 
-def cmd_delete_sheet(args):
+def op_delete_sheet(wb, args) -> dict:
     """Delete a sheet."""
-    require_openpyxl()
-    
-    wb = load_workbook(args.file)
-    
     if args.name not in wb.sheetnames:
         fail(f"Sheet '{args.name}' not found")
     
@@ -531,370 +1637,4918 @@ def cmd_delete_sheet(args):
         fail("Cannot delete the only sheet in workbook")
     
     del wb[args.name]
-    wb.save(args.file)
-    
-    ok({
+    return {
         "deleted": args.name,
         "sheets": wb.sheetnames,
+    }
+
+
+def op_copy_sheet(wb, args) -> dict:
+    """Copy a sheet."""
+    if args.source not in wb.sheetnames:
+        fail(f"Sheet '{args.source}' not found")
+    
+    if args.new_name in wb.sheetnames:
+        fail(f"Sheet '{args.new_name}' already exists")
+    
+    source_ws = wb[args.source]
+    new_ws = wb.copy_worksheet(source_ws)
+    new_ws.title = args.new_name
+    
+    return {
+        "source": args.source,
+        "copy": args.new_name,
+        "sheets": wb.sheetnames,
+    }
+
+
+def op_insert_rows(wb, args) -> dict:
+    """Insert rows."""
+    ws = get_sheet(wb, args.sheet)
+    
+    ws.insert_rows(args.row, args.count)
+    return {
+        "inserted": "rows",
+        "at": args.row,
+        "count": args.count,
+        "sheet": ws.title,
+    }
+
+
+def op_insert_cols(wb, args) -> dict:
+    """Insert columns."""
+    ws = get_sheet(wb, args.sheet)
+    
+    # Convert column letter to number if needed
+    col = args.col
+    if isinstance(col, str) and col.isalpha():
+        col = column_index_from_string(col.upper())
+    
+    ws.insert_cols(int(col), args.count)
+    return {
+        "inserted": "columns",
+        "at": args.col,
+        "count": args.count,
+        "sheet": ws.title,
+    }
+
+
+def op_delete_rows(wb, args) -> dict:
+    """Delete rows."""
+    ws = get_sheet(wb, args.sheet)
+    
+    ws.delete_rows(args.row, args.count)
+    return {
+        "deleted": "rows",
+        "at": args.row,
+        "count": args.count,
+        "sheet": ws.title,
+    }
+
+
+def op_delete_cols(wb, args) -> dict:
+    """Delete columns."""
+    ws = get_sheet(wb, args.sheet)
+    
+    col = args.col
+    if isinstance(col, str) and col.isalpha():
+        col = column_index_from_string(col.upper())
+    
+    ws.delete_cols(int(col), args.count)
+    return {
+        "deleted": "columns",
+        "at": args.col,
+        "count": args.count,
+        "sheet": ws.title,
+    }
+
+
+def op_merge(wb, args) -> dict:
+    """Merge cells."""
+    ws = get_sheet(wb, args.sheet)
+    
+    ws.merge_cells(args.range)
+    return {
+        "merged": args.range,
+        "sheet": ws.title,
+    }
+
+
+def op_unmerge(wb, args) -> dict:
+    """Unmerge cells."""
+    ws = get_sheet(wb, args.sheet)
+    
+    ws.unmerge_cells(args.range)
+    return {
+        "unmerged": args.range,
+        "sheet": ws.title,
+    }
+
+
+class CellFormatter:
+    """Applies one format request, computing each distinct resulting style once.
+
+    Cells that start with the same style end with the same style, so the first
+    cell with a given style goes through the Font/Fill/... setters and every
+    later one just copies the resulting style array.
+    """
+    
+    def __init__(self, args):
+        self.args = args
+        self.font = (args.bold is not None or args.italic is not None or args.font_size
+                     or args.font_color or args.font_name)
+        self.alignment = args.align or args.valign or args.wrap is not None
+        self.fill = None
+        if args.bg_color:
+            color = parse_color(args.bg_color)
+            self.fill = PatternFill(start_color=color, end_color=color, fill_type="solid")
+        self.border = None
+        if args.border:
+            side = Side(style=args.border, color="FF000000")
+            self.border = Border(left=side, right=side, top=side, bottom=side)
+        self.styles = {}
+        self.cells = 0
+    
+    def applied(self) -> list:
+        flags = [("font", self.font), ("background", self.fill), ("alignment", self.alignment),
+                 ("border", self.border)]
+        return [name for name, active in flags if active]
+    
+    def apply(self, target):
+        """Apply the formatting to a cell or row/column dimension through its setters."""
+        args = self.args
+        if self.font:
+            current_font = target.font
+            target.font = Font(
+                name=args.font_name or current_font.name,
+                size=args.font_size or current_font.size,
+                bold=args.bold if args.bold is not None else current_font.bold,
+                italic=args.italic if args.italic is not None else current_font.italic,
+                color=parse_color(args.font_color) if args.font_color else current_font.color,
+            )
+        if self.fill:
+            target.fill = self.fill
+        if self.alignment:
+            current_align = target.alignment
+            target.alignment = Alignment(
+                horizontal=args.align or current_align.horizontal,
+                vertical=args.valign or current_align.vertical,
+                wrap_text=args.wrap if args.wrap is not None else current_align.wrap_text,
+            )
+        if self.border:
+            target.border = self.border
+    
+    def apply_cell(self, cell):
+        key = tuple(cell._style) if cell._style is not None else None
+        style = self.styles.get(key)
+        if style is None:
+            self.apply(cell)
+            self.styles[key] = StyleArray(cell._style)
+        else:
+            cell._style = StyleArray(style)
+        self.cells += 1
+
+
+def parse_format_range(range_str: str) -> tuple:
+    """Classify a range as ("cells", ((r1, c1), (r2, c2))), ("columns", (c1, c2)) or ("rows", (r1, r2))."""
+    text = range_str.upper().replace("$", "")
+    start, _, end = text.partition(":")
+    end = end or start
+    if start.isalpha() and end.isalpha():
+        return "columns", tuple(sorted((column_index_from_string(start), column_index_from_string(end))))
+    if start.isdigit() and end.isdigit():
+        return "rows", tuple(sorted((int(start), int(end))))
+    return "cells", parse_range(text)
+
+
+def op_format(wb, args) -> dict:
+    """Format cells, or whole rows/columns (e.g. A:C or 1:1)."""
+    ws = get_sheet(wb, args.sheet)
+    formatter = CellFormatter(args)
+    kind, bounds = parse_format_range(args.range)
+    styled_lines = 0
+    
+    if kind == "cells":
+        (start_row, start_col), (end_row, end_col) = bounds
+        for row in range(start_row, end_row + 1):
+            for col in range(start_col, end_col + 1):
+                formatter.apply_cell(ws.cell(row=row, column=col))
+    else:
+        # Style the row/column itself (which covers its empty cells) and
+        # restyle only the cells that already exist in it.
+        start, end = bounds
+        for index in range(start, end + 1):
+            if kind == "columns":
+                letter = get_column_letter(index)
+                is_new = letter not in ws.column_dimensions
+                dim = ws.column_dimensions[letter]
+                if is_new:
+                    dim.width = 0  # keep Excel's default width rather than openpyxl's 13
+            else:
+                dim = ws.row_dimensions[index]
+            formatter.apply(dim)
+            styled_lines += 1
+        
+        attr = "column" if kind == "columns" else "row"
+        for cell in list(ws._cells.values()):
+            if start <= getattr(cell, attr) <= end:
+                formatter.apply_cell(cell)
+    
+    result = {
+        "range": args.range,
+        "sheet": ws.title,
+        "applied": formatter.applied(),
+        "cells": formatter.cells,
+        "distinct_styles": len(formatter.styles),
+    }
+    if kind != "cells":
+        result[kind] = styled_lines
+    return result
+
+
+def op_resize(wb, args) -> dict:
+    """Resize rows/columns."""
+    ws = get_sheet(wb, args.sheet)
+    
+    resized = []
+    
+    if args.row:
+        for spec in args.row:
+            row_num, height = spec.split(':')
+            ws.row_dimensions[int(row_num)].height = float(height)
+            resized.append(f"row {row_num} = {height}")
+    
+    if args.col:
+        for spec in args.col:
+            col_letter, width = spec.split(':')
+            ws.column_dimensions[col_letter.upper()].width = float(width)
+            resized.append(f"col {col_letter} = {width}")
+    
+    return {
+        "sheet": ws.title,
+        "resized": resized,
+    }
+
+
+def op_freeze(wb, args) -> dict:
+    """Freeze panes at cell."""
+    ws = get_sheet(wb, args.sheet)
+    
+    ws.freeze_panes = args.cell.upper()
+    return {
+        "sheet": ws.title,
+        "frozen_at": args.cell.upper(),
+    }
+
+
+def cmd_find(args):
+    """Find text in sheet."""
+    require_openpyxl()
+    
+    try:
+        matcher = build_matcher(args.text, args.regex, args.whole_cell, args.case_sensitive)
+    except re.error as e:
+        fail(f"Invalid regex: {e}")
+    columns = parse_columns(args.columns)
+    
+    if args.index:
+        index, index_status = load_find_index(args.file)
+        sheet = args.sheet or index["active_sheet"]
+        if sheet not in index["sheets"]:
+            fail(f"Sheet '{sheet}' not found", {"available": list(index["sheets"])})
+        matches = search_find_index(index["sheets"][sheet], matcher, columns)
+    else:
+        index_status = None
+        wb = open_workbook(args.file, read_only=True, data_only=True)
+        ws = get_sheet(wb, args.sheet)
+        sheet = ws.title
+        min_col = min(columns) if columns else 1
+        max_col = max(columns) if columns else None
+        rows = ws.iter_rows(min_row=1, min_col=min_col, max_col=max_col, values_only=True)
+        matches = search_rows(rows, matcher, columns, min_col)
+    
+    limit = args.max_results
+    results = [
+        {"cell": coords_to_cell(row, col), "value": value}
+        for row, col, value in islice(matches, limit + 1 if limit else None)
+    ]
+    truncated = bool(limit) and len(results) > limit
+    if truncated:
+        results = results[:limit]
+    if not args.index:
+        wb.close()
+    
+    output = {
+        "search": args.text,
+        "sheet": sheet,
+        "found": len(results),
+        "truncated": truncated,
+        "results": results,
+    }
+    if index_status:
+        output["index"] = index_status
+    ok(output)
+
+
+def op_replace(wb, args) -> dict:
+    """Find and replace text."""
+    replacer = replacer_from_args(args)
+    ranges = [parse_range(r) for r in split_ranges(args.range)]
+    sheets = wb.worksheets if args.all_sheets else [get_sheet(wb, args.sheet)]
+    
+    stats = {}
+    for ws in sheets:
+        changed = replacements = 0
+        for cell in list(ws._cells.values()):
+            value = cell.value
+            if not isinstance(value, str) or not value:
+                continue
+            if ranges and not any(s_row <= cell.row <= e_row and s_col <= cell.column <= e_col
+                                  for (s_row, s_col), (e_row, e_col) in ranges):
+                continue
+            new_value, n = replacer(value)
+            if n:
+                changed += 1
+                replacements += n
+                if not args.dry_run:
+                    cell.value = new_value
+        if changed and not args.dry_run:
+            touch_sheet(wb, ws)
+        stats[ws.title] = {"cells": changed, "replacements": replacements}
+    
+    return replace_result(args, stats)
+
+
+def cmd_replace(args):
+    """Find and replace text; --dry-run only counts, streaming the workbook read-only."""
+    if not args.dry_run:
+        mutation(op_replace)(args)
+        return
+    
+    require_openpyxl()
+    replacer = replacer_from_args(args)
+    ranges = split_ranges(args.range) or [None]
+    wb = open_workbook(args.file, read_only=True, data_only=False)
+    sheets = wb.worksheets if args.all_sheets else [get_sheet(wb, args.sheet)]
+    
+    stats = {}
+    for ws in sheets:
+        changed = replacements = 0
+        done = []   # ranges already counted; a cell in several counts once
+        for range_str in ranges:
+            first_row, first_col = parse_range(range_str)[0] if range_str else (1, 1)
+            for row_no, row in enumerate(iter_sheet_rows(ws, range_str), start=first_row):
+                for col_no, value in enumerate(row, start=first_col):
+                    if not isinstance(value, str) or not value:
+                        continue
+                    if any(s_row <= row_no <= e_row and s_col <= col_no <= e_col
+                           for (s_row, s_col), (e_row, e_col) in done):
+                        continue
+                    n = replacer(value)[1]
+                    if n:
+                        changed += 1
+                        replacements += n
+            if range_str:
+                done.append(parse_range(range_str))
+        stats[ws.title] = {"cells": changed, "replacements": replacements}
+    wb.close()
+    
+    ok(replace_result(args, stats))
+
+
+def cmd_to_csv(args):
+    """Export sheet to CSV."""
+    require_openpyxl()
+    
+    if args.all_sheets:
+        export_all_sheets(args, "csv", args.output)
+        return
+    
+    wb = open_workbook(args.file, read_only=True, data_only=True)
+    ws = get_sheet(wb, args.sheet)
+    
+    with open(args.output, 'w', newline='', encoding='utf-8') as f:
+        count = export_rows(ws.iter_rows(values_only=True), "csv", f, args.chunk_size)
+    
+    ok({
+        "source": args.file,
+        "sheet": ws.title,
+        "output": args.output,
+        "rows": count,
+    })
+    wb.close()
+
+
+def cmd_to_json(args):
+    """Export sheet to JSON (array of objects, or one object per line with --ndjson)."""
+    require_openpyxl()
+    
+    fmt = "ndjson" if args.ndjson else "json"
+    if args.all_sheets:
+        export_all_sheets(args, fmt, args.output)
+        return
+    
+    wb = open_workbook(args.file, read_only=True, data_only=True)
+    ws = get_sheet(wb, args.sheet)
+    
+    with open(args.output, 'w', encoding='utf-8') as f:
+        count = export_rows(ws.iter_rows(values_only=True), fmt, f, args.chunk_size)
+    
+    ok({
+        "source": args.file,
+        "sheet": ws.title,
+        "output": args.output,
+        "rows": count,
     })
+    wb.close()
+
+
+def check_page_args(args):
+    """Reject page options that cannot select any rows."""
+    if args.page is not None and args.page < 1:
+        fail("--page must be 1 or more")
+    if args.page_size < 1:
+        fail("--page-size must be 1 or more")
+
+
+def markdown_page_footer(page: dict) -> str:
+    """Note under a paged table saying where the page sits."""
+    note = f"Page {page['page']} ({page['page_size']} rows per page)"
+    if page["more"]:
+        note += f"; more rows follow (--page {page['page'] + 1})"
+    return f"\n*{note}*"
+
+
+def cmd_to_markdown(args):
+    """Export sheet to markdown table."""
+    require_openpyxl()
+    
+    check_page_args(args)
+    if args.all_sheets:
+        if not args.output_dir:
+            fail("--all-sheets requires --output-dir for to-markdown")
+        if args.page or args.max_width:
+            fail("--page and --max-width apply to single-sheet output")
+        export_all_sheets(args, "markdown", args.output_dir)
+        return
+    
+    wb = open_workbook(args.file, read_only=True, data_only=True)
+    ws = get_sheet(wb, args.sheet)
+    
+    rows = ws.iter_rows(values_only=True)
+    page = {}
+    if args.page:
+        page = {"page": args.page, "page_size": args.page_size, "more": False}
+        rows = page_rows(rows, args.page, args.page_size, page)
+    write_markdown_stream(rows, sys.stdout, max_width=args.max_width)
+    if page:
+        print(markdown_page_footer(page))
+    wb.close()
+
+
+# ============================================================================
+# Streaming workbook output
+# ============================================================================
+
+EXCEL_MAX_ROWS = 1048576
+
+INT_RE = re.compile(r"^[+-]?(0|[1-9]\d{0,14})$")
+FLOAT_RE = re.compile(r"^[+-]?(\d+\.\d*|\.\d+|\d+)([eE][+-]?\d+)?$")
+LEADING_ZERO_RE = re.compile(r"^[+-]?0\d")
+DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+DATETIME_RE = re.compile(r"^\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?$")
+
+
+class StreamingSheetWriter:
+    """Append rows to a write-only workbook, rolling over to a new sheet at max_rows.
+
+    Continuation sheets are named "<title> (2)", "<title> (3)", ..., skipping
+    names the workbook already has, and can repeat the first row as a header.
+    """
+    
+    def __init__(self, wb, title: str, max_rows: int = EXCEL_MAX_ROWS,
+                 repeat_header: bool = False):
+        self.wb = wb
+        self.title = title
+        self.max_rows = max(max_rows, 2 if repeat_header else 1)
+        self.repeat_header = repeat_header
+        self.header = None
+        self.sheets = []
+        self.total = 0
+        self._new_sheet()
+    
+    def _new_sheet(self):
+        taken = {name.lower() for name in self.wb.sheetnames}
+        n = len(self.sheets) + 1
+        while True:
+            suffix = f" ({n})" if n > 1 else ""
+            title = self.title[:31 - len(suffix)] + suffix
+            if title.lower() not in taken:
+                break
+            n += 1
+        continuing = bool(self.sheets)
+        self.ws = self.wb.create_sheet(title=title)
+        self.sheets.append({"name": self.ws.title, "rows": 0})
+        if continuing and self.repeat_header and self.header is not None:
+            self.ws.append(self.header)
+            self.sheets[-1]["rows"] = 1
+    
+    def append(self, row):
+        if self.header is None:
+            self.header = list(row)
+        if self.sheets[-1]["rows"] >= self.max_rows:
+            self._new_sheet()
+        self.ws.append(row)
+        self.sheets[-1]["rows"] += 1
+        self.total += 1
+    
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+    
+    def summary(self) -> dict:
+        result = {"sheet": self.sheets[0]["name"], "rows": self.total}
+        if len(self.sheets) > 1:
+            result["sheets"] = self.sheets
+        return result
+
+
+def coerce_csv_value(value: str):
+    """Convert CSV text to int/float/date where it is unambiguous.
+
+    Numbers with leading zeros or more than 15 significant digits (IDs, zip
+    codes, card numbers) stay text, since Excel would drop the zeros or the
+    precision; so do numbers too large for a double.
+    """
+    text = value.strip()
+    if not text or not (text[0].isdigit() or text[0] in "+-."):
+        return value
+    if INT_RE.match(text):
+        return int(text)
+    number = FLOAT_RE.match(text)
+    if number and not LEADING_ZERO_RE.match(text) and len(number.group(1).replace(".", "").lstrip("0")) <= 15:
+        result = float(text)
+        return result if math.isfinite(result) else value
+    if DATE_RE.match(text) or DATETIME_RE.match(text):
+        try:
+            return datetime.fromisoformat(text)
+        except ValueError:
+            return value
+    return value
+
+
+def coerce_csv_row(row: list) -> list:
+    return [coerce_csv_value(value) for value in row]
+
+
+def iter_json_rows(data):
+    """Yield sheet rows from the JSON shapes from-json accepts.
+
+    A list (or NDJSON stream) of objects uses the first object's keys as the
+    header; {"headers": [...], "rows": [...]} and plain objects (key/value
+    pairs) are also accepted.
+    """
+    if isinstance(data, dict):
+        if "headers" in data and "rows" in data:
+            yield data["headers"]
+            yield from data["rows"]
+        else:
+            for key, val in data.items():
+                yield [key, val]
+        return
+    
+    headers = None
+    for item in data:
+        if isinstance(item, dict):
+            if headers is None:
+                headers = list(item.keys())
+                yield headers
+            yield [item.get(h) for h in headers]
+        elif isinstance(item, list):
+            yield item
+        else:
+            yield [item]
+
+
+# ============================================================================
+# Search
+# ============================================================================
+
+def build_matcher(text: str, regex: bool = False, whole_cell: bool = False,
+                  case_sensitive: bool = False):
+    """Compile a search into a predicate over cell strings."""
+    if regex:
+        compiled = re.compile(text, 0 if case_sensitive else re.IGNORECASE)
+        return (lambda s: compiled.fullmatch(s) is not None) if whole_cell else compiled.search
+    if case_sensitive:
+        return (lambda s: s == text) if whole_cell else (lambda s: text in s)
+    needle = text.lower()
+    return (lambda s: s.lower() == needle) if whole_cell else (lambda s: needle in s.lower())
+
+
+def parse_columns(spec: Optional[str]) -> Optional[set]:
+    """Parse "A,C:E,7" into a set of 1-based column indexes."""
+    if not spec:
+        return None
+    
+    def index(token: str) -> int:
+        token = token.strip().upper()
+        return int(token) if token.isdigit() else column_index_from_string(token)
+    
+    columns = set()
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        start, _, end = item.partition(":")
+        columns.update(range(index(start), index(end or start) + 1))
+    return columns
+
+
+def search_rows(rows, matcher, columns: Optional[set] = None, min_col: int = 1):
+    """Yield (row, col, value) for matching cells, in sheet order."""
+    for row_idx, row in enumerate(rows, start=1):
+        for col_idx, value in enumerate(row, start=min_col):
+            if value is None or value == "":
+                continue
+            if columns and col_idx not in columns:
+                continue
+            if matcher(value if isinstance(value, str) else str(value)):
+                yield row_idx, col_idx, value
+
+
+# On-disk find index: one JSON file per workbook content hash in the cache
+# directory, holding each sheet's distinct cell values and where they occur.
+# A search then tests each distinct value once instead of every cell.
+FIND_INDEX_VERSION = 1
+
+
+def file_digest(path: str) -> str:
+    """Content hash of a file, read in 1 MB blocks."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def build_find_index(path: str, digest: str) -> dict:
+    """Collect every sheet's distinct values and their cells in one read-only pass."""
+    wb = open_read_only(path)
+    sheets = {}
+    try:
+        for ws in wb.worksheets:
+            values = {}
+            for row_idx, row in enumerate(ws.iter_rows(min_row=1, values_only=True), start=1):
+                for col_idx, value in enumerate(row, start=1):
+                    if value is None or value == "":
+                        continue
+                    key = value if isinstance(value, str) else str(value)
+                    entry = values.get(key)
+                    if entry is None:
+                        entry = values[key] = [key, value, []]
+                    entry[2].append([row_idx, col_idx])
+            sheets[ws.title] = list(values.values())
+        active = wb.active.title if wb.active else None
+    finally:
+        wb.close()
+    return {"version": FIND_INDEX_VERSION, "hash": digest, "active_sheet": active, "sheets": sheets}
+
+
+def load_find_index(path: str) -> tuple:
+    """Load the index for the file's current contents, building it if needed."""
+    digest = file_digest(path)
+    index_path = cache_dir() / "find-index" / f"{digest}.json"
+    
+    if index_path.exists():
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get("version") == FIND_INDEX_VERSION and index.get("hash") == digest:
+                return index, "hit"
+        except (OSError, json.JSONDecodeError):
+            pass
+    
+    index = build_find_index(path, digest)
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = index_path.with_suffix(".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, default=str)
+    os.replace(tmp_path, index_path)
+    return index, "built"
+
+
+def search_find_index(entries: list, matcher, columns: Optional[set] = None):
+    """Yield (row, col, value) matches from a sheet's index, in sheet order."""
+    hits = []
+    for key, value, cells in entries:
+        if matcher(key):
+            hits.extend((row, col, value) for row, col in cells if not columns or col in columns)
+    hits.sort(key=lambda hit: (hit[0], hit[1]))
+    return iter(hits)
+
+
+# ============================================================================
+# Replace
+# ============================================================================
+
+def load_replace_map(path: str) -> list:
+    """Read old->new pairs from a JSON object/array or a two-column CSV."""
+    try:
+        with open(path, 'r', newline='', encoding='utf-8-sig') as f:
+            if path.lower().endswith(".csv"):
+                rows = [row for row in csv.reader(f) if row]
+                if rows and [c.strip().lower() for c in rows[0][:2]] == ["old", "new"]:
+                    rows = rows[1:]
+                return [(row[0], row[1] if len(row) > 1 else "") for row in rows]
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError, csv.Error) as e:
+        fail(f"Failed to read replacement map: {e}")
+    
+    if isinstance(data, dict):
+        return [(str(k), str(v)) for k, v in data.items()]
+    if isinstance(data, list) and all(isinstance(p, list) and len(p) == 2 for p in data):
+        return [(str(k), str(v)) for k, v in data]
+    fail("Replacement map must be a JSON object, a list of [old, new] pairs, or a CSV")
+
+
+def build_replacer(pairs: list, regex: bool = False):
+    """Compile old->new pairs into one substitution returning (text, count).
+
+    All pairs are combined into a single alternation so each cell is scanned
+    once however many pairs there are. Literal pairs prefer the longest match.
+    """
+    pairs = [(old, new) for old, new in pairs if old]
+    if not pairs:
+        return lambda s: (s, 0)
+    
+    if not regex:
+        lookup = dict(pairs)
+        pattern = re.compile("|".join(re.escape(old) for old in sorted(lookup, key=len, reverse=True)))
+        return lambda s: pattern.subn(lambda m: lookup[m.group(0)], s)
+    
+    if len(pairs) == 1:
+        compiled = re.compile(pairs[0][0])
+        return lambda s: compiled.subn(pairs[0][1], s)
+    
+    # Patterns are searched one by one rather than joined into an alternation,
+    # so each keeps its own group numbers and inline flags, and replacements
+    # expand from the original match (lookarounds and anchors see the whole
+    # cell). Still one left-to-right scan: the earliest match wins, the first
+    # pair on ties, and each pattern's next match is reused until passed.
+    patterns = [(re.compile(old), new) for old, new in pairs]
+    
+    def replace(s: str) -> tuple:
+        parts, pos, count = [], 0, 0
+        upcoming = [pattern.search(s) for pattern, _ in patterns]
+        while True:
+            best = None
+            for i, m in enumerate(upcoming):
+                if m is not None and m.start() < pos:
+                    m = upcoming[i] = patterns[i][0].search(s, pos)
+                if m is not None and (best is None or m.start() < best.start()):
+                    best, new = m, patterns[i][1]
+            if best is None:
+                break
+            parts.append(s[pos:best.start()])
+            parts.append(best.expand(new))
+            count += 1
+            pos = best.end()
+            if best.start() == pos:
+                # Step past an empty match, as re.sub does
+                if pos == len(s):
+                    break
+                parts.append(s[pos])
+                pos += 1
+        parts.append(s[pos:])
+        return "".join(parts), count
+    
+    return replace
+
+
+def replacer_from_args(args):
+    """Build the replacer for replace's positional pair and/or --map file."""
+    pairs = []
+    if args.old is not None:
+        if args.new is None:
+            fail("Replacement text required (or use --map)")
+        pairs.append((args.old, args.new))
+    if args.map:
+        pairs.extend(load_replace_map(args.map))
+    if not pairs:
+        fail("Nothing to replace: give <old> <new> or --map FILE")
+    try:
+        return build_replacer(pairs, args.regex)
+    except re.error as e:
+        fail(f"Invalid regex: {e}")
+
+
+def replace_result(args, stats: dict) -> dict:
+    """Summarize replace counts per sheet."""
+    result = {}
+    if args.old is not None:
+        result.update({"old": args.old, "new": args.new})
+    if args.map:
+        result["map"] = args.map
+    if len(stats) == 1:
+        result["sheet"] = next(iter(stats))
+    else:
+        result["sheets"] = stats
+    result.update({
+        "replaced": sum(s["cells"] for s in stats.values()),
+        "replacements": sum(s["replacements"] for s in stats.values()),
+        "dry_run": bool(args.dry_run),
+    })
+    return result
+
+
+# ============================================================================
+# Columnar export
+# ============================================================================
+#
+# Rows stream from iter_rows into per-column buffers that are flushed as one
+# Parquet row group / Arrow record batch every --batch-size rows. Column types
+# are inferred from the first --sample-rows rows. Later values are converted
+# to their column's type (int -> float, anything -> string); a value that
+# can't be, or one in a column the sample never reached, starts the export
+# over with types inferred from a full pass over the sheet. A value that
+# doesn't fit a type pinned with --types is an error.
+
+COLUMN_TYPES = ("bool", "int", "float", "timestamp", "string")
+DEFAULT_BATCH_SIZE = 65536
+DEFAULT_SAMPLE_ROWS = 1000
+INT64_MIN, INT64_MAX = -1 << 63, (1 << 63) - 1
+
+
+class ColumnTypeMismatch(Exception):
+    """A value doesn't fit the column types inferred from the sample."""
+
+
+def value_kind(value) -> Optional[str]:
+    """Classify a cell value for type inference."""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        # Past int64, a number only fits a float column
+        return "int" if INT64_MIN <= value <= INT64_MAX else "float"
+    if isinstance(value, float):
+        return "float"
+    if isinstance(value, (datetime, date)):
+        return "timestamp"
+    return "string"
+
+
+def column_kinds(rows) -> list:
+    """The value kinds seen in each column of rows, as a list of sets."""
+    kinds = []
+    for row in rows:
+        if len(row) > len(kinds):
+            kinds.extend(set() for _ in range(len(row) - len(kinds)))
+        for i, value in enumerate(row):
+            if value is not None:
+                kinds[i].add(value_kind(value))
+    return kinds
+
+
+def infer_column_type(kinds: set) -> str:
+    """Narrowest column type that holds every kind seen in the sample."""
+    if not kinds:
+        return "string"
+    if len(kinds) == 1:
+        return next(iter(kinds))
+    if kinds <= {"int", "float"}:
+        return "float"
+    return "string"
+
+
+def coerce_value(value, column_type: str):
+    """Convert value to column_type; returns (value, ok)."""
+    if value is None:
+        return None, True
+    kind = value_kind(value)
+    if column_type == "string":
+        if isinstance(value, str):
+            return value, True
+        return (value.isoformat() if isinstance(value, (datetime, date, dt_time)) else str(value)), True
+    if column_type == "float" and kind in ("int", "float"):
+        return float(value), True
+    if kind == column_type:
+        return value, True
+    if column_type == "int" and isinstance(value, float) and value.is_integer() and INT64_MIN <= value <= INT64_MAX:
+        return int(value), True
+    return None, False
+
+
+def column_names(header: Optional[list], width: int) -> list:
+    """Unique column names from a header row, falling back to column letters."""
+    names, seen = [], set()
+    for i in range(width):
+        value = header[i] if header and i < len(header) else None
+        base = str(value) if value is not None and str(value).strip() else get_column_letter(i + 1)
+        name, n = base, 2
+        while name in seen:
+            name = f"{base}_{n}"
+            n += 1
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+def resolve_column(spec: str, names: list) -> Optional[int]:
+    """0-based index of a column given by header name or letter; None if absent."""
+    spec = spec.strip()
+    if spec in names:
+        return names.index(spec)
+    if re.match(r"^[A-Za-z]{1,3}$", spec):
+        index = column_index_from_string(spec.upper()) - 1
+        return index if index < len(names) else None
+    return None
+
+
+def parse_type_overrides(spec: Optional[str]) -> dict:
+    """Parse "Amount=float,Code=string" into a name -> type mapping."""
+    overrides = {}
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        name, _, column_type = item.partition("=")
+        if column_type.strip() not in COLUMN_TYPES:
+            fail(f"Invalid type override '{item}'", {"types": list(COLUMN_TYPES)})
+        overrides[name.strip()] = column_type.strip()
+    return overrides
+
+
+def export_columnar(args, fmt: str):
+    """Stream a sheet into a Parquet or Arrow IPC file."""
+    require_openpyxl()
+    pa = require_pyarrow()
+    overrides = parse_type_overrides(args.types)
+    
+    wb = open_workbook(args.file, read_only=True, data_only=True)
+    ws = get_sheet(wb, args.sheet)
+    try:
+        try:
+            result = write_columnar(pa, ws, args, fmt, overrides, max(args.sample_rows, 1))
+            result["types_from"] = "sample"
+        except ColumnTypeMismatch:
+            result = write_columnar(pa, ws, args, fmt, overrides, None)
+            result["types_from"] = "all rows"
+    finally:
+        wb.close()
+    ok(result)
+
+
+def write_columnar(pa, ws, args, fmt: str, overrides: dict, sample_rows: Optional[int]) -> dict:
+    """Write the export with types inferred from the first `sample_rows` rows,
+    or all of them for None; ColumnTypeMismatch if the sample misled."""
+    rows = ws.iter_rows(values_only=True)
+    header = None if args.no_header else list(next(rows, None) or [])
+    if sample_rows is not None:
+        sample = list(islice(rows, sample_rows))
+        kinds = column_kinds(sample)
+    else:
+        sample = []
+        scan = ws.iter_rows(min_row=1 if header is None else 2, values_only=True)
+        kinds = column_kinds(scan)
+    width = max(len(header or []), len(kinds))
+    kinds.extend(set() for _ in range(width - len(kinds)))
+    names = column_names(header, width)
+    
+    unknown = sorted(set(overrides) - set(names))
+    if unknown:
+        fail(f"Unknown columns in --types: {', '.join(unknown)}", {"columns": names})
+    types = [overrides.get(name) or infer_column_type(kinds[i]) for i, name in enumerate(names)]
+    
+    arrow_types = {
+        "bool": pa.bool_(),
+        "int": pa.int64(),
+        "float": pa.float64(),
+        "timestamp": pa.timestamp("us"),
+        "string": pa.string(),
+    }
+    schema = pa.schema([(name, arrow_types[t]) for name, t in zip(names, types)])
+    
+    if fmt == "parquet":
+        compression = None if args.compression == "none" else args.compression
+        writer = pa.parquet.ParquetWriter(args.output, schema, compression=compression)
+    else:
+        writer = pa.ipc.new_file(args.output, schema)
+    
+    total = batches = 0
+    first_row = 1 if header is None else 2
+    
+    def flush(batch_rows):
+        for row in batch_rows:
+            if len(row) > width and any(value is not None for value in row[width:]):
+                raise ColumnTypeMismatch()
+        columns = []
+        for i, column_type in enumerate(types):
+            values = []
+            for n, row in enumerate(batch_rows):
+                value, fits = coerce_value(row[i] if i < len(row) else None, column_type)
+                if not fits:
+                    if names[i] not in overrides:
+                        raise ColumnTypeMismatch()
+                    fail(f"Column '{names[i]}' is {column_type} by --types, but row "
+                         f"{first_row + total + n} holds {row[i]!r}")
+                if column_type == "timestamp" and value is not None and not isinstance(value, datetime):
+                    value = datetime.combine(value, dt_time())
+                values.append(value)
+            columns.append(pa.array(values, type=arrow_types[column_type]))
+        batch = pa.RecordBatch.from_arrays(columns, schema=schema)
+        if fmt == "parquet":
+            writer.write_table(pa.Table.from_batches([batch]), row_group_size=len(batch_rows))
+        else:
+            writer.write_batch(batch)
+    
+    try:
+        for batch_rows in chunked(iter_chain(sample, rows), args.batch_size):
+            flush(batch_rows)
+            total += len(batch_rows)
+            batches += 1
+    finally:
+        writer.close()
+    
+    return {
+        "source": args.file,
+        "sheet": ws.title,
+        "output": args.output,
+        "format": fmt,
+        "rows": total,
+        "batches": batches,
+        "columns": [{"name": name, "type": t} for name, t in zip(names, types)],
+    }
+
+
+def cmd_to_parquet(args):
+    """Export sheet to Parquet."""
+    export_columnar(args, "parquet")
+
+
+def cmd_to_arrow(args):
+    """Export sheet to an Arrow IPC file."""
+    export_columnar(args, "arrow")
+
+
+# ============================================================================
+# Multi-sheet export
+# ============================================================================
+
+EXPORT_EXTENSIONS = {"csv": ".csv", "json": ".json", "ndjson": ".ndjson", "markdown": ".md"}
+
+
+def export_rows(rows, fmt: str, stream, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """Write sheet rows to stream in an export format; returns rows/records written."""
+    if fmt == "csv":
+        return write_csv_stream(rows, stream, chunk_size)
+    if fmt == "json":
+        return write_json_array_stream(iter_records(rows), stream, chunk_size)
+    if fmt == "ndjson":
+        return write_ndjson_stream(iter_records(rows), stream, chunk_size)
+    if fmt == "markdown":
+        return write_markdown_stream(rows, stream, chunk_size=chunk_size)
+    raise ValueError(f"Unknown export format: {fmt}")
+
+
+def export_sheet_file(path: str, sheet: str, fmt: str, output: str, chunk_size: int) -> dict:
+    """Export one sheet to a file, opening the workbook read-only on its own.
+
+    Runs inside pool workers, so it must not rely on state from the parent.
+    """
+    started = time.perf_counter()
+    wb = open_read_only(path)
+    try:
+        with open(output, 'w', newline='', encoding='utf-8') as f:
+            rows = export_rows(wb[sheet].iter_rows(values_only=True), fmt, f, chunk_size)
+    finally:
+        wb.close()
+    return {
+        "sheet": sheet,
+        "output": output,
+        "rows": rows,
+        "ms": round((time.perf_counter() - started) * 1000, 3),
+    }
+
+
+def sheet_filenames(sheets: list, extension: str) -> list:
+    """Filesystem-safe, unique file names for sheet exports."""
+    names, seen = [], set()
+    for sheet in sheets:
+        base = re.sub(r'[^\w.-]+', '_', sheet).strip('_.') or "sheet"
+        name, n = base, 2
+        while name.lower() in seen:
+            name = f"{base}_{n}"
+            n += 1
+        seen.add(name.lower())
+        names.append(name + extension)
+    return names
+
+
+def export_all_sheets(args, fmt: str, out_dir: str):
+    """Export every worksheet to its own file in out_dir, in parallel, plus a manifest."""
+    started = time.perf_counter()
+    wb = open_read_only(args.file)
+    sheets = list(wb.sheetnames) if isinstance(wb, XlsWorkbook) else [ws.title for ws in wb.worksheets]
+    wb.close()
+    
+    os.makedirs(out_dir, exist_ok=True)
+    outputs = [os.path.join(out_dir, name) for name in sheet_filenames(sheets, EXPORT_EXTENSIONS[fmt])]
+    chunk_size = getattr(args, "chunk_size", DEFAULT_CHUNK_SIZE)
+    workers = max(1, min(args.workers or os.cpu_count() or 1, len(sheets)))
+    
+    jobs = [(args.file, sheet, fmt, output, chunk_size) for sheet, output in zip(sheets, outputs)]
+    if workers == 1:
+        results = [export_sheet_file(*job) for job in jobs]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(export_sheet_file, *zip(*jobs)))
+    
+    manifest = {
+        "source": args.file,
+        "format": fmt,
+        "workers": workers,
+        "sheets": results,
+        "total_rows": sum(r["rows"] for r in results),
+        "total_ms": round((time.perf_counter() - started) * 1000, 3),
+    }
+    manifest_path = os.path.join(out_dir, "manifest.json")
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    
+    ok({**manifest, "manifest": manifest_path})
+
+
+# ============================================================================
+# Append
+# ============================================================================
+#
+# append adds rows to the end of a sheet without loading the workbook: the
+# sheet's XML is streamed through unchanged up to </sheetData>, the new rows
+# are written there as inline-string cells, and the <dimension> is updated.
+# The sheet part is deflated from <sheetData> on into a temp file while the
+# last existing row is read off the row tags; the XML before it, holding the
+# dimension, is compressed once that row is known and spliced in front, so
+# the archive is written in one pass. Incoming rows are converted and written
+# as they are read, so they are never all held in memory. Other zip members
+# are copied across raw, except styles.xml when dates need a format, which
+# goes in last, once the rows have shown which formats those are.
+
+APPEND_CHUNK_SIZE = 1 << 20
+ROW_TAG_RE = re.compile(rb'<(?:\w+:)?row\b[^>]*?\br="(\d+)"')
+SHEET_DATA_OPEN_RE = re.compile(rb'<((?:\w+:)?)sheetData\b[^>]*?(/?)>')
+SHEET_DATA_CLOSE_RE = re.compile(rb'</(?:\w+:)?sheetData>')
+DIMENSION_RE = re.compile(rb'(<(?:\w+:)?dimension\b[^>]*?\bref=")([^"]*)(")')
+XML_ILLEGAL_RE = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+REL_SHARED_STRINGS = NS_REL + "/sharedStrings"
+REL_STYLES = NS_REL + "/styles"
+# Built-in number formats used for appended dates
+NUMFMT_DATE = 14
+NUMFMT_DATETIME = 22
+
+
+class AppendRowError(Exception):
+    """A row to append doesn't fit the sheet; args are (message, details)."""
+
+
+def workbook_rels(zf) -> dict:
+    """Relationships of the main workbook part."""
+    wb_path = workbook_part_path(zf)
+    rels_path = zip_part_path(wb_path, "_rels/" + wb_path.rsplit("/", 1)[-1] + ".rels")
+    return read_relationships(zf, rels_path, wb_path)
+
+
+def workbook_part_of_type(zf, rel_type: str) -> Optional[str]:
+    for kind, path in workbook_rels(zf).values():
+        if kind == rel_type and path in zf.namelist():
+            return path
+    return None
+
+
+def shared_strings_at(zf, indexes: set) -> dict:
+    """Text of the given shared-string indexes, parsing only as far as needed."""
+    path = workbook_part_of_type(zf, REL_SHARED_STRINGS)
+    found = {}
+    if not path or not indexes:
+        return found
+    last = max(indexes)
+    with zf.open(path) as f:
+        i = 0
+        for _, elem in ET.iterparse(f):
+            if elem.tag != f"{{{NS_MAIN}}}si":
+                continue
+            if i in indexes:
+                found[i] = "".join(t.text or "" for t in elem.iter(f"{{{NS_MAIN}}}t"))
+            elem.clear()
+            if i >= last:
+                break
+            i += 1
+    return found
+
+
+def read_header_row(zf, part: str) -> list:
+    """Values of a sheet's first row, stopping after it."""
+    cells = []
+    with zf.open(part) as f:
+        for _, elem in ET.iterparse(f):
+            tag = elem.tag.rsplit("}", 1)[-1]
+            if tag == "c":
+                col = column_index_from_string(coordinate_from_string(elem.get("r"))[0])
+                kind = elem.get("t")
+                if kind == "inlineStr":
+                    text = "".join(t.text or "" for t in elem.iter(f"{{{NS_MAIN}}}t"))
+                else:
+                    v = elem.find(f"{{{NS_MAIN}}}v")
+                    text = v.text if v is not None else None
+                cells.append((col, kind, text))
+            elif tag == "row":
+                break
+    strings = shared_strings_at(zf, {int(text) for _, kind, text in cells if kind == "s" and text})
+    header = [None] * (max((col for col, _, _ in cells), default=0))
+    for col, kind, text in cells:
+        header[col - 1] = strings.get(int(text)) if kind == "s" and text else text
+    return header
+
+
+def iter_append_rows(source: str):
+    """Rows to append from a JSON/JSONL file, '-' for stdin, or inline JSON."""
+    if source == "-":
+        lines = sys.stdin
+    elif source.lstrip()[:1] in ("[", "{") and not os.path.exists(source):
+        data = json.loads(source)
+        yield from data if isinstance(data, list) else [data]
+        return
+    else:
+        lines = open(source, 'r', encoding='utf-8')
+    with lines:
+        first = ""
+        for first in lines:
+            if first.strip():
+                break
+        if not first.strip():
+            return
+        try:
+            item = json.loads(first)
+        except json.JSONDecodeError:
+            # Not one value per line: a (pretty-printed) JSON array
+            data = json.loads(first + lines.read())
+            yield from data if isinstance(data, list) else [data]
+            return
+        if isinstance(item, list) and item and all(isinstance(v, (list, dict)) for v in item):
+            yield from item     # a one-line JSON array of rows
+        else:
+            yield item
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+
+
+def append_cell_value(value, coerce: bool):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    if coerce and isinstance(value, str):
+        return coerce_csv_value(value)
+    return value
+
+
+class AppendDateStyles:
+    """Cell format (xf) indexes for appended date cells, picked as each date
+    format is first met.
+
+    Reuses a plain cell format with the number format if there is one,
+    otherwise adds one to cellXfs; styles.xml is only parsed once a date
+    turns up.
+    """
+    
+    def __init__(self, zin):
+        self.zin = zin
+        self.path = workbook_part_of_type(zin, REL_STYLES)
+        self.root = self.xfs = None
+        self.ids = {}
+        self.added = False
+    
+    def get(self, fmt: int) -> Optional[int]:
+        if fmt in self.ids:
+            return self.ids[fmt]
+        if self.root is None and self.path:
+            self.root = parse_part(self.zin.read(self.path))
+            self.xfs = self.root.find(f"{{{NS_MAIN}}}cellXfs")
+        if self.xfs is None:
+            self.ids[fmt] = None
+            return None
+        existing = self.xfs.findall(f"{{{NS_MAIN}}}xf")
+        for i, xf in enumerate(existing):
+            if xf.get("numFmtId") == str(fmt) and all(xf.get(a, "0") == "0" for a in ("fontId", "fillId", "borderId")):
+                self.ids[fmt] = i
+                return i
+        ET.SubElement(self.xfs, f"{{{NS_MAIN}}}xf", {
+            "numFmtId": str(fmt), "fontId": "0", "fillId": "0", "borderId": "0",
+            "xfId": "0", "applyNumberFormat": "1",
+        })
+        self.xfs.set("count", str(len(existing) + 1))
+        self.ids[fmt] = len(existing)
+        self.added = True
+        return len(existing)
+    
+    def styles_xml(self) -> Optional[bytes]:
+        """The patched styles.xml, or None if no cell format was added."""
+        if not self.added:
+            return None
+        return ET.tostring(self.root, encoding="UTF-8", xml_declaration=True)
+
+
+def date_format(value) -> int:
+    if isinstance(value, datetime) and (value.hour, value.minute, value.second, value.microsecond) != (0, 0, 0, 0):
+        return NUMFMT_DATETIME
+    return NUMFMT_DATE
+
+
+def xml_escape(text: str) -> str:
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def append_cell_xml(ref: str, value, prefix: str, date_styles: AppendDateStyles) -> str:
+    """One <c> element for an appended value ('' for blanks)."""
+    if value is None or value == "":
+        return ""
+    p = prefix
+    if isinstance(value, str):
+        value = XML_ILLEGAL_RE.sub("", value)
+        if value.startswith("=") and len(value) > 1:
+            return f'<{p}c r="{ref}"><{p}f>{xml_escape(value[1:])}</{p}f></{p}c>'
+        space = ' xml:space="preserve"' if value != value.strip() else ""
+        return f'<{p}c r="{ref}" t="inlineStr"><{p}is><{p}t{space}>{xml_escape(value)}</{p}t></{p}is></{p}c>'
+    if isinstance(value, float) and not math.isfinite(value):
+        return append_cell_xml(ref, str(value), prefix, date_styles)
+    style = ""
+    if isinstance(value, (datetime, date)):
+        xf = date_styles.get(date_format(value))
+        style = f' s="{xf}"' if xf is not None else ""
+    t, text = cached_value_xml(value)
+    kind = f' t="{t}"' if t else ""
+    return f'<{p}c r="{ref}"{kind}{style}><{p}v>{text}</{p}v></{p}c>'
+
+
+def find_sheet_part(zf, name: Optional[str]) -> dict:
+    """The worksheet part called `name`, or the active worksheet."""
+    parts, active = list_sheet_parts(zf)
+    worksheets = [p for p in parts if p["kind"] == "worksheet"]
+    if name:
+        part = next((p for p in worksheets if p["name"] == name), None)
+        if part is None:
+            fail(f"Sheet '{name}' not found", {"available": [p["name"] for p in worksheets]})
+        return part
+    part = parts[active] if 0 <= active < len(parts) and parts[active]["kind"] == "worksheet" else None
+    part = part or (worksheets[0] if worksheets else None)
+    if part is None:
+        fail("Workbook has no worksheets")
+    return part
+
+
+def stored_dimension(zf, part: str) -> Optional[str]:
+    """The sheet's <dimension> ref, reading no further than <sheetData>."""
+    head = b""
+    with zf.open(part) as f:
+        while True:
+            block = f.read(1 << 16)
+            head += block
+            end = SHEET_DATA_OPEN_RE.search(head)
+            if end or not block:
+                break
+    m = DIMENSION_RE.search(head, 0, end.start() if end else len(head))
+    return m.group(2).decode() if m else None
+
+
+def copy_sheet_appending(src, dst, rows, date_styles: AppendDateStyles) -> tuple:
+    """Stream a sheet part from src to dst with rows added to <sheetData>.
+
+    The XML before <sheetData> is returned rather than written, along with
+    the last row number found in the existing data, which the new rows are
+    numbered from, and the number and width of the rows added:
+    (head, last, count, width).
+    """
+    count = width = 0
+    
+    def write_rows(prefix: bytes, last: int):
+        nonlocal count, width
+        p = prefix.decode()
+        for chunk in chunked(enumerate(rows, start=last + 1), DEFAULT_CHUNK_SIZE):
+            parts = []
+            count += len(chunk)
+            for row_no, row in chunk:
+                width = max(width, len(row))
+                cells = "".join(
+                    append_cell_xml(f"{get_column_letter(j)}{row_no}", value, p, date_styles)
+                    for j, value in enumerate(row, start=1)
+                )
+                parts.append(f'<{p}row r="{row_no}">{cells}</{p}row>')
+            dst.write("".join(parts).encode("utf-8"))
+    
+    def copy_rest(buf: bytes):
+        dst.write(buf)
+        while True:
+            block = src.read(APPEND_CHUNK_SIZE)
+            if not block:
+                return
+            dst.write(block)
+    
+    buf, head, prefix, last = b"", True, b"", 0
+    while True:
+        block = src.read(APPEND_CHUNK_SIZE)
+        buf += block
+        if head:
+            m = SHEET_DATA_OPEN_RE.search(buf)
+            if not m:
+                if not block:
+                    raise ValueError("sheet has no <sheetData>")
+                continue
+            start = buf[:m.start()]
+            prefix = m.group(1)
+            if m.group(2):      # <sheetData/>
+                dst.write(b"<" + prefix + b"sheetData>")
+                write_rows(prefix, 0)
+                dst.write(b"</" + prefix + b"sheetData>")
+                copy_rest(buf[m.end():])
+                return start, 0, count, width
+            dst.write(buf[m.start():m.end()])
+            buf, head = buf[m.end():], False
+        
+        m = SHEET_DATA_CLOSE_RE.search(buf)
+        cut = m.start() if m else buf.rfind(b"<")
+        if cut < 0:
+            cut = len(buf)
+        refs = ROW_TAG_RE.findall(buf, 0, cut)
+        if refs:
+            last = int(refs[-1])
+        if m:
+            dst.write(buf[:cut])
+            write_rows(prefix, last)
+            copy_rest(buf[cut:])
+            return start, last, count, width
+        if not block:
+            raise ValueError("unterminated <sheetData>")
+        dst.write(buf[:cut])
+        buf = buf[cut:]
+
+
+class DeflatedSpool:
+    """Write-only file that deflates into a temp file, keeping the CRC-32 and
+    sizes a zip entry needs."""
+    
+    def __init__(self):
+        import tempfile
+        self.file = tempfile.TemporaryFile()
+        self.compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        self.crc = self.size = 0
+    
+    def write(self, data: bytes):
+        self.crc = zlib.crc32(data, self.crc)
+        self.size += len(data)
+        self.file.write(self.compressor.compress(data))
+    
+    def finish(self) -> int:
+        """Flush the last block and rewind; returns the compressed size."""
+        self.file.write(self.compressor.flush())
+        compressed = self.file.tell()
+        self.file.seek(0)
+        return compressed
+
+
+def crc32_concat(crc_a: int, crc_b: int, len_b: int) -> int:
+    """CRC-32 of a + b from the CRC-32s of a and of b (`len_b` bytes long)."""
+    # CRC-32 is affine in its starting value: starting b from crc_a instead of
+    # 0 changes the result as it changes that of len_b zero bytes
+    zeros = memoryview(bytes(min(len_b, APPEND_CHUNK_SIZE)))
+    from_a, from_zero = crc_a, 0
+    while len_b:
+        n = min(len_b, len(zeros))
+        from_a, from_zero = zlib.crc32(zeros[:n], from_a), zlib.crc32(zeros[:n], from_zero)
+        len_b -= n
+    return crc_b ^ from_a ^ from_zero
+
+
+def write_appended(path: str, tmp_path: str, part: str, rows, ref: Optional[str]) -> tuple:
+    """Write a copy of the workbook with rows appended to one sheet part.
+
+    Returns (last existing row, rows added, dimension written or None).
+    """
+    last = count = dimension = styles_item = None
+    with zipfile.ZipFile(path) as zin, zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as zout:
+        date_styles = AppendDateStyles(zin)
+        for item in zin.infolist():
+            if item.filename == part:
+                body = DeflatedSpool()
+                try:
+                    with zin.open(item) as src:
+                        head, last, count, width = copy_sheet_appending(src, body, rows, date_styles)
+                    dimension = appended_dimension(ref, last, count, width)
+                    if dimension:
+                        head = DIMENSION_RE.sub(lambda d: d.group(1) + dimension.encode() + d.group(3),
+                                                head, count=1)
+                    # A sync flush ends the head on a byte boundary without
+                    # closing the stream, so the body's deflate data follows on
+                    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+                    packed_head = compressor.compress(head) + compressor.flush(zlib.Z_SYNC_FLUSH)
+                    body_size = body.finish()
+                    
+                    out = zipfile.ZipInfo(item.filename, date_time=time.localtime()[:6])
+                    out.compress_type = zipfile.ZIP_DEFLATED
+                    out.external_attr = item.external_attr
+                    out.CRC = crc32_concat(zlib.crc32(head), body.crc, body.size)
+                    out.file_size = len(head) + body.size
+                    out.compress_size = len(packed_head) + body_size
+                    write_raw_member(zout, out, iter_chain(
+                        [packed_head], iter(lambda: body.file.read(APPEND_CHUNK_SIZE), b"")))
+                finally:
+                    body.file.close()
+            elif item.filename == date_styles.path:
+                # Written once the rows are, when the date formats they need are known
+                styles_item = item
+            else:
+                copy_zip_member_raw(zin, zout, item)
+        if styles_item is not None:
+            styles_xml = date_styles.styles_xml()
+            if styles_xml is not None:
+                zout.writestr(styles_item, styles_xml)
+            else:
+                copy_zip_member_raw(zin, zout, styles_item)
+    return last, count, dimension
+
+
+def appended_dimension(ref: Optional[str], last: int, count: int, width: int) -> Optional[str]:
+    if not ref:
+        return None
+    (min_row, min_col), (_, max_col) = parse_range(ref)
+    if last == 0:
+        min_row, min_col, max_col = 1, 1, width
+    return f"{coords_to_cell(min_row, min_col)}:{coords_to_cell(last + count, max(max_col, width))}"
+
+
+def cmd_append(args):
+    """Append rows to the end of a sheet by streaming its XML, without loading the workbook."""
+    require_openpyxl()
+    reject_xls(args.file, "append")
+    started = time.perf_counter()
+    header = None
+    
+    def sheet_rows(items):
+        """Cell values for each incoming row, dicts placed by the header row."""
+        nonlocal header
+        for i, item in enumerate(items, start=1):
+            if isinstance(item, dict):
+                if header is None:
+                    with zipfile.ZipFile(args.file) as zf:
+                        header = {name: j for j, name in enumerate(read_header_row(zf, part["path"]))
+                                  if name is not None}
+                unknown = [key for key in item if key not in header]
+                if unknown:
+                    raise AppendRowError(f"Row {i}: keys not in the header row: {', '.join(map(str, unknown))}",
+                                         {"header": list(header)})
+                row = [None] * (max((header[key] for key in item), default=-1) + 1)
+                for key, value in item.items():
+                    row[header[key]] = append_cell_value(value, args.coerce)
+                yield row
+            elif isinstance(item, list):
+                yield [append_cell_value(value, args.coerce) for value in item]
+            else:
+                yield [append_cell_value(item, args.coerce)]
+    
+    try:
+        with zipfile.ZipFile(args.file) as zf:
+            part = find_sheet_part(zf, args.sheet)
+            ref = stored_dimension(zf, part["path"])
+        rows = sheet_rows(iter_append_rows(args.data))
+        first = next(rows, None)
+    except AppendRowError as e:
+        fail(*e.args)
+    except (OSError, zipfile.BadZipFile, KeyError, ET.ParseError) as e:
+        fail(f"Failed to open file: {e}")
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        fail(f"Invalid row data: {e}")
+    
+    if first is None:
+        ok({"file": args.file, "sheet": part["name"], "rows": 0})
+        return
+    
+    # Rows are read as they are written, so bad data further on stops the write
+    tmp_path = f"{args.file}.tmp"
+    try:
+        last, count, dimension = write_appended(args.file, tmp_path, part["path"],
+                                                iter_chain([first], rows), ref)
+    except (AppendRowError, OSError, ValueError, KeyError, zipfile.BadZipFile, ET.ParseError) as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        if isinstance(e, AppendRowError):
+            fail(*e.args)
+        if isinstance(e, (json.JSONDecodeError, UnicodeDecodeError)):
+            fail(f"Invalid row data: {e}")
+        fail(f"Failed to append: {e}")
+    os.replace(tmp_path, args.file)
+    if _workbook_cache is not None:
+        _workbook_cache.discard(os.path.abspath(args.file))
+    
+    result = {
+        "file": args.file,
+        "sheet": part["name"],
+        "rows": count,
+        "first_row": last + 1,
+        "last_row": last + count,
+        "ms": round((time.perf_counter() - started) * 1000, 3),
+    }
+    if dimension:
+        result["dimension"] = dimension
+    ok(result)
+
+
+# ============================================================================
+# Sort
+# ============================================================================
+#
+# sort reorders a sheet's rows without loading the workbook. Like append, it
+# streams the sheet part, keeping each <row> element as raw XML next to its
+# typed key values, so cell formats, row heights and formulas travel with
+# the row. Rows are sorted in memory until --memory-mb is used up; past that
+# each sorted run is pickled to a temp file, and the runs are k-way merged
+# (heapq.merge) while the rows are renumbered and written out. Formulas are
+# translated to their new row as if copied there (shared formulas are
+# expanded first), and single-row merged cells and hyperlinks follow their
+# row. Other references into the sheet stay put, as with Excel's own sort.
+
+DEFAULT_SORT_MEMORY_MB = 256
+# Rough cost of a buffered row beyond its XML, and of each of its keys
+SORT_ROW_OVERHEAD = 160
+SORT_KEY_OVERHEAD = 80
+ROW_ELEMENT_RE = re.compile(rb'<((?:\w+:)?)row\b[^>]*?(?:/>|>.*?</\1row>)', re.S)
+ROW_NUMBER_RE = re.compile(rb'(<(?:\w+:)?row\b[^>]*?\br=")(\d+)(")')
+CELL_ELEMENT_RE = re.compile(rb'<((?:\w+:)?)c\b([^>]*?)(?:/>|>(.*?)</\1c>)', re.S)
+CELL_ATTR_REF_RE = re.compile(rb'\br="([A-Z]+)(\d+)"')
+CELL_NUMBER_RE = re.compile(rb'(<(?:\w+:)?c\b[^>]*?\br="[A-Z]+)\d+(")')
+CELL_TYPE_RE = re.compile(rb'\bt="(\w+)"')
+CELL_VALUE_RE = re.compile(rb'<((?:\w+:)?)v>(.*?)</\1v>', re.S)
+CELL_TEXT_RE = re.compile(rb'<((?:\w+:)?)t\b[^>]*(?<!/)>(.*?)</\1t>', re.S)
+FORMULA_RE = re.compile(rb'<((?:\w+:)?)f\b([^>]*?)(?:/>|>(.*?)</\1f>)', re.S)
+FORMULA_SI_RE = re.compile(rb'\bsi="(\d+)"')
+FORMULA_REF_RE = re.compile(rb'(\bref=")([^"]*)(")')
+ROW_REF_ELEMENT_RE = re.compile(rb'<((?:\w+:)?)(mergeCell|hyperlink)\b[^>]*?\bref="([^"]*)"[^>]*>')
+MERGE_CELL_RE = re.compile(rb'<(?:\w+:)?mergeCell\b')
+MERGE_COUNT_RE = re.compile(rb'(<(?:\w+:)?mergeCells\b[^>]*?\bcount=")\d+(")')
+EMPTY_REF_LIST_RE = re.compile(rb'<((?:\w+:)?)(mergeCells|hyperlinks)\b[^>]*>\s*</\1\2>')
+# Marks a dropped row in the row-number maps used by remap_row_refs
+ROW_REMOVED = 0xFFFFFFFF
+# One end of a reference in a formula: column, row or both, each maybe absolute
+REF_BOUND_RE = re.compile(r"^(\$?[A-Za-z]{1,3})?(\$?\d+)?$")
+
+
+class Descending:
+    """Inverts the order of a sort key."""
+    
+    __slots__ = ("key",)
+    
+    def __init__(self, key):
+        self.key = key
+    
+    def __lt__(self, other):
+        return other.key < self.key
+    
+    def __eq__(self, other):
+        return self.key == other.key
+
+
+def parse_sort_keys(spec: str, header: Optional[list]) -> list:
+    """Resolve --by ("C,-D"; header names too with --header) to [(index, descending, label)]."""
+    names = column_names(header, len(header)) if header is not None else None
+    keys = []
+    for part in (p.strip() for p in spec.split(",") if p.strip()):
+        descending = part.startswith("-")
+        name = part[1:].strip() if part[:1] in "+-" else part
+        index = resolve_column(name, names) if names else None
+        if index is None and re.match(r"^[A-Za-z]{1,3}$", name):
+            index = column_index_from_string(name.upper()) - 1
+        if index is None:
+            fail(f"--by: column '{name}' not found", {"columns": names})
+        label = names[index] if names and index < len(names) else get_column_letter(index + 1)
+        keys.append((index, descending, ("-" if descending else "") + label))
+    if not keys:
+        fail("--by needs at least one column")
+    return keys
+
+
+def read_shared_strings(zf) -> list:
+    """All shared strings, in index order."""
+    path = workbook_part_of_type(zf, REL_SHARED_STRINGS)
+    strings = []
+    if path:
+        with zf.open(path) as f:
+            for _, elem in ET.iterparse(f):
+                if elem.tag == f"{{{NS_MAIN}}}si":
+                    strings.append("".join(t.text or "" for t in elem.iter(f"{{{NS_MAIN}}}t")))
+                    elem.clear()
+    return strings
+
+
+def iter_sheet_elements(src):
+    """Split a sheet part into ("head", xml up to <sheetData>), ("row", xml)
+    for each row element, and ("tail", xml from </sheetData> on)."""
+    buf = b""
+    while True:
+        block = src.read(APPEND_CHUNK_SIZE)
+        buf += block
+        m = SHEET_DATA_OPEN_RE.search(buf)
+        if m:
+            break
+        if not block:
+            raise ValueError("sheet has no <sheetData>")
+    prefix = m.group(1)
+    if m.group(2):      # <sheetData/>
+        yield "head", buf[:m.start()] + b"<" + prefix + b"sheetData>"
+        yield "tail", b"</" + prefix + b"sheetData>" + buf[m.end():] + src.read()
+        return
+    yield "head", buf[:m.end()]
+    buf = buf[m.end():]
+    
+    while True:
+        close = SHEET_DATA_CLOSE_RE.search(buf)
+        pos = 0
+        for row in ROW_ELEMENT_RE.finditer(buf, 0, close.start() if close else len(buf)):
+            yield "row", row.group(0)
+            pos = row.end()
+        if close:
+            yield "tail", buf[close.start():] + src.read()
+            return
+        block = src.read(APPEND_CHUNK_SIZE)
+        if not block:
+            raise ValueError("unterminated <sheetData>")
+        buf = buf[pos:] + block
+
+
+def iter_row_cells(row: bytes):
+    """(0-based column, attributes, body or None) for each <c> in a row element."""
+    col = -1
+    for m in CELL_ELEMENT_RE.finditer(row):
+        ref = CELL_ATTR_REF_RE.search(m.group(2))
+        col = column_index_from_string(ref.group(1).decode()) - 1 if ref else col + 1
+        yield col, m.group(2), m.group(3)
+
+
+def row_number(row: bytes) -> int:
+    m = ROW_NUMBER_RE.search(row)
+    if m is None:
+        raise ValueError("row element without a row number")
+    return int(m.group(2))
+
+
+def sort_cell_value(attrs: bytes, body: Optional[bytes], strings):
+    """Typed value of a cell element; `strings()` returns the shared strings."""
+    if not body:
+        return None
+    m = CELL_TYPE_RE.search(attrs)
+    kind = m.group(1) if m else b"n"
+    if kind == b"inlineStr":
+        return html.unescape(b"".join(t.group(2) for t in CELL_TEXT_RE.finditer(body)).decode("utf-8"))
+    m = CELL_VALUE_RE.search(body)
+    if m is None:
+        return None
+    text = m.group(2)
+    if kind == b"s":
+        return strings()[int(text)]
+    if kind == b"b":
+        return text.strip() == b"1"
+    if kind == b"e":
+        return ERROR_VALUES.get(text.decode(), VALUE)
+    if kind in (b"str", b"d"):
+        return html.unescape(text.decode("utf-8"))
+    try:
+        number = float(text)
+    except ValueError:
+        return None
+    return int(number) if number.is_integer() and abs(number) < 1e15 else number
+
+
+def sort_value_key(value, descending: bool) -> tuple:
+    """Excel's sort order as (group, rank, value): numbers, text, logicals
+    (reversed when descending), then errors and blanks last either way."""
+    if value is None:
+        return (2, 0, 0)
+    if isinstance(value, ExcelError):
+        return (1, 0, 0)
+    rank, key = compare_key(value)
+    if not descending:
+        return (0, rank, key)
+    return (0, -rank, Descending(key) if rank == 1 else -key)
+
+
+def build_row_key(keys: list, strings):
+    """Function from a row element to its flat sort key tuple.
+
+    Cells are scanned only as far as the last key column.
+    """
+    wanted = {}
+    for slot, (index, _, _) in enumerate(keys):
+        wanted.setdefault(index, []).append(slot)
+    last = max(wanted)
+    columns = {}
+    
+    def row_key(row: bytes) -> tuple:
+        values = [None] * len(keys)
+        col = -1
+        for m in CELL_ELEMENT_RE.finditer(row):
+            ref = CELL_ATTR_REF_RE.search(m.group(2))
+            if ref:
+                letters = ref.group(1)
+                col = columns.get(letters)
+                if col is None:
+                    col = columns[letters] = column_index_from_string(letters.decode()) - 1
+            else:
+                col += 1
+            if col > last:
+                break
+            for slot in wanted.get(col, ()):
+                values[slot] = sort_cell_value(m.group(2), m.group(3), strings)
+        key = ()
+        for slot, value in enumerate(values):
+            key += sort_value_key(value, keys[slot][1])
+        return key
+    
+    return row_key
+
+
+def translate_formula_text(text: bytes, origin: str, dest: str) -> bytes:
+    """Formula element text re-targeted from one cell to another, as a copy would."""
+    try:
+        formula = Translator("=" + html.unescape(text.decode("utf-8")), origin).translate_formula(dest)
+    except Exception:
+        return text
+    return xml_escape(formula[1:]).encode("utf-8")
+
+
+def expand_shared_formulas(row: bytes, masters: dict) -> bytes:
+    """Rewrite a row's shared formulas as ordinary ones so the row can move alone.
+
+    `masters` maps each shared index to the anchor's (formula text, cell) and
+    is filled in as anchors go by; they precede the cells that share them.
+    """
+    def cell(m):
+        p, attrs, body = m.group(1), m.group(2), m.group(3)
+        f = FORMULA_RE.search(body) if body else None
+        if f is None or b'"shared"' not in f.group(2):
+            return m.group(0)
+        ref = CELL_ATTR_REF_RE.search(attrs)
+        si = FORMULA_SI_RE.search(f.group(2))
+        if ref is None or si is None:
+            raise ValueError("shared formula without a cell reference or index")
+        here = (ref.group(1) + ref.group(2)).decode()
+        if f.group(3):
+            masters[si.group(1)] = (f.group(3), here)
+            text = f.group(3)
+        elif si.group(1) in masters:
+            text = translate_formula_text(*masters[si.group(1)], here)
+        else:
+            raise ValueError(f"shared formula in {here} has no anchor cell")
+        formula = b"<" + f.group(1) + b"f>" + text + b"</" + f.group(1) + b"f>"
+        body = body[:f.start()] + formula + body[f.end():]
+        return b"<" + p + b"c" + attrs + b">" + body + b"</" + p + b"c>"
+    
+    return CELL_ELEMENT_RE.sub(cell, row)
+
+
+class UndecidedRows(Exception):
+    """A formula refers to rows not yet known to be kept or deleted."""
+
+
+def delete_rows_in_ref(ref: str, sheet: str, gone, known: int) -> str:
+    """One reference adjusted for deleted rows; see delete_row_refs."""
+    prefix, bang, area = ref.rpartition("!")
+    if bang:
+        name = prefix[1:-1].replace("''", "'") if prefix.startswith("'") else prefix
+        if name.lower() != sheet.lower():
+            return ref
+    bounds = [REF_BOUND_RE.match(end) for end in area.split(":")]
+    if len(bounds) > 2 or not all(b and b.group(2) for b in bounds):
+        # Names, whole columns and the like don't move with rows
+        return ref
+    rows = [int(b.group(2).lstrip("$")) for b in bounds]
+    top, bottom = min(rows), max(rows)
+    if bottom > known:
+        raise UndecidedRows(ref)
+    new_top = top - bisect.bisect_left(gone, top)
+    new_bottom = bottom - bisect.bisect_right(gone, bottom)
+    if new_bottom < new_top:
+        return prefix + bang + "#REF!"
+    ends = []
+    for b, row in zip(bounds, rows):
+        dollar = "$" if b.group(2).startswith("$") else ""
+        ends.append(f"{b.group(1) or ''}{dollar}{new_top if row == top else new_bottom}")
+    return prefix + bang + ":".join(ends)
+
+
+def delete_row_refs(formula: str, sheet: str, gone, known: int) -> str:
+    """A formula (without "=") with its references to `sheet` adjusted for
+    deleted rows the way Excel adjusts them: references below the deleted
+    rows move up, ranges shrink, and references to deleted rows become #REF!.
+
+    `gone` holds the deleted row numbers in ascending order. Rows past `known`
+    are not decided yet, and referring to one raises UndecidedRows.
+    """
+    try:
+        tokens = Tokenizer("=" + formula).items
+    except Exception as e:
+        raise ValueError(f"cannot parse formula ={formula}: {e}")
+    return "".join(delete_rows_in_ref(t.value, sheet, gone, known)
+                   if t.type == Token.OPERAND and t.subtype == Token.RANGE else t.value
+                   for t in tokens)
+
+
+def move_row(row: bytes, old: int, new: int, adjust=None) -> bytes:
+    """A row element renumbered from `old` to `new`, formulas translated to
+    match. `adjust`, given formula text, replaces the translation a copy of
+    the row would get."""
+    number = str(new).encode()
+    row = ROW_NUMBER_RE.sub(lambda m: m.group(1) + number + m.group(3), row, count=1)
+    if not FORMULA_RE.search(row):
+        return CELL_NUMBER_RE.sub(lambda m: m.group(1) + number + m.group(2), row)
+    
+    def formula(f, origin: str, dest: str):
+        if adjust is not None:
+            attrs = FORMULA_REF_RE.sub(lambda r: r.group(1) + adjust(r.group(2).decode()).encode() + r.group(3),
+                                       f.group(2))
+        else:
+            attrs = FORMULA_REF_RE.sub(
+                lambda r: r.group(1) + Translator.translate_range(r.group(2).decode(), new - old, 0).encode() + r.group(3),
+                f.group(2))
+        if f.group(3) is None:
+            return b"<" + f.group(1) + b"f" + attrs + b"/>"
+        if adjust is not None:
+            text = xml_escape(adjust(html.unescape(f.group(3).decode("utf-8")))).encode("utf-8")
+        else:
+            text = translate_formula_text(f.group(3), origin, dest)
+        return b"<" + f.group(1) + b"f" + attrs + b">" + text + b"</" + f.group(1) + b"f>"
+    
+    def cell(m):
+        p, attrs, body = m.group(1), m.group(2), m.group(3)
+        ref = CELL_ATTR_REF_RE.search(attrs)
+        if ref is None:
+            return m.group(0)
+        attrs = attrs[:ref.start(2)] + number + attrs[ref.end(2):]
+        if body is None:
+            return b"<" + p + b"c" + attrs + b"/>"
+        if b"f" in body and FORMULA_RE.search(body):
+            column = ref.group(1).decode()
+            body = FORMULA_RE.sub(lambda f: formula(f, f"{column}{old}", f"{column}{new}"), body)
+        return b"<" + p + b"c" + attrs + b">" + body + b"</" + p + b"c>"
+    
+    return CELL_ELEMENT_RE.sub(cell, row)
+
+
+def check_merged_rows(tail: bytes, first: int, last: int):
+    """Refuse to reorder rows through merged cells that span several of them."""
+    for m in ROW_REF_ELEMENT_RE.finditer(tail):
+        if m.group(2) != b"mergeCell":
+            continue
+        (r1, _), (r2, _) = parse_range(m.group(3).decode())
+        if r1 != r2 and r2 >= first and r1 <= last:
+            raise ValueError(f"merged cells {m.group(3).decode()} span several rows of the data")
+
+
+def remap_row_refs(tail: bytes, moved) -> bytes:
+    """Point single-row merged cells and hyperlinks at their rows' new
+    positions, dropping those on removed rows. `moved` maps old row numbers
+    to new ones, or ROW_REMOVED; 0 leaves a row where it is."""
+    def ref(m):
+        (r1, c1), (r2, c2) = parse_range(m.group(3).decode())
+        new = moved[r1] if r1 == r2 and r1 < len(moved) else 0
+        if not new:
+            return m.group(0)
+        if new == ROW_REMOVED:
+            return b""
+        text = coords_to_cell(new, c1) if (r1, c1) == (r2, c2) else f"{coords_to_cell(new, c1)}:{coords_to_cell(new, c2)}"
+        start, end = m.start(3) - m.start(), m.end(3) - m.start()
+        return m.group(0)[:start] + text.encode() + m.group(0)[end:]
+    
+    tail = ROW_REF_ELEMENT_RE.sub(ref, tail)
+    merges = str(len(MERGE_CELL_RE.findall(tail))).encode()
+    tail = MERGE_COUNT_RE.sub(lambda m: m.group(1) + merges + m.group(2), tail, count=1)
+    return EMPTY_REF_LIST_RE.sub(b"", tail)
+
+
+def lazy_shared_strings(zf):
+    """Function returning the workbook's shared strings, read on first use."""
+    loaded = []
+    
+    def strings() -> list:
+        if not loaded:
+            loaded.append(read_shared_strings(zf))
+        return loaded[0]
+    
+    return strings
+
+
+def row_values(row: bytes, strings) -> list:
+    """Typed values of a row element by column, trailing blanks trimmed."""
+    values = []
+    for col, attrs, body in iter_row_cells(row):
+        value = sort_cell_value(attrs, body, strings)
+        if value is not None and col >= len(values):
+            values.extend([None] * (col - len(values)))
+            values.append(value)
+    return values
+
+
+def scan_sheet_rows(src, header: bool, info: dict):
+    """Yield (row number, row XML) for the data rows of a sheet part.
+
+    Shared formulas are expanded so each row can move on its own. `info`
+    gets the "head" XML (with the header row, if any), the "header" row,
+    the "first" and "last" data row numbers and, once done, the "tail".
+    """
+    masters = {}
+    info.update(header=None, first=0, last=0)
+    for kind, data in iter_sheet_elements(src):
+        if kind == "head":
+            info["head"] = data
+            continue
+        if kind == "tail":
+            info["tail"] = data
+            return
+        if b'"shared"' in data:
+            data = expand_shared_formulas(data, masters)
+        number = row_number(data)
+        if header and info["header"] is None:
+            info["header"] = data
+            info["head"] += data
+            info["first"] = number + 1
+            continue
+        if not info["last"] and info["header"] is None:
+            info["first"] = number
+        info["last"] = number
+        yield number, data
+
+
+def write_rewritten_sheet(zin, tmp_path: str, part: str, head: bytes, rows, first: int, tail,
+                          adjust=None) -> int:
+    """Write a copy of the workbook with one sheet part rebuilt from its rows.
+
+    `rows` yields (old row number, row XML, or None to drop the row); kept
+    rows are renumbered from `first`, their formulas translated as if copied
+    or, with `adjust`, rewritten by it (see move_row). `tail()` gives the XML
+    after the rows once they are written. calcChain.xml is dropped, as cells
+    move; other parts are copied raw. Returns the number of rows kept.
+    """
+    from array import array
+    moved = array("I", bytes(4 * (EXCEL_MAX_ROWS + 1)))
+    patched, dropped = drop_calc_chain(zin)
+    new = first
+    with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED, allowZip64=True) as zout:
+        for info in zin.infolist():
+            name = info.filename
+            if name in dropped:
+                continue
+            if name == part:
+                out = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+                out.compress_type = zipfile.ZIP_DEFLATED
+                out.external_attr = info.external_attr
+                with zout.open(out, "w", force_zip64=info.file_size > 1 << 30) as dst:
+                    dst.write(head)
+                    for chunk in chunked(rows, DEFAULT_CHUNK_SIZE):
+                        parts = []
+                        for old, row in chunk:
+                            if row is None:
+                                moved[old] = ROW_REMOVED
+                                continue
+                            if new != old or adjust is not None:
+                                row = move_row(row, old, new, adjust)
+                            if new != old:
+                                moved[old] = new
+                            parts.append(row)
+                            new += 1
+                        dst.write(b"".join(parts))
+                    dst.write(remap_row_refs(tail(), moved))
+            elif name in patched:
+                zout.writestr(zipfile.ZipInfo(name, info.date_time), patched[name], zipfile.ZIP_DEFLATED)
+            else:
+                copy_zip_member_raw(zin, zout, info)
+    return new - first
+
+
+def spill_run(items: list, spill_dir: str, n: int) -> str:
+    """Pickle a sorted run in chunks, in the spool format read_spool reads."""
+    import pickle
+    path = os.path.join(spill_dir, f"run{n}.pickle")
+    with open(path, 'wb') as f:
+        for chunk in chunked(items, DEFAULT_CHUNK_SIZE):
+            pickle.dump(chunk, f, pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def cmd_sort(args):
+    """Sort a sheet's rows by typed keys, spilling sorted runs to disk past --memory-mb."""
+    import heapq
+    import shutil
+    import tempfile
+    require_openpyxl()
+    reject_xls(args.file, "sort")
+    if args.memory_mb <= 0:
+        fail("--memory-mb must be positive")
+    started = time.perf_counter()
+    budget = args.memory_mb << 20
+    target = args.output or args.file
+    tmp_path = f"{target}.tmp"
+    spill_dir = None
+    
+    try:
+        with zipfile.ZipFile(args.file) as zin:
+            part = find_sheet_part(zin, args.sheet)
+            strings = lazy_shared_strings(zin)
+            info, keys = {}, None
+            items, runs, used, count = [], [], 0, 0
+            with zin.open(part["path"]) as src:
+                for number, data in scan_sheet_rows(src, args.header, info):
+                    if keys is None:
+                        header = info["header"]
+                        keys = parse_sort_keys(args.by, row_values(header, strings) if header else None)
+                        row_key = build_row_key(keys, strings)
+                    items.append((row_key(data), number, data))
+                    count += 1
+                    used += len(data) + SORT_ROW_OVERHEAD + SORT_KEY_OVERHEAD * len(keys)
+                    if used > budget:
+                        items.sort(key=operator.itemgetter(0))
+                        spill_dir = spill_dir or tempfile.mkdtemp(prefix="excel-sort-")
+                        runs.append(spill_run(items, spill_dir, len(runs)))
+                        items, used = [], 0
+            if keys is None:
+                header = info["header"]
+                keys = parse_sort_keys(args.by, row_values(header, strings) if header else None)
+            check_merged_rows(info["tail"], info["first"], info["last"])
+            
+            items.sort(key=operator.itemgetter(0))
+            if runs:
+                rows = heapq.merge(*(read_spool(run) for run in runs), items, key=operator.itemgetter(0))
+            else:
+                rows = iter(items)
+            write_rewritten_sheet(zin, tmp_path, part["path"], info["head"],
+                                  ((old, row) for _, old, row in rows), info["first"], lambda: info["tail"])
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile, ET.ParseError) as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        fail(f"Failed to sort: {e}")
+    finally:
+        if spill_dir:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+    os.replace(tmp_path, target)
+    if _workbook_cache is not None:
+        _workbook_cache.discard(os.path.abspath(target))
+    
+    result = {
+        "file": args.file,
+        "sheet": part["name"],
+        "by": [label for _, _, label in keys],
+        "rows": count,
+        "runs": len(runs) + bool(items),
+        "spilled": bool(runs),
+        "ms": round((time.perf_counter() - started) * 1000, 3),
+    }
+    if args.output:
+        result["output"] = args.output
+    ok(result)
+
+
+# ============================================================================
+# Dedupe
+# ============================================================================
+#
+# dedupe streams the sheet's XML like sort and remembers a 64-bit blake2b
+# fingerprint per distinct key rather than the rows themselves. Keys compare
+# like Excel's Remove Duplicates: text case-insensitively, 1 equal to 1.0.
+# With --keep first, duplicates are dropped during that single pass. --keep
+# last and --verify first record every row's fingerprint (8 bytes a row) and
+# decide which rows go before writing them in another pass; --verify reads
+# the duplicated rows once more in between, holds the exact key of each
+# group's first row and keeps any row that only collides with it. Kept rows
+# close up with their formats; formulas referring to the sheet's rows, in the
+# header row as well as the data, are adjusted as Excel adjusts them when rows
+# are deleted. A formula that looks past the rows decided so far (any header
+# formula pointing into the data, before a row is read) sends a single pass
+# back to deciding first.
+
+
+def build_dedupe_key(columns: Optional[list], strings):
+    """Function from a row element to its comparable key (all columns if
+    `columns` is None), or None when the key cells are all blank."""
+    wanted = {index: slot for slot, index in enumerate(columns)} if columns else None
+    last = max(columns) if columns else 0
+    
+    def row_key(row: bytes) -> Optional[tuple]:
+        if wanted is None:
+            values = row_values(row, strings)
+        else:
+            values = [None] * len(columns)
+            for col, attrs, body in iter_row_cells(row):
+                if col > last:
+                    break
+                slot = wanted.get(col)
+                if slot is not None:
+                    values[slot] = sort_cell_value(attrs, body, strings)
+        if all(value is None or value == "" for value in values):
+            return None
+        return tuple(compare_key(None if value == "" else value) for value in values)
+    
+    return row_key
+
+
+def fingerprint(key: tuple) -> int:
+    """Non-zero 64-bit fingerprint of a row key (0 marks rows without one)."""
+    return int.from_bytes(row_hash(key), "little") or 1
+
+
+def parse_dedupe_columns(spec: Optional[str], header: Optional[list]) -> tuple:
+    """--key columns (letters, or header names) as (unique 0-based indexes,
+    labels); (None, None) to compare whole rows."""
+    if not spec:
+        return None, None
+    names = column_names(header, len(header)) if header is not None else None
+    columns, labels = [], []
+    for part in (p.strip() for p in spec.split(",") if p.strip()):
+        index = resolve_column(part, names) if names else None
+        if index is None and re.match(r"^[A-Za-z]{1,3}$", part):
+            index = column_index_from_string(part.upper()) - 1
+        if index is None:
+            fail(f"--key: column '{part}' not found", {"columns": names})
+        if index not in columns:
+            columns.append(index)
+            labels.append(names[index] if names and index < len(names) else get_column_letter(index + 1))
+    return columns, labels
+
+
+def write_dedupe_report(path: str, sheet: str, first: int, removed: dict, header: bool, report: str) -> int:
+    """Write the removed rows, with the row each one duplicated, to a report workbook."""
+    wb = open_read_only(path)
+    ws = wb[sheet]
+    out = Workbook(write_only=True)
+    writer = StreamingSheetWriter(out, "Duplicates", repeat_header=True)
+    names = diff_columns(ws, True) if header else [get_column_letter(i) for i in range(1, (ws.max_column or 0) + 1)]
+    writer.append(["row", "kept_row"] + names)
+    last = max(removed, default=0)
+    if removed:
+        for row_no, row in enumerate(ws.iter_rows(min_row=first, max_row=last, values_only=True), start=first):
+            kept = removed.get(row_no)
+            if kept is not None:
+                writer.append([row_no, kept] + list(row))
+    wb.close()
+    save_workbook(out, report)
+    return writer.total - 1
+
+
+def cmd_dedupe(args):
+    """Drop duplicate rows from a sheet, tracking keys by 64-bit fingerprint."""
+    from array import array
+    require_openpyxl()
+    reject_xls(args.file, "dedupe")
+    started = time.perf_counter()
+    header = not args.no_header
+    target = args.output or args.file
+    tmp_path = f"{target}.tmp"
+    gone = array("I")                       # dropped row numbers, ascending
+    removed = {} if args.report else None   # dropped row number -> row number kept in its place
+    stats = {"rows": 0, "collisions": 0}
+    decide_first = args.keep == "last" or args.verify
+    passes = 0
+    
+    try:
+        with zipfile.ZipFile(args.file) as zin:
+            part = find_sheet_part(zin, args.sheet)
+            strings = lazy_shared_strings(zin)
+            info = {}
+            src = zin.open(part["path"])
+            rows = scan_sheet_rows(src, header, info)
+            peek = next(rows, None)
+            if peek is not None:
+                rows = iter_chain([peek], rows)
+            columns, labels = parse_dedupe_columns(
+                args.key, row_values(info["header"], strings) if info.get("header") else None)
+            row_key = build_dedupe_key(columns, strings)
+            # Rows up to this one are known to stay or go; those above the data always stay
+            decided = max(info["first"] - 1, 0)
+            
+            def tail() -> bytes:
+                check_merged_rows(info["tail"], info["first"], info["last"])
+                return info["tail"]
+            
+            def adjust(formula: str) -> str:
+                return delete_row_refs(formula, part["name"], gone, decided)
+            
+            def drop(number: int, kept_row: int):
+                gone.append(number)
+                if removed is not None:
+                    removed[number] = kept_row
+            
+            def adjusted_head() -> bytes:
+                """The XML before the data, header row formulas adjusted too."""
+                row = info["header"]
+                if row is None or not FORMULA_RE.search(row):
+                    return info["head"]
+                number = row_number(row)
+                return info["head"][:-len(row)] + move_row(row, number, number, adjust)
+            
+            def write(deduped):
+                if args.dry_run:
+                    for _ in deduped:
+                        pass
+                else:
+                    write_rewritten_sheet(zin, tmp_path, part["path"], adjusted_head(), deduped,
+                                          info["first"], tail, adjust)
+            
+            if not decide_first:
+                # The row each key was first seen on is only needed for the report
+                seen = {} if removed is not None else set()
+                
+                def single_pass():
+                    nonlocal decided
+                    for number, data in rows:
+                        stats["rows"] += 1
+                        decided = number
+                        key = row_key(data)
+                        if key is not None:
+                            fp = fingerprint(key)
+                            if fp in seen:
+                                drop(number, seen[fp] if removed is not None else 0)
+                                yield number, None
+                                continue
+                            if removed is not None:
+                                seen[fp] = number
+                            else:
+                                seen.add(fp)
+                        yield number, data
+                
+                passes += 1
+                try:
+                    write(single_pass())
+                except UndecidedRows:
+                    decide_first = True
+                    seen = None
+                    src.close()
+                    del gone[:]
+                    if removed is not None:
+                        removed.clear()
+                    stats["rows"] = 0
+                    src = zin.open(part["path"])
+                    rows = scan_sheet_rows(src, header, info)
+            
+            if decide_first:
+                prints, numbers = array("Q"), array("I")
+                seen, dups = set(), set()
+                for number, data in rows:
+                    key = row_key(data)
+                    fp = fingerprint(key) if key is not None else 0
+                    if fp in seen:
+                        dups.add(fp)
+                    elif fp:
+                        seen.add(fp)
+                    prints.append(fp)
+                    numbers.append(number)
+                src.close()
+                seen = None
+                passes += 1
+                stats["rows"] = len(prints)
+                
+                # With --verify, only rows with the exact key of their group's
+                # first row count as its duplicates
+                matched = None
+                if args.verify and dups:
+                    matched, exact = bytearray(len(prints)), {}
+                    with zin.open(part["path"]) as again:
+                        for i, (number, data) in enumerate(scan_sheet_rows(again, header, {})):
+                            fp = prints[i]
+                            if fp not in dups:
+                                continue
+                            if exact.setdefault(fp, key := row_key(data)) == key:
+                                matched[i] = 1
+                            else:
+                                stats["collisions"] += 1
+                    passes += 1
+                
+                kept = {}   # duplicated fingerprint -> index of the row kept for it
+                for i, fp in enumerate(prints):
+                    if fp in dups and (matched is None or matched[i]):
+                        if args.keep == "last" or fp not in kept:
+                            kept[fp] = i
+                for i, fp in enumerate(prints):
+                    if fp in dups and (matched is None or matched[i]) and kept[fp] != i:
+                        drop(numbers[i], numbers[kept[fp]])
+                decided = EXCEL_MAX_ROWS
+                
+                def deduped():
+                    at = 0
+                    with zin.open(part["path"]) as again:
+                        for number, data in scan_sheet_rows(again, header, {}):
+                            if at < len(gone) and gone[at] == number:
+                                at += 1
+                                yield number, None
+                            else:
+                                yield number, data
+                
+                if not args.dry_run:
+                    write(deduped())
+                    passes += 1
+            src.close()
+            stats["duplicates"] = len(gone)
+        
+        report_rows = None
+        if args.report:
+            report_rows = write_dedupe_report(args.file, part["name"], info["first"], removed, header, args.report)
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile, ET.ParseError) as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        fail(f"Failed to dedupe: {e}")
+    if not args.dry_run:
+        os.replace(tmp_path, target)
+        if _workbook_cache is not None:
+            _workbook_cache.discard(os.path.abspath(target))
+    
+    result = {
+        "file": args.file,
+        "sheet": part["name"],
+        "key": labels or "all columns",
+        "keep": args.keep,
+        "rows": stats["rows"],
+        "duplicates": stats["duplicates"],
+        "kept": stats["rows"] - stats["duplicates"],
+        "passes": passes,
+        "ms": round((time.perf_counter() - started) * 1000, 3),
+    }
+    if args.verify:
+        result["collisions"] = stats["collisions"]
+    if args.dry_run:
+        result["dry_run"] = True
+    elif args.output:
+        result["output"] = args.output
+    if args.report:
+        result["report"] = args.report
+        result["report_rows"] = report_rows
+    ok(result)
+
+
+# ============================================================================
+# Diff
+# ============================================================================
+#
+# diff keeps only a key -> (row, hash) index of the old sheet, streams the new
+# sheet against it (holding on to just the rows that differ), then makes a
+# second pass over the old sheet for the old values of changed and removed
+# rows. Memory is bounded by the key index plus the changes, never by the
+# whole sheet.
+
+ROW_HASH_SIZE = 8
+
+
+def row_hash(values: tuple) -> bytes:
+    return hashlib.blake2b(repr(values).encode("utf-8"), digest_size=ROW_HASH_SIZE).digest()
+
+
+def project(row: tuple, indexes: list) -> tuple:
+    """Pick columns out of a (possibly short) row."""
+    width = len(row)
+    return tuple(row[i] if i < width else None for i in indexes)
+
+
+def diff_columns(ws, header: bool) -> list:
+    """Column names of a sheet: its header row, or column letters."""
+    if header:
+        first = next(ws.iter_rows(min_row=1, max_row=1, values_only=True), ())
+        return column_names(list(first), len(first))
+    return [get_column_letter(i) for i in range(1, (ws.max_column or 0) + 1)]
+
+
+def resolve_key_columns(spec: Optional[str], names_a: list, names_b: list) -> Optional[list]:
+    """Key column names from "id", "A" or "id,region"; None for positional diff."""
+    if not spec:
+        return None
+    keys = []
+    for part in (p.strip() for p in spec.split(",")):
+        index = resolve_column(part, names_a)
+        name = names_a[index] if index is not None else None
+        if name is None or name not in names_b:
+            fail(f"Key column '{part}' not found in both sheets",
+                 {"columns_a": names_a, "columns_b": names_b})
+        keys.append(name)
+    return keys
+
+
+def iter_keyed_rows(ws, start_row: int, key_indexes: Optional[list]):
+    """Yield (row number, key, row) for the non-blank data rows of a sheet."""
+    for row_no, row in enumerate(ws.iter_rows(min_row=start_row, values_only=True), start=start_row):
+        if all(value is None for value in row):
+            continue
+        key = project(row, key_indexes) if key_indexes is not None else (row_no,)
+        yield row_no, key, row
+
+
+def diff_key(key: tuple):
+    return key[0] if len(key) == 1 else list(key)
+
+
+def cmd_diff(args):
+    """Compare two sheets row by row, matching rows by key column."""
+    require_openpyxl()
+    header = not args.no_header
+    start_row = 2 if header else 1
+    
+    try:
+        wb_a = open_workbook(args.file_a, read_only=True, data_only=args.values)
+        wb_b = open_workbook(args.file_b, read_only=True, data_only=args.values)
+    except Exception as e:
+        fail(f"Failed to open file: {e}")
+    ws_a = get_sheet(wb_a, args.sheet)
+    ws_b = get_sheet(wb_b, args.sheet_b or args.sheet)
+    
+    names_a, names_b = diff_columns(ws_a, header), diff_columns(ws_b, header)
+    if not header:
+        width = max(len(names_a), len(names_b))
+        names_a = names_b = [get_column_letter(i) for i in range(1, width + 1)]
+    keys = resolve_key_columns(args.key, names_a, names_b)
+    key_a = [names_a.index(k) for k in keys] if keys else None
+    key_b = [names_b.index(k) for k in keys] if keys else None
+    
+    # Rows are compared on the columns both sides share, so reordering or
+    # adding columns does not mark every row as changed.
+    common = [name for name in names_b if name in set(names_a)]
+    cols_a = [names_a.index(name) for name in common]
+    cols_b = [names_b.index(name) for name in common]
+    
+    # Pass 1: key index of the old sheet, then classify the new sheet's rows
+    index = {}
+    duplicates = []
+    for row_no, key, row in iter_keyed_rows(ws_a, start_row, key_a):
+        if key in index:
+            duplicates.append({"file": args.file_a, "key": diff_key(key), "row": row_no})
+        else:
+            index[key] = (row_no, row_hash(project(row, cols_a)))
+    
+    # New-side rows are kept only when they differ, so the new sheet is read once
+    changed, added, seen = {}, {}, set()
+    for row_no, key, row in iter_keyed_rows(ws_b, start_row, key_b):
+        if key in seen:
+            duplicates.append({"file": args.file_b, "key": diff_key(key), "row": row_no})
+            continue
+        seen.add(key)
+        old = index.pop(key, None)
+        if old is None:
+            added[row_no] = (key, row)
+        elif old[1] != row_hash(project(row, cols_b)):
+            changed[row_no] = (key, old[0], row)
+    if duplicates:
+        fail("Key is not unique; choose another --key", {"duplicates": duplicates[:20]})
+    removed = {row_no: key for key, (row_no, _) in index.items()}
+    del index, seen
+    
+    # Pass 2: fetch old values for changed and removed rows
+    wanted_a = set(removed) | {row_a for _, row_a, _ in changed.values()}
+    old_rows = {}
+    if wanted_a:
+        rows = ws_a.iter_rows(min_row=start_row, max_row=max(wanted_a), values_only=True)
+        for row_no, row in enumerate(rows, start=start_row):
+            if row_no in wanted_a:
+                old_rows[row_no] = row
+    
+    summary = {"added": 0, "removed": 0, "changed": 0, "cells_changed": 0}
+    
+    def changes():
+        for row_no in sorted(set(added) | set(changed)):
+            if row_no in added:
+                key, row = added.pop(row_no)
+                summary["added"] += 1
+                values = dict(zip(names_b, project(row, range(len(names_b)))))
+                entry = {"type": "added", "key": diff_key(key), "row_b": row_no, "values": values}
+                types = {name: diff_type(value) for name, value in values.items() if diff_type(value)}
+                if types:
+                    entry["types"] = types
+                yield entry
+                continue
+            key, row_a, row = changed.pop(row_no)
+            old_row = old_rows.pop(row_a)
+            cells = []
+            for name, i_a, i_b in zip(common, cols_a, cols_b):
+                old, new = project(old_row, [i_a])[0], project(row, [i_b])[0]
+                if old != new:
+                    cell = {
+                        "column": name,
+                        "cell_a": coords_to_cell(row_a, i_a + 1),
+                        "cell_b": coords_to_cell(row_no, i_b + 1),
+                        "old": old,
+                        "new": new,
+                    }
+                    if diff_type(new):
+                        cell["new_type"] = diff_type(new)
+                    cells.append(cell)
+            if cells:  # the hash also differs for equal values like 1 and 1.0
+                summary["changed"] += 1
+                summary["cells_changed"] += len(cells)
+                yield {"type": "changed", "key": diff_key(key), "row_a": row_a, "row_b": row_no,
+                       "cells": cells}
+        for row_no in sorted(removed):
+            summary["removed"] += 1
+            yield {"type": "removed", "key": diff_key(removed[row_no]), "row_a": row_no,
+                   "values": dict(zip(names_a, project(old_rows[row_no], range(len(names_a)))))}
+    
+    write_ok_stream(
+        {
+            "file_a": args.file_a,
+            "file_b": args.file_b,
+            "sheet_a": ws_a.title,
+            "sheet_b": ws_b.title,
+            "header": header,
+            "key": keys,
+            "columns": {
+                "added": [name for name in names_b if name not in names_a],
+                "removed": [name for name in names_a if name not in names_b],
+            },
+        },
+        "changes", changes(), sys.stdout, trailer=lambda: {"summary": summary},
+    )
+    wb_a.close()
+    wb_b.close()
+
+
+# Cell value types that diff JSON can only hold as text, by the name diff
+# records next to them; datetime comes before its base class date
+DIFF_TEXT_TYPES = {"datetime": datetime, "date": date, "time": dt_time}
+
+
+def diff_type(value) -> Optional[str]:
+    """Name of a value's type if JSON carries it as text, else None."""
+    for name, cls in DIFF_TEXT_TYPES.items():
+        if isinstance(value, cls):
+            return name
+    return None
+
+
+def diff_value(value, kind: Optional[str] = None):
+    """Turn a value from diff JSON back into a cell value, given the type diff
+    recorded for it; text that merely looks like a date stays text."""
+    if kind not in DIFF_TEXT_TYPES or not isinstance(value, str):
+        return value
+    try:
+        return DIFF_TEXT_TYPES[kind].fromisoformat(value)
+    except ValueError:
+        return value
+
+
+def json_value(value):
+    """A cell value as it appears in diff JSON."""
+    return json.loads(json.dumps(value, default=str))
+
+
+def op_apply_diff(wb, args) -> dict:
+    """Apply the changes from `diff` output, touching only the cells that changed."""
+    source = sys.stdin if args.diff == "-" else open(args.diff, 'r', encoding='utf-8')
+    with source:
+        diff = json.load(source)
+    if "changes" not in diff:
+        fail("Not a diff file: no 'changes'")
+    
+    sheet = args.sheet or (diff.get("sheet_a") if diff.get("sheet_a") in wb.sheetnames else None)
+    ws = get_sheet(wb, sheet)
+    header = diff.get("header", True)
+    if header:
+        first = [cell.value for cell in ws[1]] if ws.max_row >= 1 else []
+        columns = {name: i + 1 for i, name in enumerate(column_names(first, len(first)))}
+    else:
+        columns = None
+    
+    def column_of(name: str) -> Optional[int]:
+        if columns is None:
+            return column_index_from_string(name)
+        return columns.get(name)
+    
+    changed = [c for c in diff["changes"] if c["type"] == "changed"]
+    removed = [c for c in diff["changes"] if c["type"] == "removed"]
+    added = [c for c in diff["changes"] if c["type"] == "added"]
+    
+    # Check every precondition before touching the sheet
+    conflicts = []
+    for change in changed:
+        for cell in change["cells"]:
+            col = column_of(cell["column"])
+            current = json_value(ws.cell(row=change["row_a"], column=col).value) if col else None
+            if col is None or current != cell["old"]:
+                conflicts.append({"cell": coords_to_cell(change["row_a"], col) if col else None,
+                                  "column": cell["column"], "expected": cell["old"], "found": current})
+    for change in removed:
+        for name, value in change["values"].items():
+            col = column_of(name)
+            current = json_value(ws.cell(row=change["row_a"], column=col).value) if col else None
+            if current != value:
+                conflicts.append({"row": change["row_a"], "column": name, "expected": value, "found": current})
+                break
+    if conflicts and not args.force:
+        fail("Diff does not apply cleanly; use --force to apply anyway",
+             {"conflicts": conflicts[:20], "conflict_count": len(conflicts)})
+    
+    cells_updated = 0
+    for change in changed:
+        for cell in change["cells"]:
+            col = column_of(cell["column"])
+            if col:
+                ws.cell(row=change["row_a"], column=col, value=diff_value(cell["new"], cell.get("new_type")))
+                cells_updated += 1
+    
+    # Delete removed rows bottom-up, one delete_rows call per contiguous run
+    rows = sorted({change["row_a"] for change in removed}, reverse=True)
+    i = 0
+    while i < len(rows):
+        j = i
+        while j + 1 < len(rows) and rows[j + 1] == rows[j] - 1:
+            j += 1
+        ws.delete_rows(rows[j], j - i + 1)
+        i = j + 1
+    
+    columns_added = []
+    next_row = ws.max_row + 1 if ws.max_row > 1 or ws.cell(row=1, column=1).value is not None else 1
+    for change in added:
+        types = change.get("types", {})
+        for name, value in change["values"].items():
+            col = column_of(name)
+            if col is None:
+                col = len(columns) + 1
+                columns[name] = col
+                ws.cell(row=1, column=col, value=name)
+                columns_added.append(name)
+            if value is not None:
+                ws.cell(row=next_row, column=col, value=diff_value(value, types.get(name)))
+        next_row += 1
+    
+    return {
+        "sheet": ws.title,
+        "cells_updated": cells_updated,
+        "rows_deleted": len(rows),
+        "rows_added": len(added),
+        "columns_added": columns_added,
+        "conflicts": len(conflicts),
+    }
+
+
+# ============================================================================
+# Join
+# ============================================================================
+#
+# join matches rows of two sheets on key columns like an exact-match VLOOKUP:
+# text keys compare case-insensitively, and 1 matches 1.0. The side with
+# fewer rows is loaded into a key -> rows hash index and the other side is
+# streamed past it, so memory is bounded by the smaller sheet. Joined rows go
+# straight to a write-only workbook (or the JSON output) as they are made.
+# When the left sheet is the indexed one, its matches are held until the
+# right sheet has been read, so output follows the left sheet's order.
+
+JOIN_TYPES = ("left", "inner", "anti")
+
+
+def join_key(values: tuple) -> Optional[tuple]:
+    """Hashable match key for key cell values; None if any of them is blank."""
+    if any(value is None or value == "" for value in values):
+        return None
+    return tuple(compare_key(value) for value in values)
+
+
+def resolve_join_keys(spec: str, names_left: list, names_right: list) -> tuple:
+    """Key column indexes on each side from "id", "id,region" or "CustID=ID"."""
+    left, right = [], []
+    for part in (p.strip() for p in spec.split(",") if p.strip()):
+        name_left, _, name_right = part.partition("=")
+        index_left = resolve_column(name_left, names_left)
+        index_right = resolve_column(name_right or name_left, names_right)
+        if index_left is None or index_right is None:
+            fail(f"--on: column '{part}' not found on both sides",
+                 {"left_columns": names_left, "right_columns": names_right})
+        left.append(index_left)
+        right.append(index_right)
+    if not left:
+        fail("--on needs at least one key column")
+    return left, right
+
+
+def stored_rows(ws) -> Optional[int]:
+    """Row count from the sheet's stored dimension, if it has one."""
+    try:
+        return ws.max_row or None
+    except Exception:
+        return None
+
+
+def left_is_smaller(ws_left, left_path: str, ws_right, right_path: str) -> bool:
+    """Whether to index the left sheet: compares stored row counts when both
+    sheets have one, else file sizes, so both sides use the same measure."""
+    left_rows, right_rows = stored_rows(ws_left), stored_rows(ws_right)
+    if left_rows and right_rows:
+        return left_rows < right_rows
+    return os.path.getsize(left_path) < os.path.getsize(right_path)
+
+
+def join_rows(left, right, left_keys: list, right_keys: list, extra: list,
+              how: str, index_left: bool, stats: dict):
+    """Yield joined rows from two row iterators, the left padded to its
+    header width. Counts go into `stats` as rows are produced."""
+    width = len(extra)
+    if not index_left:
+        index = {}
+        for row in right:
+            stats["right_rows"] += 1
+            key = join_key(project(row, right_keys))
+            if key is not None:
+                index.setdefault(key, []).append(project(row, extra))
+        stats["index_keys"] = len(index)
+        for row in left:
+            stats["left_rows"] += 1
+            key = join_key(project(row, left_keys))
+            matches = index.get(key) if key is not None else None
+            if matches:
+                stats["matched"] += 1
+                if how != "anti":
+                    for other in matches:
+                        stats["output_rows"] += 1
+                        yield row + other
+            else:
+                stats["unmatched"] += 1
+                if how != "inner":
+                    stats["output_rows"] += 1
+                    yield row + (None,) * width if how == "left" else row
+        return
+    
+    rows, index = [], {}
+    for row in left:
+        key = join_key(project(row, left_keys))
+        if key is not None:
+            index.setdefault(key, []).append(len(rows))
+        rows.append(row)
+    stats["left_rows"] = len(rows)
+    stats["index_keys"] = len(index)
+    # Matches are held per left row until the right side is read, so rows
+    # come out in the left sheet's order either way
+    matched = bytearray(len(rows))
+    found = {}      # left row position -> right values matched to it
+    for row in right:
+        stats["right_rows"] += 1
+        key = join_key(project(row, right_keys))
+        for position in index.get(key, ()) if key is not None else ():
+            matched[position] = 1
+            if how != "anti":
+                found.setdefault(position, []).append(project(row, extra))
+    stats["matched"] = sum(matched)
+    stats["unmatched"] = len(rows) - stats["matched"]
+    for position, row in enumerate(rows):
+        if matched[position]:
+            for other in found.pop(position, ()):
+                stats["output_rows"] += 1
+                yield row + other
+        elif how != "inner":
+            stats["output_rows"] += 1
+            yield row + (None,) * width if how == "left" else row
+
+
+def cmd_join(args):
+    """Join two sheets on key columns, hashing the smaller one and streaming the other."""
+    require_openpyxl()
+    header = not args.no_header
+    start_row = 2 if header else 1
+    
+    try:
+        wb_left = open_workbook(args.left, read_only=True, data_only=True)
+        wb_right = open_workbook(args.right, read_only=True, data_only=True)
+    except Exception as e:
+        fail(f"Failed to open file: {e}")
+    ws_left = get_sheet(wb_left, args.sheet)
+    ws_right = get_sheet(wb_right, args.right_sheet or args.sheet)
+    
+    names_left, names_right = diff_columns(ws_left, header), diff_columns(ws_right, header)
+    left_keys, right_keys = resolve_join_keys(args.on, names_left, names_right)
+    extra = [i for i in range(len(names_right)) if i not in right_keys] if args.how != "anti" else []
+    columns = column_names(names_left + [names_right[i] for i in extra], len(names_left) + len(extra))
+    index_left = {"left": True, "right": False}.get(
+        args.index, left_is_smaller(ws_left, args.left, ws_right, args.right))
+    
+    width = len(names_left)
+    left = (row + (None,) * (width - len(row)) if len(row) < width else row[:width]
+            for _, _, row in iter_keyed_rows(ws_left, start_row, None))
+    right = (row for _, _, row in iter_keyed_rows(ws_right, start_row, None))
+    stats = {"left_rows": 0, "right_rows": 0, "matched": 0, "unmatched": 0, "output_rows": 0}
+    started = time.perf_counter()
+    rows = join_rows(left, right, left_keys, right_keys, extra, args.how, index_left, stats)
+    
+    summary = {
+        "left": args.left,
+        "right": args.right,
+        "how": args.how,
+        "on": [[names_left[l], names_right[r]] if names_left[l] != names_right[r] else names_left[l]
+               for l, r in zip(left_keys, right_keys)],
+        "indexed": "left" if index_left else "right",
+    }
+    
+    def trailer() -> dict:
+        return {**stats, "ms": round((time.perf_counter() - started) * 1000, 3)}
+    
+    if not args.output:
+        write_ok_stream({**summary, "columns": columns}, "data", rows, sys.stdout, trailer)
+        return
+    
+    wb = Workbook(write_only=True)
+    writer = StreamingSheetWriter(wb, ws_left.title, repeat_header=header)
+    if header:
+        writer.append(columns)
+    writer.extend(rows)
+    save_workbook(wb, args.output)
+    result = {**summary, "output": args.output, **writer.summary(), "columns": columns, **trailer()}
+    result.pop("rows")
+    ok(result)
+
+
+# ============================================================================
+# Query
+# ============================================================================
+#
+# `query` runs SQL over sheets loaded into SQLite, one table per sheet named
+# after it, with columns named from the header row. Only sheets the SQL refers
+# to are loaded. The database lives in the cache directory under the file's
+# content hash, so later queries on an unchanged file skip loading entirely.
+
+QUERY_CACHE_VERSION = 1
+
+
+def sql_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def sql_column_names(header: Optional[list], width: int) -> list:
+    """Column names for a table; unique ignoring case, as SQLite requires."""
+    names, seen = [], set()
+    for base in column_names(header, width):
+        name, n = base, 2
+        while name.lower() in seen:
+            name = f"{base}_{n}"
+            n += 1
+        seen.add(name.lower())
+        names.append(name)
+    return names
+
+
+def sql_value(value):
+    """SQLite-storable cell value; dates become ISO text so date functions work."""
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    if isinstance(value, (datetime, date, dt_time)):
+        return value.isoformat(sep=" ") if isinstance(value, datetime) else value.isoformat()
+    return str(value)
+
+
+def referenced_sheets(sql: str, sheetnames: list) -> list:
+    """Sheets whose names appear in the SQL as an identifier (bare or quoted)."""
+    tokens = set()
+    for quoted, bracketed, backticked, bare in re.findall(
+            r'"((?:[^"]|"")*)"|\[([^\]]*)\]|`([^`]*)`|([A-Za-z_][\w$]*)', sql):
+        tokens.add((quoted.replace('""', '"') or bracketed or backticked or bare).lower())
+    return [name for name in sheetnames if name.lower() in tokens]
+
+
+def load_sheet_table(conn, ws, header: bool, chunk_size: int) -> int:
+    """Bulk-insert a sheet into a new table; returns rows loaded."""
+    rows = ws.iter_rows(values_only=True)
+    first = next(rows, None)
+    width = max(len(first) if first else 0, ws.max_column or 0, 1)
+    names = sql_column_names(list(first) if header and first else None, width)
+    if first is not None and not header:
+        rows = iter_chain([first], rows)
+    
+    table = sql_identifier(ws.title)
+    conn.execute(f"DROP TABLE IF EXISTS {table}")
+    conn.execute(f"CREATE TABLE {table} ({', '.join(sql_identifier(n) for n in names)})")
+    insert = f"INSERT INTO {table} VALUES ({', '.join('?' * width)})"
+    
+    count = 0
+    for chunk in chunked(rows, chunk_size):
+        batch = []
+        for row in chunk:
+            values = [sql_value(v) for v in row[:width]]
+            if len(values) < width:
+                values.extend([None] * (width - len(values)))
+            batch.append(values)
+        conn.executemany(insert, batch)
+        count += len(batch)
+    conn.execute("INSERT OR REPLACE INTO _excel_tables VALUES (?, ?)", (ws.title, count))
+    return count
+
+
+def prepare_query_db(args):
+    """Open the query database and load the sheets the SQL needs.
+
+    Returns (connection, per-table load status, workbook sheet names).
+    """
+    import sqlite3
+    header = not args.no_header
+    
+    if args.no_cache:
+        conn = sqlite3.connect(":memory:", isolation_level=None)
+    else:
+        digest = file_digest(args.file)
+        db_path = cache_dir() / "query" / f"{digest}-v{QUERY_CACHE_VERSION}{'' if header else '-noheader'}.sqlite"
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(db_path), timeout=60, isolation_level=None)
+        conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("CREATE TABLE IF NOT EXISTS _excel_sheets (name TEXT PRIMARY KEY, position INTEGER)")
+    conn.execute("CREATE TABLE IF NOT EXISTS _excel_tables (name TEXT PRIMARY KEY, rows INTEGER)")
+    
+    wb = None
+    sheetnames = [r[0] for r in conn.execute("SELECT name FROM _excel_sheets ORDER BY position")]
+    if not sheetnames:
+        wb = open_workbook(args.file, read_only=True, data_only=True)
+        sheetnames = [ws.title for ws in wb.worksheets]
+        conn.executemany("INSERT OR IGNORE INTO _excel_sheets VALUES (?, ?)",
+                         [(name, i) for i, name in enumerate(sheetnames)])
+    
+    status = {}
+    for name in referenced_sheets(args.sql, sheetnames):
+        loaded = conn.execute("SELECT 1 FROM _excel_tables WHERE name = ?", (name,)).fetchone()
+        if loaded:
+            status[name] = "cached"
+            continue
+        # Take the write lock, then re-check: another process may have just loaded it
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM _excel_tables WHERE name = ?", (name,)).fetchone():
+                status[name] = "cached"
+            else:
+                if wb is None:
+                    wb = open_workbook(args.file, read_only=True, data_only=True)
+                started = time.perf_counter()
+                rows = load_sheet_table(conn, wb[name], header, args.chunk_size)
+                status[name] = {"loaded": rows, "ms": round((time.perf_counter() - started) * 1000, 3)}
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    if wb is not None:
+        wb.close()
+    
+    if not args.no_cache:
+        conn.execute("PRAGMA query_only=ON")  # queries must not alter the shared cache
+    return conn, status, sheetnames
+
+
+def cmd_query(args):
+    """Run SQL over sheets loaded into SQLite."""
+    require_openpyxl()
+    import sqlite3
+    
+    conn, tables, sheetnames = prepare_query_db(args)
+    try:
+        cursor = conn.execute(args.sql)
+    except sqlite3.Error as e:
+        fail(f"Query failed: {e}", {"tables": sheetnames})
+    columns = [d[0] for d in cursor.description] if cursor.description else []
+    rows = (list(row) for row in cursor)
+    
+    if args.format == "csv":
+        write_csv_stream(iter_chain([columns], rows), sys.stdout, args.chunk_size)
+    elif args.format == "ndjson":
+        write_ndjson_stream((dict(zip(columns, row)) for row in rows), sys.stdout, args.chunk_size)
+    elif args.format == "markdown":
+        write_markdown_stream(iter_chain([columns], rows), sys.stdout, chunk_size=args.chunk_size)
+    else:  # json
+        stats = {"rows": 0, "columns": 0}
+        write_ok_stream(
+            {"query": args.sql, "tables": tables, "columns": columns},
+            "data", count_rows(rows, stats), sys.stdout,
+            trailer=lambda: {"rows": stats["rows"]}, chunk_size=args.chunk_size,
+        )
+    conn.close()
+
+
+# ============================================================================
+# Aggregate
+# ============================================================================
+#
+# aggregate reads the sheet once and folds each row into a per-group state
+# list, so memory grows with the number of groups, not rows.
+
+AGGREGATES = ("sum", "mean", "min", "max")
+
+
+def aggregate_columns(args, names: list) -> tuple:
+    """Resolve --group-by and the aggregate options to (group indexes, [(kind, index, name)])."""
+    def resolve(spec: str, option: str) -> list:
+        found = []
+        for part in (p.strip() for p in spec.split(",") if p.strip()):
+            index = resolve_column(part, names)
+            if index is None:
+                fail(f"{option}: column '{part}' not found", {"columns": names})
+            found.append(index)
+        return found
+    
+    groups = resolve(args.group_by, "--group-by") if args.group_by else []
+    measures = []
+    for kind in AGGREGATES:
+        spec = getattr(args, kind)
+        if spec:
+            measures.extend((kind, index, names[index]) for index in resolve(spec, f"--{kind}"))
+    if not measures and not args.count:
+        fail("Nothing to compute: give --count and/or --sum/--mean/--min/--max")
+    return groups, measures
+
+
+def aggregate_value(value):
+    """Comparable numeric form of a cell value, or None if it isn't numeric."""
+    if is_number(value):
+        return value
+    if isinstance(value, (datetime, date)):
+        return to_excel(value)
+    return None
+
+
+def compare_key(value) -> tuple:
+    """Sort key that orders mixed cell values like Excel: numbers, text, logicals, blanks."""
+    if value is None:
+        return (3, 0)
+    if isinstance(value, (datetime, date, dt_time)):
+        return (0, to_excel(value))
+    rank = value_rank(value)
+    return (rank, value.lower() if rank == 1 else value)
+
+
+def aggregate_rows(rows, groups: list, measures: list) -> tuple:
+    """Fold rows into {group key: [row count, per-measure state...]}; returns (table, rows read)."""
+    table = {}
+    count = 0
+    width = 1 + len(measures)
+    for row in rows:
+        count += 1
+        key = tuple(row[i] if i < len(row) else None for i in groups)
+        state = table.get(key)
+        if state is None:
+            state = table[key] = [0] + [None] * len(measures)
+            for m, (kind, _, _) in enumerate(measures, start=1):
+                state[m] = [0, 0] if kind in ("sum", "mean") else None
+        state[0] += 1
+        for m in range(1, width):
+            kind, index, _ = measures[m - 1]
+            value = row[index] if index < len(row) else None
+            number = aggregate_value(value)
+            if number is None:
+                continue
+            if kind in ("sum", "mean"):
+                acc = state[m]
+                acc[0] += number
+                acc[1] += 1
+            elif state[m] is None or (number < state[m][0] if kind == "min" else number > state[m][0]):
+                state[m] = (number, value)
+    return table, count
+
+
+def aggregate_result(key: tuple, state: list, measures: list, with_count: bool) -> list:
+    row = list(key)
+    if with_count:
+        row.append(state[0])
+    for m, (kind, _, _) in enumerate(measures, start=1):
+        acc = state[m]
+        if kind == "sum":
+            row.append(acc[0])
+        elif kind == "mean":
+            row.append(acc[0] / acc[1] if acc[1] else None)
+        else:
+            row.append(acc[1] if acc is not None else None)
+    return row
+
+
+def cmd_aggregate(args):
+    """Group rows and compute counts/sums/means/mins/maxes in a single pass."""
+    require_openpyxl()
+    header = not args.no_header
+    
+    try:
+        wb = open_workbook(args.file, read_only=True, data_only=True)
+    except Exception as e:
+        fail(f"Failed to open file: {e}")
+    ws = get_sheet(wb, args.sheet)
+    source_sheet = ws.title
+    if args.out and not args.output and args.out.lower() == source_sheet.lower():
+        wb.close()
+        fail(f"--out '{args.out}' is the sheet being aggregated; choose another sheet or --output")
+    
+    rows = ws.iter_rows(values_only=True)
+    first = next(rows, None)
+    width = max(len(first) if first else 0, ws.max_column or 0)
+    names = column_names(list(first) if header and first else None, width)
+    if first is not None and not header:
+        rows = iter_chain([first], rows)
+    groups, measures = aggregate_columns(args, names)
+    
+    started = time.perf_counter()
+    table, rows_read = aggregate_rows(rows, groups, measures)
+    wb.close()
+    
+    columns = [names[i] for i in groups]
+    if args.count:
+        columns.append("count")
+    columns.extend(f"{kind}_{name}" for kind, _, name in measures)
+    results = (aggregate_result(key, state, measures, args.count) for key, state in table.items())
+    if args.sort:
+        results = iter(sorted(results, key=lambda r: [compare_key(v) for v in r[:len(groups)]]))
+    
+    summary = {
+        "source": args.file,
+        "sheet": source_sheet,
+        "group_by": [names[i] for i in groups],
+        "rows_read": rows_read,
+        "groups": len(table),
+        "ms": round((time.perf_counter() - started) * 1000, 3),
+    }
+    
+    if not args.out and not args.output:
+        write_ok_stream({**summary, "columns": columns}, "data", results, sys.stdout)
+        return
+    
+    title = args.out or "Summary"
+    if args.output:
+        out_wb = Workbook(write_only=True)
+        out_ws = out_wb.create_sheet(title=title)
+        target = args.output
+    else:
+        out_wb = open_workbook(args.file)
+        replaced = title in out_wb.sheetnames
+        if replaced:
+            index = out_wb.sheetnames.index(title)
+            del out_wb[title]
+            out_ws = out_wb.create_sheet(title=title, index=index)
+        else:
+            out_ws = out_wb.create_sheet(title=title)
+        summary["replaced"] = replaced
+        target = args.file
+    out_ws.append(columns)
+    for row in results:
+        out_ws.append(row)
+    save_workbook(out_wb, target)
+    ok({**summary, "output": target, "output_sheet": title, "columns": columns})
+
+
+# ============================================================================
+# Profile
+# ============================================================================
+#
+# profile makes one pass over each sheet, keeping constant-size state per
+# column: type counts, nulls, min/max, a SpaceSaving top-k sketch, plus a
+# reservoir sample of rows.
+
+DEFAULT_PROFILE_TOP = 5
+DEFAULT_PROFILE_SAMPLE = 5
+# Counters kept by each top-k sketch, per value reported
+TOPK_CAPACITY_FACTOR = 10
+
+
+class SpaceSaving:
+    """Top-k frequent values in bounded memory (Metwally et al.'s SpaceSaving).
+
+    Counts are kept in buckets by count so increments and evictions are O(1).
+    A value that replaced an evicted one inherits its count, recorded as the
+    value's error: its true count lies in [count - error, count].
+    """
+    
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.buckets = {}   # count -> set of values with that count
+        self.min_count = 0
+        self.evictions = 0
+    
+    def add(self, value):
+        count = self.counts.get(value)
+        if count is not None:
+            self._move(value, count, count + 1)
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[value] = 1
+            self.errors[value] = 0
+            self.buckets.setdefault(1, set()).add(value)
+            self.min_count = 1
+            return
+        # Replace a least-frequent value; the newcomer inherits its count
+        count = self.min_count
+        victim = self.buckets[count].pop()
+        del self.counts[victim]
+        del self.errors[victim]
+        self.evictions += 1
+        self.counts[value] = count
+        self.errors[value] = count
+        self.buckets[count].add(value)
+        self._move(value, count, count + 1)
+    
+    def _move(self, value, old: int, new: int):
+        bucket = self.buckets[old]
+        bucket.discard(value)
+        if not bucket:
+            del self.buckets[old]
+            if old == self.min_count:
+                self.min_count = new
+        self.buckets.setdefault(new, set()).add(value)
+        self.counts[value] = new
+    
+    def top(self, k: int) -> list:
+        """[(value, count, error)] ranked by guaranteed count, then estimate."""
+        errors = self.errors
+        ranked = sorted(self.counts.items(), key=lambda item: (errors[item[0]] - item[1], -item[1]))
+        return [(value, count, errors[value]) for value, count in ranked[:k]]
+
+
+class ColumnProfile:
+    """Streaming statistics for one column."""
+    
+    __slots__ = ("name", "kinds", "nulls", "ranges", "max_length", "topk")
+    
+    def __init__(self, name: str, top: int):
+        self.name = name
+        self.kinds = {}
+        self.nulls = 0      # filled in from the row count once the sheet is read
+        self.ranges = {}    # "number" / "timestamp" -> [min, max]
+        self.max_length = 0
+        self.topk = SpaceSaving(max(top * TOPK_CAPACITY_FACTOR, 100))
+    
+    def add(self, value):
+        if value is None or value == "":
+            return
+        kind = value_kind(value)
+        self.kinds[kind] = self.kinds.get(kind, 0) + 1
+        if kind in ("int", "float", "timestamp"):
+            family = "timestamp" if kind == "timestamp" else "number"
+            if family == "timestamp" and not isinstance(value, datetime):
+                value = datetime(value.year, value.month, value.day)
+            bounds = self.ranges.get(family)
+            if bounds is None:
+                self.ranges[family] = [value, value]
+            elif value < bounds[0]:
+                bounds[0] = value
+            elif value > bounds[1]:
+                bounds[1] = value
+        elif kind == "string":
+            if not isinstance(value, str):
+                value = str(value)
+            if len(value) > self.max_length:
+                self.max_length = len(value)
+        self.topk.add(value)
+    
+    def summary(self, rows: int, top: int) -> dict:
+        column_type = infer_column_type(set(self.kinds)) if self.kinds else "empty"
+        result = {
+            "name": self.name,
+            "type": column_type,
+            "nulls": self.nulls,
+            "null_rate": round(self.nulls / rows, 4) if rows else 0,
+        }
+        if len(self.kinds) > 1:
+            result["kinds"] = self.kinds
+        family = {"int": "number", "float": "number", "timestamp": "timestamp"}.get(column_type)
+        if family in self.ranges:
+            result["min"], result["max"] = self.ranges[family]
+        if "string" in self.kinds:
+            result["max_length"] = self.max_length
+        if self.topk.evictions:
+            # Approximate: [value, estimated count, maximum overcount]
+            result["top"] = [list(entry) for entry in self.topk.top(top)]
+            result["top_exact"] = False
+        else:
+            result["distinct"] = len(self.topk.counts)
+            result["top"] = [[value, count] for value, count, _ in self.topk.top(top)]
+            result["top_exact"] = True
+        return result
+
+
+def profile_sheet(ws, header: bool, top: int, sample_size: int, rng) -> dict:
+    """Profile one sheet in a single pass."""
+    rows = ws.iter_rows(values_only=True)
+    first = next(rows, None) if header else None
+    header_names = list(first) if first else None
+    start_row = 2 if header else 1
+    
+    columns = []
+    sample = []
+    count = blank = 0
+    for row_no, row in enumerate(rows, start=start_row):
+        if all(value is None for value in row):
+            blank += 1
+            continue
+        while len(columns) < len(row):
+            names = column_names(header_names, len(columns) + 1)
+            columns.append(ColumnProfile(names[-1], top))
+        for column, value in zip(columns, row):
+            column.add(value)
+        
+        # Reservoir sampling (Algorithm R)
+        if count < sample_size:
+            sample.append((row_no, row))
+        else:
+            j = rng.randint(0, count)
+            if j < sample_size:
+                sample[j] = (row_no, row)
+        count += 1
+    
+    if header_names and len(header_names) > len(columns):
+        names = column_names(header_names, len(header_names))
+        columns.extend(ColumnProfile(name, top) for name in names[len(columns):])
+    # Every row a column has no value in is null there, including rows that
+    # ended before the column first appeared
+    for column in columns:
+        column.nulls = count - sum(column.kinds.values())
+    
+    width = len(columns)
+    return {
+        "name": ws.title,
+        "rows": count,
+        "blank_rows": blank,
+        "columns": width,
+        "column_stats": [column.summary(count, top) for column in columns],
+        "sample": [
+            {"row": row_no, "values": list(row) + [None] * (width - len(row))}
+            for row_no, row in sorted(sample, key=lambda item: item[0])
+        ],
+    }
+
+
+def cmd_profile(args):
+    """Summarise each sheet's shape and columns in one streaming pass."""
+    import random
+    require_openpyxl()
+    
+    try:
+        wb = open_workbook(args.file, read_only=True, data_only=True)
+    except Exception as e:
+        fail(f"Failed to open file: {e}")
+    sheets = [get_sheet(wb, args.sheet)] if args.sheet else wb.worksheets
+    
+    started = time.perf_counter()
+    rng = random.Random(args.seed)
+    profiles = [profile_sheet(ws, not args.no_header, args.top, args.sample, rng) for ws in sheets]
+    wb.close()
+    
+    ok({
+        "file": args.file,
+        "sheets": profiles,
+        "ms": round((time.perf_counter() - started) * 1000, 3),
+    })
+
+
+# ============================================================================
+# Formula evaluation
+# ============================================================================
+#
+# openpyxl stores formulas but never computes them, and it saves formula cells
+# without cached values, so data_only readers see None. recalc parses formulas
+# with openpyxl's Tokenizer, builds a cell dependency graph and evaluates the
+# common worksheet functions; `edit --recalc` recomputes only the cells
+# downstream of the edit. Formulas it can't evaluate keep the value Excel last
+# cached. save_workbook then writes the results into the file as cached values.
+
+XLSX_MAX_ROW = 1048576
+XLSX_MAX_COL = 16384
+
+# Operations that never change cell values, so pending formula results stay valid
+VALUE_NEUTRAL_OPS = {"format", "resize", "freeze", "merge", "unmerge", "recalc"}
+
+CELL_REF_RE = re.compile(r"^([A-Z]{1,3})(\d+)(?::([A-Z]{1,3})(\d+))?$")
+COLUMN_REF_RE = re.compile(r"^([A-Z]{1,3}):([A-Z]{1,3})$")
+ROW_REF_RE = re.compile(r"^(\d+):(\d+)$")
+CRITERION_RE = re.compile(r"^(<=|>=|<>|<|>|=)?(.*)$", re.S)
+
+BINARY_PRECEDENCE = {
+    "=": 1, "<>": 1, "<": 1, ">": 1, "<=": 1, ">=": 1,
+    "&": 2, "+": 3, "-": 3, "*": 4, "/": 4, "^": 5,
+}
+
+
+class FormulaError(Exception):
+    """A formula that can't be parsed or uses an unsupported function."""
+
+
+class ExcelError:
+    """An Excel error value such as #DIV/0! or #N/A."""
+    
+    __slots__ = ("code",)
+    
+    def __init__(self, code: str):
+        self.code = code
+    
+    def __eq__(self, other):
+        return isinstance(other, ExcelError) and other.code == self.code
+    
+    def __hash__(self):
+        return hash(self.code)
+    
+    def __repr__(self):
+        return self.code
+    
+    __str__ = __repr__
+
+
+ERROR_VALUES = {code: ExcelError(code) for code in
+                ("#DIV/0!", "#N/A", "#VALUE!", "#REF!", "#NAME?", "#NUM!", "#NULL!")}
+DIV0, NA, VALUE, REF, NAME, NUM = (ERROR_VALUES[code] for code in
+                                   ("#DIV/0!", "#N/A", "#VALUE!", "#REF!", "#NAME?", "#NUM!"))
+
+
+class RangeValue:
+    """A rectangular block of cells, read through the evaluator on demand."""
+    
+    def __init__(self, calc, sheet: str, min_row: int, min_col: int, max_row: int, max_col: int):
+        self.calc = calc
+        self.sheet = sheet
+        self.min_row, self.min_col = min_row, min_col
+        self.height = max_row - min_row + 1
+        self.width = max_col - min_col + 1
+    
+    def cell(self, i: int, j: int):
+        """Value at 0-based offset (i, j)."""
+        return self.calc.lookup(self.sheet, self.min_row + i, self.min_col + j)
+    
+    def column(self, j: int) -> list:
+        return [self.cell(i, j) for i in range(self.height)]
+    
+    def row(self, i: int) -> list:
+        return [self.cell(i, j) for j in range(self.width)]
+    
+    def values(self):
+        for i in range(self.height):
+            for j in range(self.width):
+                yield self.cell(i, j)
+    
+    def resized(self, height: int, width: int) -> "RangeValue":
+        return RangeValue(self.calc, self.sheet, self.min_row, self.min_col,
+                          self.min_row + height - 1, self.min_col + width - 1)
+
+
+# ---------------------------------------------------------------------------
+# Parsing
+# ---------------------------------------------------------------------------
+
+def parse_formula(formula: str) -> tuple:
+    """Parse formula text into a tuple tree: ("value", v), ("ref", text),
+    ("func", NAME, [args]), ("op", op, left, right), ("neg", x), ("pct", x)
+    or ("missing",) for an omitted argument."""
+    try:
+        tokens = [t for t in Tokenizer(formula).items if t.type != Token.WSPACE]
+    except Exception as e:
+        raise FormulaError(f"Cannot tokenize formula: {e}")
+    pos = 0
+    
+    def peek():
+        return tokens[pos] if pos < len(tokens) else None
+    
+    def expression(min_precedence: int = 1):
+        nonlocal pos
+        left = unary()
+        while peek() is not None and peek().type == Token.OP_IN:
+            op = peek().value
+            precedence = BINARY_PRECEDENCE.get(op)
+            if precedence is None:
+                raise FormulaError(f"Unsupported operator {op}")
+            if precedence < min_precedence:
+                break
+            pos += 1
+            left = ("op", op, left, expression(precedence + 1))
+        return left
+    
+    def unary():
+        nonlocal pos
+        token = peek()
+        if token is not None and token.type == Token.OP_PRE:
+            pos += 1
+            operand = unary()
+            return ("neg", operand) if token.value == "-" else operand
+        node = primary()
+        while peek() is not None and peek().type == Token.OP_POST:
+            pos += 1
+            node = ("pct", node)
+        return node
+    
+    def primary():
+        nonlocal pos
+        token = peek()
+        if token is None:
+            raise FormulaError("Unexpected end of formula")
+        pos += 1
+        if token.type == Token.OPERAND:
+            if token.subtype == Token.NUMBER:
+                return ("value", int(token.value) if token.value.isdigit() else float(token.value))
+            if token.subtype == Token.TEXT:
+                return ("value", token.value[1:-1].replace('""', '"'))
+            if token.subtype == Token.LOGICAL:
+                return ("value", token.value.upper() == "TRUE")
+            if token.subtype == Token.ERROR:
+                return ("value", ERROR_VALUES.get(token.value.upper(), ExcelError(token.value.upper())))
+            return ("ref", token.value)
+        if token.type == Token.FUNC and token.subtype == Token.OPEN:
+            name = token.value[:-1].upper()
+            for prefix in ("_XLFN.", "_XLWS."):
+                if name.startswith(prefix):
+                    name = name[len(prefix):]
+            args = []
+            if peek() is not None and peek().type == Token.FUNC and peek().subtype == Token.CLOSE:
+                pos += 1
+                return ("func", name, args)
+            while True:
+                nxt = peek()
+                if nxt is not None and (nxt.type == Token.SEP and nxt.subtype == Token.ARG
+                                        or nxt.type == Token.FUNC and nxt.subtype == Token.CLOSE):
+                    args.append(("missing",))
+                else:
+                    args.append(expression())
+                nxt = peek()
+                if nxt is not None and nxt.type == Token.SEP and nxt.subtype == Token.ARG:
+                    pos += 1
+                elif nxt is not None and nxt.type == Token.FUNC and nxt.subtype == Token.CLOSE:
+                    pos += 1
+                    return ("func", name, args)
+                else:
+                    raise FormulaError(f"Malformed arguments to {name}")
+        if token.type == Token.PAREN and token.subtype == Token.OPEN:
+            node = expression()
+            closing = peek()
+            if closing is None or closing.type != Token.PAREN or closing.subtype != Token.CLOSE:
+                raise FormulaError("Unbalanced parentheses")
+            pos += 1
+            return node
+        raise FormulaError(f"Unsupported syntax: {token.value}")
+    
+    tree = expression()
+    if pos != len(tokens):
+        raise FormulaError(f"Unsupported syntax: {tokens[pos].value}")
+    return tree
+
+
+def parse_reference_bounds(ref: str) -> Optional[tuple]:
+    """(min_row, min_col, max_row, max_col) for A1, A1:B2, A:C or 1:3; None otherwise."""
+    ref = ref.replace("$", "").upper()
+    m = CELL_REF_RE.match(ref)
+    if m:
+        c1, r1 = column_index_from_string(m.group(1)), int(m.group(2))
+        if m.group(3):
+            c2, r2 = column_index_from_string(m.group(3)), int(m.group(4))
+        else:
+            c2, r2 = c1, r1
+        return min(r1, r2), min(c1, c2), max(r1, r2), max(c1, c2)
+    m = COLUMN_REF_RE.match(ref)
+    if m:
+        c1, c2 = sorted((column_index_from_string(m.group(1)), column_index_from_string(m.group(2))))
+        return 1, c1, XLSX_MAX_ROW, c2
+    m = ROW_REF_RE.match(ref)
+    if m:
+        r1, r2 = sorted((int(m.group(1)), int(m.group(2))))
+        return r1, 1, r2, XLSX_MAX_COL
+    return None
+
+
+def split_sheet_reference(text: str) -> tuple:
+    """Split "'My Sheet'!A1" into ("My Sheet", "A1"); the sheet is None if absent."""
+    if "!" not in text:
+        return None, text
+    sheet, ref = text.rsplit("!", 1)
+    if len(sheet) >= 2 and sheet[0] == sheet[-1] == "'":
+        sheet = sheet[1:-1].replace("''", "'")
+    return sheet, ref
+
+
+# ---------------------------------------------------------------------------
+# Value coercion (Excel semantics)
+# ---------------------------------------------------------------------------
+
+def to_number(value):
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float, ExcelError)):
+        return value
+    if isinstance(value, (datetime, date, dt_time)):
+        return to_excel(value)
+    if isinstance(value, str):
+        try:
+            return float(value.strip())
+        except ValueError:
+            return VALUE
+    return VALUE
+
+
+def to_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, float):
+        return str(int(value)) if value.is_integer() and abs(value) < 1e15 else format(value, ".15g")
+    if isinstance(value, (datetime, date, dt_time)):
+        return to_text(to_excel(value))
+    if isinstance(value, ExcelError):
+        return value
+    return str(value)
+
+
+def to_bool(value):
+    if value is None:
+        return False
+    if isinstance(value, (bool, ExcelError)):
+        return value
+    if isinstance(value, (int, float)):
+        return value != 0
+    if isinstance(value, str) and value.upper() in ("TRUE", "FALSE"):
+        return value.upper() == "TRUE"
+    return VALUE
+
+
+def is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def value_rank(value) -> int:
+    """Excel's cross-type ordering: numbers < text < logicals."""
+    if isinstance(value, bool):
+        return 2
+    if isinstance(value, str):
+        return 1
+    return 0
+
+
+def compare_values(a, b) -> int:
+    """Compare two non-error scalars the way Excel's comparison operators do."""
+    if isinstance(a, (datetime, date, dt_time)):
+        a = to_excel(a)
+    if isinstance(b, (datetime, date, dt_time)):
+        b = to_excel(b)
+    if a is None:
+        a = "" if isinstance(b, str) else (False if isinstance(b, bool) else 0)
+    if b is None:
+        b = "" if isinstance(a, str) else (False if isinstance(a, bool) else 0)
+    rank_a, rank_b = value_rank(a), value_rank(b)
+    if rank_a != rank_b:
+        return -1 if rank_a < rank_b else 1
+    if rank_a == 1:
+        a, b = a.lower(), b.lower()
+    return (a > b) - (a < b)
+
+
+def first_error(values):
+    for value in values:
+        if isinstance(value, ExcelError):
+            return value
+    return None
+
+
+def binary_op(op: str, a, b):
+    error = first_error((a, b))
+    if error:
+        return error
+    if op in ("=", "<>", "<", ">", "<=", ">="):
+        c = compare_values(a, b)
+        return {"=": c == 0, "<>": c != 0, "<": c < 0, ">": c > 0, "<=": c <= 0, ">=": c >= 0}[op]
+    if op == "&":
+        return to_text(a) + to_text(b)
+    x, y = to_number(a), to_number(b)
+    error = first_error((x, y))
+    if error:
+        return error
+    if op == "+":
+        return x + y
+    if op == "-":
+        return x - y
+    if op == "*":
+        return x * y
+    if op == "/":
+        return DIV0 if y == 0 else x / y
+    try:
+        result = x ** y
+    except (OverflowError, ZeroDivisionError):
+        return NUM
+    return NUM if isinstance(result, complex) else result
+
+
+def scalar(value):
+    """Reduce a single-cell range to its value; larger ranges are #VALUE!."""
+    if isinstance(value, RangeValue):
+        return value.cell(0, 0) if value.height == 1 and value.width == 1 else VALUE
+    return value
+
+
+def flatten(args):
+    for arg in args:
+        if isinstance(arg, RangeValue):
+            yield from arg.values()
+        else:
+            yield arg
+
+
+def collect_numbers(args):
+    """Numbers for SUM-like functions: ranges skip text/logicals, direct arguments are coerced."""
+    numbers = []
+    for arg in args:
+        if isinstance(arg, RangeValue):
+            for value in arg.values():
+                if isinstance(value, ExcelError):
+                    return value
+                if is_number(value):
+                    numbers.append(value)
+                elif isinstance(value, (datetime, date, dt_time)):
+                    numbers.append(to_excel(value))
+        elif arg is not None:
+            number = to_number(arg)
+            if isinstance(number, ExcelError):
+                return number
+            numbers.append(number)
+    return numbers
+
+
+def wildcard_pattern(text: str):
+    """Regex for an Excel wildcard pattern (* ? and ~ escapes), case-insensitive."""
+    parts, escaped = [], False
+    for ch in text:
+        if escaped:
+            parts.append(re.escape(ch))
+            escaped = False
+        elif ch == "~":
+            escaped = True
+        elif ch == "*":
+            parts.append(".*")
+        elif ch == "?":
+            parts.append(".")
+        else:
+            parts.append(re.escape(ch))
+    return re.compile("".join(parts), re.IGNORECASE | re.DOTALL)
+
+
+def build_criterion(criterion):
+    """Predicate for SUMIF/COUNTIF-style criteria such as 5, ">=10", "<>x" or "ab*"."""
+    ops = {"=": operator.eq, "<>": operator.ne, "<": operator.lt, ">": operator.gt,
+           "<=": operator.le, ">=": operator.ge}
+    
+    if isinstance(criterion, ExcelError):
+        return lambda v: v == criterion
+    if isinstance(criterion, str):
+        op, text = CRITERION_RE.match(criterion).groups()
+        op = op or "="
+        try:
+            operand = float(text)
+        except ValueError:
+            operand = text.upper() == "TRUE" if text.upper() in ("TRUE", "FALSE") else text
+    else:
+        op, operand = "=", criterion if criterion is not None else 0
+    compare = ops[op]
+    
+    if isinstance(operand, str):
+        if op in ("=", "<>"):
+            if operand == "":
+                matches = lambda v: v is None or v == ""
+            else:
+                pattern = wildcard_pattern(operand)
+                matches = lambda v: isinstance(v, str) and pattern.fullmatch(v) is not None
+            return matches if op == "=" else (lambda v: not matches(v))
+        lowered = operand.lower()
+        return lambda v: isinstance(v, str) and compare(v.lower(), lowered)
+    if isinstance(operand, bool):
+        return lambda v: compare(v, operand) if isinstance(v, bool) else op == "<>"
+    
+    def matches(v):
+        if isinstance(v, (datetime, date, dt_time)):
+            v = to_excel(v)
+        if not is_number(v):
+            return op == "<>"
+        return compare(v, operand)
+    return matches
+
+
+def matching_mask(pairs: list):
+    """Row-major booleans for cells meeting every (range, criterion) pair."""
+    if not pairs or any(not isinstance(rng, RangeValue) for rng, _ in pairs):
+        return VALUE
+    height, width = pairs[0][0].height, pairs[0][0].width
+    if any((rng.height, rng.width) != (height, width) for rng, _ in pairs):
+        return VALUE
+    mask = [True] * (height * width)
+    for rng, criterion in pairs:
+        criterion = scalar(criterion)
+        test = build_criterion(criterion)
+        for index, value in enumerate(rng.values()):
+            if mask[index] and not test(value):
+                mask[index] = False
+    return mask
+
+
+def lookup_position(keys: list, target, mode: int) -> Optional[int]:
+    """Index of target in keys: exact (0), largest <= (1, ascending) or smallest >= (-1, descending)."""
+    if isinstance(target, (datetime, date, dt_time)):
+        target = to_excel(target)
+    if mode == 0:
+        if isinstance(target, str) and any(ch in target for ch in "*?~"):
+            pattern = wildcard_pattern(target)
+            return next((i for i, k in enumerate(keys)
+                         if isinstance(k, str) and pattern.fullmatch(k)), None)
+        return next((i for i, k in enumerate(keys)
+                     if k is not None and not isinstance(k, ExcelError)
+                     and value_rank(k) == value_rank(target) and compare_values(k, target) == 0), None)
+    found = None
+    for i, key in enumerate(keys):
+        if key is None or isinstance(key, ExcelError) or value_rank(key) != value_rank(target):
+            continue
+        c = compare_values(key, target)
+        if (c <= 0) if mode > 0 else (c >= 0):
+            found = i
+        else:
+            break
+    return found
+
+
+# ---------------------------------------------------------------------------
+# Functions
+# ---------------------------------------------------------------------------
+#
+# SCALAR_FUNCTIONS receive single values with errors already propagated;
+# RANGE_FUNCTIONS receive ranges as RangeValue. IF, IFERROR and IFNA are
+# evaluated lazily by the Recalculator itself.
+
+def round_number(number, digits, rounding: str):
+    number, digits = to_number(number), to_number(digits if digits is not None else 0)
+    error = first_error((number, digits))
+    if error:
+        return error
+    digits = int(digits)
+    result = Decimal(repr(float(number))).quantize(Decimal(1).scaleb(-digits), rounding=rounding)
+    return int(result) if digits <= 0 else float(result)
+
+
+def numeric_function(fn):
+    """Wrap a function of numbers so its arguments are coerced and errors propagated."""
+    def wrapper(*args):
+        numbers = [to_number(arg) for arg in args]
+        error = first_error(numbers)
+        if error:
+            return error
+        try:
+            return fn(*numbers)
+        except (ValueError, OverflowError):
+            return NUM
+        except ZeroDivisionError:
+            return DIV0
+    return wrapper
+
+
+def text_function(fn):
+    def wrapper(text, *args):
+        text = to_text(text)
+        if isinstance(text, ExcelError):
+            return text
+        numbers = [to_number(arg) for arg in args]
+        error = first_error(numbers)
+        if error:
+            return error
+        return fn(text, *numbers)
+    return wrapper
+
+
+def fn_mod(number, divisor):
+    if divisor == 0:
+        return DIV0
+    return number - divisor * math.floor(number / divisor)
+
+
+def fn_date(year, month, day):
+    year, month, day = int(year), int(month), int(day)
+    if 0 <= year < 1900:
+        year += 1900
+    year += (month - 1) // 12
+    month = (month - 1) % 12 + 1
+    return to_excel(datetime(year, month, 1) + timedelta(days=day - 1))
+
+
+def date_part(part: str):
+    def fn(value):
+        if not isinstance(value, (datetime, date)):
+            number = to_number(value)
+            if isinstance(number, ExcelError):
+                return number
+            value = from_excel(number)
+        return getattr(value, part)
+    return fn
+
+
+def fn_not(value):
+    value = to_bool(value)
+    return value if isinstance(value, ExcelError) else not value
+
+
+def fn_value(value):
+    if is_number(value):
+        return value
+    number = to_number(value)
+    return VALUE if value is None or isinstance(value, bool) else number
+
+
+def fn_sum(*args):
+    numbers = collect_numbers(args)
+    return numbers if isinstance(numbers, ExcelError) else sum(numbers)
+
+
+def fn_average(*args):
+    numbers = collect_numbers(args)
+    if isinstance(numbers, ExcelError):
+        return numbers
+    return sum(numbers) / len(numbers) if numbers else DIV0
+
+
+def fn_min(*args):
+    numbers = collect_numbers(args)
+    return numbers if isinstance(numbers, ExcelError) else min(numbers, default=0)
+
+
+def fn_max(*args):
+    numbers = collect_numbers(args)
+    return numbers if isinstance(numbers, ExcelError) else max(numbers, default=0)
+
+
+def fn_product(*args):
+    numbers = collect_numbers(args)
+    if isinstance(numbers, ExcelError):
+        return numbers
+    result = 1
+    for number in numbers:
+        result *= number
+    return result if numbers else 0
+
+
+def fn_count(*args):
+    count = 0
+    for arg in args:
+        if isinstance(arg, RangeValue):
+            count += sum(1 for v in arg.values() if is_number(v) or isinstance(v, (datetime, date, dt_time)))
+        elif arg is not None and not isinstance(to_number(arg), ExcelError):
+            count += 1
+    return count
+
+
+def fn_counta(*args):
+    return sum(1 for v in flatten(args) if v is not None)
+
+
+def fn_countblank(rng):
+    if not isinstance(rng, RangeValue):
+        return VALUE
+    return sum(1 for v in rng.values() if v is None or v == "")
+
+
+def logical_values(args):
+    values = []
+    for arg in args:
+        if isinstance(arg, RangeValue):
+            for v in arg.values():
+                if isinstance(v, ExcelError):
+                    return v
+                if isinstance(v, bool) or is_number(v):
+                    values.append(bool(v))
+        elif arg is not None:
+            v = to_bool(arg)
+            if isinstance(v, ExcelError):
+                return v
+            values.append(v)
+    return values if values else VALUE
+
+
+def fn_and(*args):
+    values = logical_values(args)
+    return values if isinstance(values, ExcelError) else all(values)
+
+
+def fn_or(*args):
+    values = logical_values(args)
+    return values if isinstance(values, ExcelError) else any(values)
+
+
+def fn_concat(*args):
+    parts = [to_text(v) for v in flatten(args)]
+    error = first_error(parts)
+    return error if error else "".join(parts)
+
+
+def fn_sumif(rng, criterion, sum_range=None):
+    mask = matching_mask([(rng, criterion)])
+    if isinstance(mask, ExcelError):
+        return mask
+    target = sum_range.resized(rng.height, rng.width) if isinstance(sum_range, RangeValue) else rng
+    return sum(v for v, hit in zip(target.values(), mask) if hit and is_number(v))
+
+
+def fn_sumifs(sum_range, *pairs):
+    if len(pairs) % 2 or not isinstance(sum_range, RangeValue):
+        return VALUE
+    mask = matching_mask(list(zip(pairs[::2], pairs[1::2])))
+    if isinstance(mask, ExcelError):
+        return mask
+    if (sum_range.height, sum_range.width) != (pairs[0].height, pairs[0].width):
+        return VALUE
+    return sum(v for v, hit in zip(sum_range.values(), mask) if hit and is_number(v))
+
+
+def fn_countif(rng, criterion):
+    mask = matching_mask([(rng, criterion)])
+    return mask if isinstance(mask, ExcelError) else sum(mask)
+
+
+def fn_countifs(*pairs):
+    if not pairs or len(pairs) % 2:
+        return VALUE
+    mask = matching_mask(list(zip(pairs[::2], pairs[1::2])))
+    return mask if isinstance(mask, ExcelError) else sum(mask)
+
+
+def fn_averageif(rng, criterion, average_range=None):
+    mask = matching_mask([(rng, criterion)])
+    if isinstance(mask, ExcelError):
+        return mask
+    target = average_range.resized(rng.height, rng.width) if isinstance(average_range, RangeValue) else rng
+    numbers = [v for v, hit in zip(target.values(), mask) if hit and is_number(v)]
+    return sum(numbers) / len(numbers) if numbers else DIV0
+
+
+def fn_averageifs(average_range, *pairs):
+    if len(pairs) % 2 or not isinstance(average_range, RangeValue):
+        return VALUE
+    mask = matching_mask(list(zip(pairs[::2], pairs[1::2])))
+    if isinstance(mask, ExcelError):
+        return mask
+    numbers = [v for v, hit in zip(average_range.values(), mask) if hit and is_number(v)]
+    return sum(numbers) / len(numbers) if numbers else DIV0
+
+
+def fn_sumproduct(*arrays):
+    if not arrays or any(not isinstance(a, RangeValue) for a in arrays):
+        return VALUE
+    shape = (arrays[0].height, arrays[0].width)
+    if any((a.height, a.width) != shape for a in arrays):
+        return VALUE
+    total = 0
+    for values in zip(*(a.values() for a in arrays)):
+        error = first_error(values)
+        if error:
+            return error
+        product = 1
+        for v in values:
+            product *= v if is_number(v) else 0
+        total += product
+    return total
+
+
+def lookup_args(lookup_value, table, index, approximate):
+    """Shared argument handling for VLOOKUP/HLOOKUP."""
+    lookup_value, index = scalar(lookup_value), to_number(scalar(index))
+    approximate = True if approximate is None else to_bool(scalar(approximate))
+    error = first_error((lookup_value, index, approximate))
+    if error:
+        return error
+    if not isinstance(table, RangeValue) or index < 1:
+        return VALUE
+    return lookup_value, int(index), approximate
+
+
+def fn_vlookup(lookup_value, table, col_index, approximate=None):
+    args = lookup_args(lookup_value, table, col_index, approximate)
+    if isinstance(args, ExcelError):
+        return args
+    lookup_value, col_index, approximate = args
+    if col_index > table.width:
+        return REF
+    i = lookup_position(table.column(0), lookup_value, 1 if approximate else 0)
+    return NA if i is None else table.cell(i, col_index - 1)
+
+
+def fn_hlookup(lookup_value, table, row_index, approximate=None):
+    args = lookup_args(lookup_value, table, row_index, approximate)
+    if isinstance(args, ExcelError):
+        return args
+    lookup_value, row_index, approximate = args
+    if row_index > table.height:
+        return REF
+    j = lookup_position(table.row(0), lookup_value, 1 if approximate else 0)
+    return NA if j is None else table.cell(row_index - 1, j)
+
+
+def fn_match(lookup_value, rng, match_type=None):
+    lookup_value = scalar(lookup_value)
+    match_type = 1 if match_type is None else to_number(scalar(match_type))
+    error = first_error((lookup_value, match_type))
+    if error:
+        return error
+    if not isinstance(rng, RangeValue) or (rng.height > 1 and rng.width > 1):
+        return NA
+    keys = rng.column(0) if rng.width == 1 else rng.row(0)
+    mode = 0 if match_type == 0 else (1 if match_type > 0 else -1)
+    i = lookup_position(keys, lookup_value, mode)
+    return NA if i is None else i + 1
+
+
+def fn_index(rng, row_num, col_num=None):
+    row_num = to_number(scalar(row_num))
+    col_num = None if col_num is None else to_number(scalar(col_num))
+    error = first_error((row_num, col_num))
+    if error:
+        return error
+    if not isinstance(rng, RangeValue):
+        return scalar(rng) if row_num in (0, 1) and col_num in (None, 0, 1) else REF
+    row_num, col_num = int(row_num), None if col_num is None else int(col_num)
+    if col_num is None:
+        if rng.height == 1:
+            row_num, col_num = 1, row_num
+        elif rng.width == 1:
+            col_num = 1
+        else:
+            return VALUE  # a whole row of a 2-D range
+    if row_num < 1 or col_num < 1:
+        return VALUE  # whole row/column references are not supported
+    if row_num > rng.height or col_num > rng.width:
+        return REF
+    return rng.cell(row_num - 1, col_num - 1)
+
+
+SCALAR_FUNCTIONS = {
+    "ABS": numeric_function(abs),
+    "INT": numeric_function(math.floor),
+    "MOD": numeric_function(fn_mod),
+    "POWER": numeric_function(lambda x, y: binary_op("^", x, y)),
+    "SQRT": numeric_function(math.sqrt),
+    "ROUND": lambda x, digits=None: round_number(x, digits, "ROUND_HALF_UP"),
+    "ROUNDUP": lambda x, digits=None: round_number(x, digits, "ROUND_UP"),
+    "ROUNDDOWN": lambda x, digits=None: round_number(x, digits, "ROUND_DOWN"),
+    "NOT": fn_not,
+    "LEN": text_function(len),
+    "LEFT": text_function(lambda text, n=1: text[:int(n)]),
+    "RIGHT": text_function(lambda text, n=1: text[len(text) - int(n):] if n else ""),
+    "MID": text_function(lambda text, start, n: text[int(start) - 1:int(start) - 1 + int(n)]),
+    "UPPER": text_function(str.upper),
+    "LOWER": text_function(str.lower),
+    "TRIM": text_function(lambda text: " ".join(part for part in text.split(" ") if part)),
+    "VALUE": fn_value,
+    "DATE": numeric_function(fn_date),
+    "YEAR": date_part("year"),
+    "MONTH": date_part("month"),
+    "DAY": date_part("day"),
+}
+
+RANGE_FUNCTIONS = {
+    "SUM": fn_sum,
+    "AVERAGE": fn_average,
+    "MIN": fn_min,
+    "MAX": fn_max,
+    "PRODUCT": fn_product,
+    "COUNT": fn_count,
+    "COUNTA": fn_counta,
+    "COUNTBLANK": fn_countblank,
+    "AND": fn_and,
+    "OR": fn_or,
+    "CONCATENATE": fn_concat,
+    "CONCAT": fn_concat,
+    "SUMIF": fn_sumif,
+    "SUMIFS": fn_sumifs,
+    "COUNTIF": fn_countif,
+    "COUNTIFS": fn_countifs,
+    "AVERAGEIF": fn_averageif,
+    "AVERAGEIFS": fn_averageifs,
+    "SUMPRODUCT": fn_sumproduct,
+    "VLOOKUP": fn_vlookup,
+    "HLOOKUP": fn_hlookup,
+    "MATCH": fn_match,
+    "INDEX": fn_index,
+    "ISBLANK": lambda v: scalar(v) is None,
+    "ISERROR": lambda v: isinstance(scalar(v), ExcelError),
+    "ISNA": lambda v: scalar(v) == NA,
+    "ISNUMBER": lambda v: is_number(scalar(v)),
+    "ISTEXT": lambda v: isinstance(scalar(v), str),
+    "ISLOGICAL": lambda v: isinstance(scalar(v), bool),
+}
+
+LAZY_FUNCTIONS = {"IF", "IFERROR", "IFNA"}
+
+
+# ---------------------------------------------------------------------------
+# Dependency graph and recalculation
+# ---------------------------------------------------------------------------
+
+def defined_name_texts(wb) -> dict:
+    """Workbook-level defined names -> their formula text, by upper-case name."""
+    names = wb.defined_names
+    items = names.items() if hasattr(names, "items") else ((d.name, d) for d in names.definedName)
+    return {name.upper(): d.attr_text for name, d in items if d.attr_text and d.localSheetId is None}
+
+
+class Recalculator:
+    """Dependency graph and evaluator for every formula in a workbook."""
+    
+    def __init__(self, wb):
+        self.sheets = {ws.title: ws for ws in wb.worksheets}
+        self.sheet_keys = {title.lower(): title for title in self.sheets}
+        self.names = defined_name_texts(wb)
+        self.formulas = {}   # (sheet, row, col) -> compiled tree, or FormulaError
+        self.points = {}     # (sheet, row, col) -> formulas referring to that cell
+        self.areas = {}      # (sheet, col) -> [(min_row, max_row, formula)] for range references
+        self.cached = {}     # (sheet, row, col) -> last known value of each formula
+        self.computed = {}
+        
+        for ws in wb.worksheets:
+            for (row, col), cell in ws._cells.items():
+                if cell.data_type == "f":
+                    self.add_formula((ws.title, row, col), cell.value)
+    
+    def add_formula(self, key: tuple, formula):
+        if not isinstance(formula, str):
+            self.formulas[key] = FormulaError("array formula")
+            return
+        refs = []
+        try:
+            self.formulas[key] = self.compile(parse_formula(formula), key[0], refs)
+        except (FormulaError, RecursionError) as e:
+            self.formulas[key] = e if isinstance(e, FormulaError) else FormulaError("too deeply nested")
+            return
+        for sheet, min_row, min_col, max_row, max_col in refs:
+            if min_row == max_row and min_col == max_col:
+                self.points.setdefault((sheet, min_row, min_col), []).append(key)
+                continue
+            max_col = min(max_col, max(self.sheets[sheet].max_column, min_col))
+            for col in range(min_col, max_col + 1):
+                self.areas.setdefault((sheet, col), []).append((min_row, max_row, key))
+    
+    def compile(self, node: tuple, sheet: str, refs: list, depth: int = 0) -> tuple:
+        """Resolve references to ("range", sheet, bounds...) and check function support."""
+        kind = node[0]
+        if kind == "ref":
+            return self.reference(node[1], sheet, refs, depth)
+        if kind == "func":
+            name = node[1]
+            if name not in SCALAR_FUNCTIONS and name not in RANGE_FUNCTIONS and name not in LAZY_FUNCTIONS:
+                raise FormulaError(name)
+            return ("func", name, [self.compile(arg, sheet, refs, depth) for arg in node[2]])
+        if kind == "op":
+            return ("op", node[1], self.compile(node[2], sheet, refs, depth),
+                    self.compile(node[3], sheet, refs, depth))
+        if kind in ("neg", "pct"):
+            return (kind, self.compile(node[1], sheet, refs, depth))
+        return node
+    
+    def reference(self, text: str, sheet: str, refs: list, depth: int) -> tuple:
+        ref_sheet, ref = split_sheet_reference(text)
+        bounds = parse_reference_bounds(ref)
+        if bounds is None:
+            name_text = self.names.get(ref.upper()) if ref_sheet is None else None
+            if name_text is None or depth > 10:
+                return ("value", NAME)
+            return self.compile(parse_formula("=" + name_text), sheet, refs, depth + 1)
+        target = self.sheet_keys.get((ref_sheet or sheet).lower())
+        if target is None:
+            return ("value", REF)
+        refs.append((target, *bounds))
+        return ("range", target, *bounds)
+    
+    def dependents(self, key: tuple) -> list:
+        sheet, row, col = key
+        found = list(self.points.get(key, ()))
+        for min_row, max_row, formula in self.areas.get((sheet, col), ()):
+            if min_row <= row <= max_row:
+                found.append(formula)
+        return found
+    
+    def lookup(self, sheet: str, row: int, col: int):
+        key = (sheet, row, col)
+        if key in self.computed:
+            return self.computed[key]
+        if key in self.formulas:
+            return self.cached.get(key)
+        cell = self.sheets[sheet]._cells.get((row, col))
+        return None if cell is None else cell.value
+    
+    def evaluate(self, node: tuple):
+        kind = node[0]
+        if kind == "value":
+            return node[1]
+        if kind == "range":
+            _, sheet, min_row, min_col, max_row, max_col = node
+            ws = self.sheets[sheet]
+            # Whole rows/columns stop at the sheet's used range
+            if max_row == XLSX_MAX_ROW:
+                max_row = max(ws.max_row, min_row)
+            if max_col == XLSX_MAX_COL:
+                max_col = max(ws.max_column, min_col)
+            return RangeValue(self, sheet, min_row, min_col, max_row, max_col)
+        if kind == "missing":
+            return None
+        if kind == "op":
+            return binary_op(node[1], scalar(self.evaluate(node[2])), scalar(self.evaluate(node[3])))
+        if kind == "neg":
+            number = to_number(scalar(self.evaluate(node[1])))
+            return number if isinstance(number, ExcelError) else -number
+        if kind == "pct":
+            number = to_number(scalar(self.evaluate(node[1])))
+            return number if isinstance(number, ExcelError) else number / 100
+        
+        name, args = node[1], node[2]
+        if name in LAZY_FUNCTIONS:
+            return self.evaluate_lazy(name, args)
+        values = [self.evaluate(arg) for arg in args]
+        if name in SCALAR_FUNCTIONS:
+            values = [scalar(v) for v in values]
+            error = first_error(values)
+            if error:
+                return error
+            fn = SCALAR_FUNCTIONS[name]
+        else:
+            fn = RANGE_FUNCTIONS[name]
+        try:
+            return fn(*values)
+        except TypeError:
+            return VALUE  # wrong number of arguments
+    
+    def evaluate_lazy(self, name: str, args: list):
+        if not args:
+            return VALUE
+        first = scalar(self.evaluate(args[0]))
+        if name == "IF":
+            condition = to_bool(first)
+            if isinstance(condition, ExcelError):
+                return condition
+            branch = 1 if condition else 2
+            if branch >= len(args):
+                return condition
+            return self.evaluate(args[branch])
+        if len(args) < 2:
+            return VALUE
+        caught = first == NA if name == "IFNA" else isinstance(first, ExcelError)
+        return self.evaluate(args[1]) if caught else first
+    
+    def evaluate_cell(self, key: tuple):
+        value = scalar(self.evaluate(self.formulas[key]))
+        return 0 if value is None else value
+    
+    def run(self, changed: Optional[list] = None) -> dict:
+        """Recompute formulas downstream of changed cells (all formulas if None)."""
+        evaluable = {k for k, tree in self.formulas.items() if not isinstance(tree, FormulaError)}
+        if changed is None:
+            seeds = set(self.formulas)
+        else:
+            # Formulas with no cached value are computed too, so nothing reads None
+            seeds = set(changed) | {k for k in evaluable if self.cached.get(k) is None}
+        
+        # Everything reachable from the seeds, with the edges between them
+        dirty, queue, edges = set(seeds), list(seeds), {}
+        while queue:
+            key = queue.pop()
+            for dependent in self.dependents(key):
+                edges.setdefault(key, []).append(dependent)
+                if dependent not in dirty:
+                    dirty.add(dependent)
+                    queue.append(dependent)
+        
+        # Topological order over the dirty formulas (Kahn's algorithm)
+        pending = dirty & evaluable
+        indegree = dict.fromkeys(pending, 0)
+        for source in pending:
+            for target in edges.get(source, ()):
+                if target in indegree:
+                    indegree[target] += 1
+        ready = [k for k, n in indegree.items() if n == 0]
+        order = []
+        while ready:
+            key = ready.pop()
+            order.append(key)
+            for target in edges.get(key, ()):
+                if target in indegree:
+                    indegree[target] -= 1
+                    if indegree[target] == 0:
+                        ready.append(target)
+        circular = sorted(pending - set(order))
+        
+        errors = failed = 0
+        for key in order:
+            try:
+                value = self.evaluate_cell(key)
+            except Exception:
+                # Keep the cached value rather than abort the whole recalculation
+                failed += 1
+                continue
+            self.computed[key] = value
+            if isinstance(value, ExcelError):
+                errors += 1
+        
+        unsupported = {}
+        for key in dirty:
+            tree = self.formulas.get(key)
+            if isinstance(tree, FormulaError):
+                unsupported[str(tree)] = unsupported.get(str(tree), 0) + 1
+        
+        return {
+            "formulas": len(self.formulas),
+            "recalculated": len(self.computed),
+            "errors": errors,
+            "failed": failed,
+            "unsupported": unsupported,
+            "circular": [f"{s}!{coords_to_cell(r, c)}" for s, r, c in circular[:20]],
+        }
+    
+    def values(self) -> dict:
+        """Latest value of every formula: recomputed, else the cached one."""
+        values = {k: v for k, v in self.cached.items() if v is not None and k in self.formulas}
+        values.update(self.computed)
+        return values
 
 
-def cmd_copy_sheet(args):
-    """Copy a sheet."""
-    require_openpyxl()
-    
-    wb = load_workbook(args.file)
-    
-    if args.source not in wb.sheetnames:
-        fail(f"Sheet '{args.source}' not found")
-    
-    if args.new_name in wb.sheetnames:
-        fail(f"Sheet '{args.new_name}' already exists")
-    
-    source_ws = wb[args.source]
-    new_ws = wb.copy_worksheet(source_ws)
-    new_ws.title = args.new_name
-    
-    wb.save(args.file)
-    ok({
-        "source": args.source,
-        "copy": args.new_name,
-        "sheets": wb.sheetnames,
-    })
+def cached_formula_values(path: str, keys) -> dict:
+    """Values Excel last cached for the given formula cells, from a data_only read."""
+    by_sheet = {}
+    for sheet, row, col in keys:
+        by_sheet.setdefault(sheet, {}).setdefault(row, []).append(col)
+    if not by_sheet or not os.path.exists(path):
+        return {}
+    
+    values = {}
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for sheet, rows in by_sheet.items():
+            if sheet not in wb.sheetnames:
+                continue
+            cols = [c for row_cols in rows.values() for c in row_cols]
+            min_col, max_col = min(cols), max(cols)
+            for row_no, row in enumerate(wb[sheet].iter_rows(min_row=min(rows), max_row=max(rows),
+                                                             min_col=min_col, max_col=max_col,
+                                                             values_only=True), start=min(rows)):
+                for col in rows.get(row_no, ()):
+                    if col - min_col < len(row):
+                        values[(sheet, row_no, col)] = row[col - min_col]
+    finally:
+        wb.close()
+    return values
 
 
-def cmd_insert_rows(args):
-    """Insert rows."""
-    require_openpyxl()
-    
-    wb = load_workbook(args.file)
-    ws = get_sheet(wb, args.sheet)
-    
-    ws.insert_rows(args.row, args.count)
-    wb.save(args.file)
-    
-    ok({
-        "inserted": "rows",
-        "at": args.row,
-        "count": args.count,
-        "sheet": ws.title,
-    })
+def recalculate(wb, path: str, changed: Optional[list] = None) -> dict:
+    """Recompute formulas and keep the results on wb for save_workbook to write."""
+    started = time.perf_counter()
+    calc = Recalculator(wb)
+    pending = getattr(wb, "formula_values", None)
+    calc.cached = pending if pending is not None else cached_formula_values(path, calc.formulas)
+    # Earlier edits in this workbook session were not recalculated, so the
+    # cached values can't be trusted: recompute everything.
+    if getattr(wb, "values_stale", False):
+        changed = None
+    stats = calc.run(changed)
+    wb.formula_values = calc.values()
+    wb.values_stale = False
+    stats["ms"] = round((time.perf_counter() - started) * 1000, 3)
+    return stats
 
 
-def cmd_insert_cols(args):
-    """Insert columns."""
-    require_openpyxl()
-    
-    wb = load_workbook(args.file)
-    ws = get_sheet(wb, args.sheet)
-    
-    # Convert column letter to number if needed
-    col = args.col
-    if isinstance(col, str) and col.isalpha():
-        col = column_index_from_string(col.upper())
-    
-    ws.insert_cols(int(col), args.count)
-    wb.save(args.file)
-    
-    ok({
-        "inserted": "columns",
-        "at": args.col,
-        "count": args.count,
-        "sheet": ws.title,
-    })
+def note_value_changes(wb, args):
+    """Drop pending formula results after an operation that may change cell values."""
+    if args.command in VALUE_NEUTRAL_OPS or getattr(args, "recalc", False):
+        return
+    wb.formula_values = None
+    wb.values_stale = True
 
 
-def cmd_delete_rows(args):
-    """Delete rows."""
-    require_openpyxl()
-    
-    wb = load_workbook(args.file)
-    ws = get_sheet(wb, args.sheet)
-    
-    ws.delete_rows(args.row, args.count)
-    wb.save(args.file)
-    
-    ok({
-        "deleted": "rows",
-        "at": args.row,
-        "count": args.count,
-        "sheet": ws.title,
-    })
+def cached_value_xml(value) -> tuple:
+    """(t attribute, <v> text) for a formula's cached value."""
+    if isinstance(value, bool):
+        return "b", "1" if value else "0"
+    if isinstance(value, ExcelError):
+        return "e", value.code
+    if isinstance(value, (datetime, date, dt_time)):
+        value = to_excel(value)
+    if isinstance(value, float):
+        return None, str(int(value)) if value.is_integer() and abs(value) < 1e15 else repr(value)
+    if isinstance(value, int):
+        return None, str(value)
+    return "str", str(value)
 
 
-def cmd_delete_cols(args):
-    """Delete columns."""
-    require_openpyxl()
-    
-    wb = load_workbook(args.file)
-    ws = get_sheet(wb, args.sheet)
-    
-    col = args.col
-    if isinstance(col, str) and col.isalpha():
-        col = column_index_from_string(col.upper())
-    
-    ws.delete_cols(int(col), args.count)
-    wb.save(args.file)
-    
-    ok({
-        "deleted": "columns",
-        "at": args.col,
-        "count": args.count,
-        "sheet": ws.title,
-    })
+def write_formula_values(path: str, values: dict):
+    """Write formula results into a saved .xlsx as the cells' cached values."""
+    by_sheet = {}
+    for (sheet, row, col), value in values.items():
+        by_sheet.setdefault(sheet, {})[(row, col)] = value
+    
+    with zipfile.ZipFile(path) as zin:
+        parts, _ = list_sheet_parts(zin)
+        part_paths = {part["name"]: part["path"] for part in parts}
+        patched = {}
+        for sheet, cells in by_sheet.items():
+            part = part_paths.get(sheet)
+            if part is None:
+                continue
+            root = parse_part(zin.read(part))
+            for c in root.iter(f"{{{NS_MAIN}}}c"):
+                if c.find(f"{{{NS_MAIN}}}f") is None:
+                    continue
+                coords = cell_to_coords(c.get("r"))
+                if coords not in cells:
+                    continue
+                v = c.find(f"{{{NS_MAIN}}}v")
+                if v is None:
+                    v = ET.SubElement(c, f"{{{NS_MAIN}}}v")
+                t, v.text = cached_value_xml(cells[coords])
+                if t:
+                    c.set("t", t)
+                else:
+                    c.attrib.pop("t", None)
+            patched[part] = ET.tostring(root, encoding="UTF-8", xml_declaration=True)
+        
+        if not patched:
+            return
+        tmp_path = f"{path}.tmp"
+        with zipfile.ZipFile(tmp_path, "w") as zout:
+            for item in zin.infolist():
+                if item.filename in patched:
+                    zout.writestr(item, patched[item.filename])
+                else:
+                    copy_zip_member_raw(zin, zout, item)
+    os.replace(tmp_path, path)
 
 
-def cmd_merge(args):
-    """Merge cells."""
-    require_openpyxl()
-    
-    wb = load_workbook(args.file)
-    ws = get_sheet(wb, args.sheet)
-    
-    ws.merge_cells(args.range)
-    wb.save(args.file)
-    
-    ok({
-        "merged": args.range,
-        "sheet": ws.title,
-    })
+def op_recalc(wb, args) -> dict:
+    """Recalculate every formula and store the results as cached values."""
+    return recalculate(wb, args.file)
 
 
-def cmd_unmerge(args):
-    """Unmerge cells."""
-    require_openpyxl()
-    
-    wb = load_workbook(args.file)
-    ws = get_sheet(wb, args.sheet)
-    
-    ws.unmerge_cells(args.range)
-    wb.save(args.file)
-    
-    ok({
-        "unmerged": args.range,
-        "sheet": ws.title,
-    })
+# ============================================================================
+# Mutations & batch
+# ============================================================================
 
+# Operations that modify a loaded workbook; each returns its result fields.
+MUTATIONS = {
+    "write": op_write,
+    "edit": op_edit,
+    "add-sheet": op_add_sheet,
+    "rename-sheet": op_rename_sheet,
+    "delete-sheet": op_delete_sheet,
+    "copy-sheet": op_copy_sheet,
+    "insert-rows": op_insert_rows,
+    "insert-cols": op_insert_cols,
+    "delete-rows": op_delete_rows,
+    "delete-cols": op_delete_cols,
+    "merge": op_merge,
+    "unmerge": op_unmerge,
+    "format": op_format,
+    "resize": op_resize,
+    "freeze": op_freeze,
+    "replace": op_replace,
+    "apply-diff": op_apply_diff,
+    "recalc": op_recalc,
+}
 
-def cmd_format(args):
-    """Format cells."""
-    require_openpyxl()
-    
-    wb = load_workbook(args.file)
-    ws = get_sheet(wb, args.sheet)
-    
-    (start_row, start_col), (end_row, end_col) = parse_range(args.range)
-    
-    applied = []
-    
-    for row in range(start_row, end_row + 1):
-        for col in range(start_col, end_col + 1):
-            cell = ws.cell(row=row, column=col)
-            
-            # Font
-            if args.bold is not None or args.italic is not None or args.font_size or args.font_color or args.font_name:
-                current_font = cell.font
-                cell.font = Font(
-                    name=args.font_name or current_font.name,
-                    size=args.font_size or current_font.size,
-                    bold=args.bold if args.bold is not None else current_font.bold,
-                    italic=args.italic if args.italic is not None else current_font.italic,
-                    color=parse_color(args.font_color) if args.font_color else current_font.color,
-                )
-                applied.append("font")
-            
-            # Fill/background
-            if args.bg_color:
-                cell.fill = PatternFill(start_color=parse_color(args.bg_color),
-                                         end_color=parse_color(args.bg_color),
-                                         fill_type="solid")
-                applied.append("background")
-            
-            # Alignment
-            if args.align or args.valign or args.wrap:
-                current_align = cell.alignment
-                cell.alignment = Alignment(
-                    horizontal=args.align or current_align.horizontal,
-                    vertical=args.valign or current_align.vertical,
-                    wrap_text=args.wrap if args.wrap is not None else current_align.wrap_text,
-                )
-                applied.append("alignment")
-            
-            # Border
-            if args.border:
-                side = Side(style=args.border, color="FF000000")
-                cell.border = Border(left=side, right=side, top=side, bottom=side)
-                applied.append("border")
-    
-    wb.save(args.file)
-    ok({
-        "range": args.range,
-        "sheet": ws.title,
-        "applied": list(set(applied)),
-    })
 
+def open_for_update(path: str):
+    """Load a workbook for editing, or start a new one if the file doesn't exist."""
+    if os.path.exists(path):
+        return open_workbook(path)
+    return Workbook()
 
-def cmd_resize(args):
-    """Resize rows/columns."""
-    require_openpyxl()
-    
-    wb = load_workbook(args.file)
-    ws = get_sheet(wb, args.sheet)
-    
-    resized = []
-    
-    if args.row:
-        for spec in args.row:
-            row_num, height = spec.split(':')
-            ws.row_dimensions[int(row_num)].height = float(height)
-            resized.append(f"row {row_num} = {height}")
-    
-    if args.col:
-        for spec in args.col:
-            col_letter, width = spec.split(':')
-            ws.column_dimensions[col_letter.upper()].width = float(width)
-            resized.append(f"col {col_letter} = {width}")
-    
-    wb.save(args.file)
-    ok({
-        "sheet": ws.title,
-        "resized": resized,
-    })
 
+def mutation(operation, create: bool = False):
+    """Build a command that loads the workbook, applies one operation and saves."""
+    def command(args):
+        require_openpyxl()
+        wb = open_for_update(args.file) if create else open_workbook(args.file)
+        result = operation(wb, args)
+        note_value_changes(wb, args)
+        save_workbook(wb, args.file)
+        ok(result)
+    command.__doc__ = operation.__doc__
+    return command
 
-def cmd_freeze(args):
-    """Freeze panes at cell."""
-    require_openpyxl()
-    
-    wb = load_workbook(args.file)
-    ws = get_sheet(wb, args.sheet)
+
+def load_batch_ops(source: Optional[str]) -> list:
+    """Read operations from a JSONL or JSON-array file, or stdin for '-'/None."""
+    try:
+        if source in (None, "-"):
+            text = sys.stdin.read()
+        else:
+            with open(source, 'r', encoding='utf-8') as f:
+                text = f.read()
+    except OSError as e:
+        fail(f"Failed to read operations: {e}")
     
-    ws.freeze_panes = args.cell.upper()
-    wb.save(args.file)
+    try:
+        ops = [json.loads(line) for line in text.splitlines() if line.strip()]
+        # A single line holding a list of operations is a JSON array, not an argv op
+        if len(ops) == 1 and isinstance(ops[0], list) and ops[0] and isinstance(ops[0][0], (dict, list)):
+            ops = ops[0]
+        return ops
+    except json.JSONDecodeError:
+        pass
     
-    ok({
-        "sheet": ws.title,
-        "frozen_at": args.cell.upper(),
-    })
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError as e:
+        fail(f"Invalid operations JSON: {e}")
 
 
-def cmd_find(args):
-    """Find text in sheet."""
-    require_openpyxl()
-    
-    wb = load_workbook(args.file, read_only=True, data_only=True)
-    ws = get_sheet(wb, args.sheet)
+def op_to_argv(subparser, fields: dict) -> list:
+    """Turn {"cell": "A1", "bold": true, ...} into CLI arguments for subparser."""
+    fields = {k.replace("-", "_"): v for k, v in fields.items()}
+    positionals, options = [], []
+    known = {"file"}
+    
+    for action in subparser._actions:
+        known.add(action.dest)
+        if action.dest in ("help", "file") or action.dest not in fields:
+            continue
+        value = fields[action.dest]
+        if not action.option_strings:
+            positionals.append(value if isinstance(value, str) else json.dumps(value))
+        elif action.nargs == 0:
+            # Flags such as --bold/--no-bold share a dest; pick the one that stores value
+            if action.const == value:
+                options.append(action.option_strings[0])
+        else:
+            items = value if isinstance(action, argparse._AppendAction) and isinstance(value, list) else [value]
+            for item in items:
+                options += [action.option_strings[0], item if isinstance(item, str) else json.dumps(item)]
+    
+    unknown = sorted(set(fields) - known)
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(unknown)}")
+    return positionals + options
+
+
+def parse_batch_op(parser, subparsers, path: str, op, index: int):
+    """Parse one batch operation (dict with "op", or argv-style list) into args."""
+    if isinstance(op, list) and op:
+        name, argv = str(op[0]), [str(a) for a in op[1:]]
+    elif isinstance(op, dict) and "op" in op:
+        name = op["op"]
+        fields = {k: v for k, v in op.items() if k != "op"}
+        try:
+            argv = op_to_argv(subparsers.choices[name], fields) if name in MUTATIONS else []
+        except ValueError as e:
+            fail(f"Operation {index}: {e}", {"op": op})
+    else:
+        fail(f"Operation {index} must be an object with \"op\" or a list", {"op": op})
     
-    results = []
-    search_lower = args.text.lower()
-    
-    for row in ws.iter_rows():
-        for cell in row:
-            if cell.value and search_lower in str(cell.value).lower():
-                results.append({
-                    "cell": cell.coordinate,
-                    "value": cell.value,
-                })
+    if name not in MUTATIONS:
+        fail(f"Operation {index}: '{name}' cannot be batched", {"supported": list(MUTATIONS)})
     
-    ok({
-        "search": args.text,
-        "sheet": ws.title,
-        "found": len(results),
-        "results": results,
-    })
-    wb.close()
+    try:
+        return parser.parse_args([name, path, *argv])
+    except SystemExit:
+        fail(f"Operation {index}: invalid arguments", {"op": op})
 
 
-def cmd_replace(args):
-    """Find and replace text."""
+def cmd_batch(args):
+    """Apply a list of operations to one loaded workbook and save once."""
     require_openpyxl()
     
-    wb = load_workbook(args.file)
-    ws = get_sheet(wb, args.sheet)
+    ops = load_batch_ops(args.ops)
+    parser, subparsers = build_parser()
+    parsed = [parse_batch_op(parser, subparsers, args.file, op, i) for i, op in enumerate(ops)]
     
-    count = 0
+    started = time.perf_counter()
+    wb = open_for_update(args.file)
+    load_ms = (time.perf_counter() - started) * 1000
+    
+    results = []
+    for index, op_args in enumerate(parsed):
+        op_started = time.perf_counter()
+        try:
+            result = MUTATIONS[op_args.command](wb, op_args)
+            note_value_changes(wb, op_args)
+        except Exception as e:
+            fail(f"Operation {index} ({op_args.command}) failed: {e}",
+                 {"applied": index, "saved": False})
+        results.append({
+            "index": index,
+            "op": op_args.command,
+            "ms": round((time.perf_counter() - op_started) * 1000, 3),
+            "result": result,
+        })
     
-    for row in ws.iter_rows():
-        for cell in row:
-            if cell.value and isinstance(cell.value, str) and args.old in cell.value:
-                cell.value = cell.value.replace(args.old, args.new)
-                count += 1
+    save_started = time.perf_counter()
+    if not args.dry_run:
+        save_workbook(wb, args.file)
+    elif _workbook_cache is not None:
+        # The cached workbook now holds the unsaved edits; a later command must
+        # not pick them up and write them out
+        _workbook_cache.discard(os.path.abspath(args.file))
+    save_ms = (time.perf_counter() - save_started) * 1000
     
-    wb.save(args.file)
     ok({
-        "old": args.old,
-        "new": args.new,
-        "sheet": ws.title,
-        "replaced": count,
+        "file": args.file,
+        "operations": len(results),
+        "saved": not args.dry_run,
+        "load_ms": round(load_ms, 3),
+        "save_ms": round(save_ms, 3),
+        "total_ms": round((time.perf_counter() - started) * 1000, 3),
+        "results": results,
     })
 
 
-def cmd_to_csv(args):
-    """Export sheet to CSV."""
-    require_openpyxl()
-    
-    wb = load_workbook(args.file, read_only=True, data_only=True)
-    ws = get_sheet(wb, args.sheet)
-    
-    with open(args.output, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        for row in ws.iter_rows(values_only=True):
-            writer.writerow(row)
-    
-    ok({
-        "source": args.file,
-        "sheet": ws.title,
-        "output": args.output,
-        "rows": ws.max_row,
-    })
-    wb.close()
+# ============================================================================
+# Daemon
+# ============================================================================
+
+def run_in_daemon(argv: list, cwd: str) -> dict:
+    """Execute one forwarded command in-process, capturing its output."""
+    stdout, stderr = io.StringIO(), io.StringIO()
+    code = 0
+    previous = os.getcwd()
+    _workbook_cache.touched.clear()
+    try:
+        os.chdir(cwd)
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            try:
+                main(argv)
+            except SystemExit as e:
+                code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+            except Exception as e:
+                fail(str(e))
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else 1
+    except OSError as e:
+        stdout.write(json.dumps({"success": False, "error": str(e)}, indent=2) + "\n")
+        code = 1
+    finally:
+        os.chdir(previous)
+    
+    if code:
+        # A failed command may have left a cached workbook half-modified
+        for path in _workbook_cache.touched:
+            _workbook_cache.discard(path)
+    return {"code": code, "stdout": stdout.getvalue(), "stderr": stderr.getvalue()}
 
 
-def cmd_to_json(args):
-    """Export sheet to JSON."""
-    require_openpyxl()
+def cmd_serve(args):
+    """Run the workbook cache daemon on a Unix socket."""
+    global _workbook_cache
+    socket_path = args.socket or daemon_socket_path()
+    
+    if args.status or args.stop:
+        response = daemon_request({"control": "stop" if args.stop else "status"}, socket_path, timeout=5)
+        if response is None:
+            fail("No daemon running", {"socket": socket_path})
+        ok({"socket": socket_path, **response})
+        return
     
-    wb = load_workbook(args.file, read_only=True, data_only=True)
-    ws = get_sheet(wb, args.sheet)
+    require_openpyxl()
+    if not hasattr(socket, "AF_UNIX"):
+        fail("serve requires Unix domain sockets")
+    if daemon_request({"control": "status"}, socket_path, timeout=5) is not None:
+        fail("Daemon already running", {"socket": socket_path})
     
-    data = []
-    headers = None
+    Path(socket_path).parent.mkdir(parents=True, exist_ok=True)
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)  # stale socket from a daemon that didn't exit cleanly
     
-    for i, row in enumerate(ws.iter_rows(values_only=True)):
-        if i == 0:
-            headers = list(row)
-        else:
-            row_dict = {}
-            for j, val in enumerate(row):
-                if j < len(headers) and headers[j]:
-                    row_dict[headers[j]] = val
-            data.append(row_dict)
+    _workbook_cache = WorkbookCache(args.memory_mb * 1024 * 1024)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    os.chmod(socket_path, 0o600)
+    server.listen(16)
     
-    with open(args.output, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, default=str)
+    ok({"serving": socket_path, "pid": os.getpid(), "memory_mb": args.memory_mb})
+    sys.stdout.flush()
     
-    ok({
-        "source": args.file,
-        "sheet": ws.title,
-        "output": args.output,
-        "rows": len(data),
-    })
-    wb.close()
+    try:
+        while True:
+            conn, _ = server.accept()
+            with conn:
+                data = b""
+                while True:
+                    chunk = conn.recv(65536)
+                    if not chunk:
+                        break
+                    data += chunk
+                try:
+                    request = json.loads(data)
+                except json.JSONDecodeError:
+                    continue
+                
+                if request.get("control") == "status":
+                    response = {"pid": os.getpid(), "cache": _workbook_cache.stats()}
+                elif request.get("control") == "stop":
+                    response = {"stopped": True, "pid": os.getpid()}
+                else:
+                    response = run_in_daemon(request.get("argv", []), request.get("cwd", os.getcwd()))
+                conn.sendall(json.dumps(response, default=str).encode("utf-8"))
+                
+                if request.get("control") == "stop":
+                    break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
 
 
-def cmd_to_markdown(args):
-    """Export sheet to markdown table."""
-    require_openpyxl()
-    
-    wb = load_workbook(args.file, read_only=True, data_only=True)
-    ws = get_sheet(wb, args.sheet)
-    
-    data = read_sheet_data(ws)
-    print(data_to_markdown(data))
-    wb.close()
+DEFAULT_PAGE_SIZE = 100
+
 
+def add_markdown_args(p):
+    """Options shared by commands that render markdown tables."""
+    p.add_argument("--max-width", type=int, help="Truncate markdown cells to this many characters")
+    p.add_argument("--page", type=int, help="Output only this page of rows (1-based; header repeated)")
+    p.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE, help="Rows per page for --page")
 
-def main():
+
+def build_parser():
     parser = argparse.ArgumentParser(
         description="Excel CLI - Read, write, edit, and format Excel files",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -904,13 +6558,16 @@ def main():
     # info
     p = subparsers.add_parser("info", help="Get workbook information")
     p.add_argument("file", help="Excel file path")
+    p.add_argument("--scan", action="store_true", help="Scan cells for exact ranges instead of trusting <dimension>")
     
     # read
     p = subparsers.add_parser("read", help="Read sheet data")
     p.add_argument("file", help="Excel file path")
     p.add_argument("--sheet", "-s", help="Sheet name")
-    p.add_argument("--range", "-r", help="Cell range (e.g., A1:D10)")
-    p.add_argument("--format", "-f", choices=["json", "csv", "markdown"], default="json")
+    p.add_argument("--range", "-r", help="Cell range(s), comma-separated (e.g., A1:D10,F1:F10)")
+    p.add_argument("--format", "-f", choices=["json", "ndjson", "csv", "markdown"], default="json")
+    p.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows per write batch")
+    add_markdown_args(p)
     
     # cell
     p = subparsers.add_parser("cell", help="Read a specific cell")
@@ -932,15 +6589,40 @@ def main():
     
     # from-csv
     p = subparsers.add_parser("from-csv", help="Create Excel from CSV")
-    p.add_argument("csv_file", help="Input CSV file")
+    p.add_argument("csv_files", nargs="+", metavar="csv_file", help="Input CSV file(s) or glob patterns")
     p.add_argument("excel_file", help="Output Excel file")
-    p.add_argument("--sheet", "-s", help="Sheet name")
+    p.add_argument("--sheet", "-s", help="Sheet name (single CSV only)")
+    p.add_argument("--coerce", action="store_true", help="Convert numbers and ISO dates from text")
+    p.add_argument("--max-rows", type=int, default=EXCEL_MAX_ROWS, help="Rows per sheet before rolling over")
+    p.add_argument("--repeat-header", action="store_true", help="Repeat the first row on rollover sheets")
+    p.add_argument("--workers", type=int, help="Parallel parsing processes for several CSVs (default: CPU count)")
+    p.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows per spooled chunk")
+    
+    # append
+    p = subparsers.add_parser("append", help="Append rows to a sheet without loading the workbook")
+    p.add_argument("file", help="Excel file path")
+    p.add_argument("--data", "-d", required=True, help="JSONL/JSON file of rows (arrays or header-keyed objects), '-' for stdin, or inline JSON")
+    p.add_argument("--sheet", "-s", help="Sheet name (default: active sheet)")
+    p.add_argument("--coerce", action="store_true", help="Convert numbers and ISO dates from text")
+    
+    # sort
+    p = subparsers.add_parser("sort", help="Sort a sheet's rows, spilling to disk for large sheets")
+    p.add_argument("file", help="Excel file path")
+    p.add_argument("--by", "-b", required=True, help="Key columns by letter (or header name with --header); prefix - for descending (e.g., C,-D)")
+    p.add_argument("--sheet", "-s", help="Sheet name (default: active sheet)")
+    p.add_argument("--header", action="store_true", help="Keep the first row in place as a header")
+    p.add_argument("--output", "-o", help="Write the sorted workbook here instead of updating the file")
+    p.add_argument("--memory-mb", type=int, default=DEFAULT_SORT_MEMORY_MB,
+                   help="Memory for buffered rows before sorted runs spill to disk (default: %(default)s)")
     
     # from-json
     p = subparsers.add_parser("from-json", help="Create Excel from JSON")
     p.add_argument("json_file", help="Input JSON file")
     p.add_argument("excel_file", help="Output Excel file")
     p.add_argument("--sheet", "-s", help="Sheet name")
+    p.add_argument("--ndjson", action="store_true", help="Input has one JSON value per line (default for .jsonl/.ndjson)")
+    p.add_argument("--max-rows", type=int, default=EXCEL_MAX_ROWS, help="Rows per sheet before rolling over")
+    p.add_argument("--repeat-header", action="store_true", help="Repeat the first row on rollover sheets")
     
     # edit
     p = subparsers.add_parser("edit", help="Edit a cell")
@@ -949,6 +6631,11 @@ def main():
     p.add_argument("value", help="New value")
     p.add_argument("--sheet", "-s", help="Sheet name")
     p.add_argument("--formula", "-F", action="store_true", help="Value is a formula")
+    p.add_argument("--recalc", action="store_true", help="Recompute dependent formulas and cache their values")
+    
+    # recalc
+    p = subparsers.add_parser("recalc", help="Recompute formulas and cache their values")
+    p.add_argument("file", help="Excel file path")
     
     # add-sheet
     p = subparsers.add_parser("add-sheet", help="Add a new sheet")
@@ -1016,7 +6703,7 @@ def main():
     # format
     p = subparsers.add_parser("format", help="Format cells")
     p.add_argument("file", help="Excel file path")
-    p.add_argument("range", help="Cell range to format")
+    p.add_argument("range", help="Cell range to format (A1:D10, whole columns A:C or rows 1:1)")
     p.add_argument("--sheet", "-s", help="Sheet name")
     p.add_argument("--bold", "-b", action="store_true", default=None)
     p.add_argument("--no-bold", dest="bold", action="store_false")
@@ -1050,32 +6737,166 @@ def main():
     p.add_argument("file", help="Excel file path")
     p.add_argument("text", help="Text to search for")
     p.add_argument("--sheet", "-s", help="Sheet name")
+    p.add_argument("--columns", "-c", help="Only search these columns (e.g., A,C:E)")
+    p.add_argument("--max-results", "-m", type=int, help="Stop after this many matches")
+    p.add_argument("--regex", "-e", action="store_true", help="Text is a regular expression")
+    p.add_argument("--whole-cell", "-w", action="store_true", help="Match the entire cell value")
+    p.add_argument("--case-sensitive", action="store_true", help="Match case exactly")
+    p.add_argument("--index", action="store_true", help="Use (and build if needed) a cached value index")
     
     # replace
     p = subparsers.add_parser("replace", help="Find and replace text")
     p.add_argument("file", help="Excel file path")
-    p.add_argument("old", help="Text to find")
-    p.add_argument("new", help="Replacement text")
+    p.add_argument("old", nargs="?", help="Text (or regex) to find")
+    p.add_argument("new", nargs="?", help="Replacement text")
+    scope = p.add_mutually_exclusive_group()
+    scope.add_argument("--sheet", "-s", help="Sheet name")
+    scope.add_argument("--all-sheets", action="store_true", help="Replace in every sheet")
+    p.add_argument("--range", "-r", help="Limit to range(s), comma-separated (e.g., A1:D100,F1:F50)")
+    p.add_argument("--regex", "-e", action="store_true", help="Patterns are regular expressions")
+    p.add_argument("--map", help="JSON object/pairs or two-column CSV of old->new replacements")
+    p.add_argument("--dry-run", action="store_true", help="Count replacements without saving")
+    
+    # profile
+    p = subparsers.add_parser("profile", help="Summarise sheet shape, column types and values")
+    p.add_argument("file", help="Excel file path")
+    p.add_argument("--sheet", "-s", help="Only this sheet (default: all)")
+    p.add_argument("--top", type=int, default=DEFAULT_PROFILE_TOP, help="Most frequent values per column")
+    p.add_argument("--sample", type=int, default=DEFAULT_PROFILE_SAMPLE, help="Rows in the random sample")
+    p.add_argument("--seed", type=int, default=0, help="Random seed for the sample")
+    p.add_argument("--no-header", action="store_true", help="First row is data; name columns A, B, ...")
+    
+    # aggregate
+    p = subparsers.add_parser("aggregate", help="Group rows and compute sums/counts/means")
+    p.add_argument("file", help="Excel file path")
     p.add_argument("--sheet", "-s", help="Sheet name")
+    p.add_argument("--group-by", "-g", help="Group columns by header or letter (e.g., Region,B)")
+    p.add_argument("--count", action="store_true", help="Count rows per group")
+    for kind in AGGREGATES:
+        p.add_argument(f"--{kind}", help=f"Columns to {kind}, comma-separated")
+    p.add_argument("--sort", action="store_true", help="Sort groups by their keys (default: first seen)")
+    p.add_argument("--no-header", action="store_true", help="First row is data; name columns A, B, ...")
+    p.add_argument("--out", help="Write the result to this sheet (replacing it) instead of JSON")
+    p.add_argument("--output", help="Write the result to a new workbook instead of the source file")
+    
+    # diff
+    p = subparsers.add_parser("diff", help="Compare two workbooks row by row")
+    p.add_argument("file_a", help="Old Excel file")
+    p.add_argument("file_b", help="New Excel file")
+    p.add_argument("--key", "-k", help="Key column(s) matching rows, by header or letter (default: row number)")
+    p.add_argument("--sheet", "-s", help="Sheet name (in both files)")
+    p.add_argument("--sheet-b", help="Sheet name in the new file, if different")
+    p.add_argument("--no-header", action="store_true", help="First row is data; name columns A, B, ...")
+    p.add_argument("--values", action="store_true", help="Compare cached formula results, not formulas")
+    
+    # dedupe
+    p = subparsers.add_parser("dedupe", help="Remove duplicate rows from a sheet")
+    p.add_argument("file", help="Excel file path")
+    p.add_argument("--sheet", "-s", help="Sheet name (default: active sheet)")
+    p.add_argument("--key", "-k", help="Columns that define a duplicate, by header or letter (default: whole row)")
+    p.add_argument("--keep", choices=["first", "last"], default="first", help="Which of the duplicates to keep")
+    p.add_argument("--verify", action="store_true", help="Confirm fingerprint matches against exact keys (second pass)")
+    p.add_argument("--report", metavar="FILE", help="Write the removed rows, and the row each duplicated, to this workbook")
+    p.add_argument("--no-header", action="store_true", help="First row is data; name columns A, B, ...")
+    p.add_argument("--output", "-o", help="Write the cleaned workbook here instead of updating the file")
+    p.add_argument("--dry-run", action="store_true", help="Count duplicates (and write --report) without saving")
+    
+    # join
+    p = subparsers.add_parser("join", help="Join two workbooks on key columns (VLOOKUP-style)")
+    p.add_argument("left", help="Left Excel file (every row kept for --how left)")
+    p.add_argument("right", help="Right Excel file (looked up)")
+    p.add_argument("--on", required=True, help="Key column(s) by header or letter; LEFT=RIGHT when names differ (e.g., id or CustID=ID,Region)")
+    p.add_argument("--how", choices=JOIN_TYPES, default="left",
+                   help="left: all left rows; inner: matched only; anti: left rows with no match")
+    p.add_argument("--sheet", "-s", help="Sheet name (in both files)")
+    p.add_argument("--right-sheet", help="Sheet name in the right file, if different")
+    p.add_argument("--index", choices=["auto", "left", "right"], default="auto",
+                   help="Side to hold in the hash index (default: the one with fewer rows)")
+    p.add_argument("--no-header", action="store_true", help="First row is data; name columns A, B, ...")
+    p.add_argument("--output", "-o", help="Write the joined rows to this workbook instead of JSON")
+    
+    # apply-diff
+    p = subparsers.add_parser("apply-diff", help="Apply diff output to a workbook")
+    p.add_argument("file", help="Excel file path (the diff's old file)")
+    p.add_argument("diff", help="Diff JSON file ('-' for stdin)")
+    p.add_argument("--sheet", "-s", help="Sheet name (default: the diff's old sheet)")
+    p.add_argument("--force", action="store_true", help="Apply even if cells no longer hold the old values")
+    
+    # query
+    p = subparsers.add_parser("query", help="Run SQL over sheets (via SQLite)")
+    p.add_argument("file", help="Excel file path")
+    p.add_argument("sql", help='SQL; sheets are tables, e.g. SELECT SUM(Amount) FROM "Sales" WHERE Region = \'EU\'')
+    p.add_argument("--format", "-f", choices=["json", "ndjson", "csv", "markdown"], default="json")
+    p.add_argument("--no-header", action="store_true", help="First row is data; name columns A, B, ...")
+    p.add_argument("--no-cache", action="store_true", help="Load into an in-memory database, not the cache")
+    p.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows per insert/write batch")
     
     # to-csv
     p = subparsers.add_parser("to-csv", help="Export sheet to CSV")
     p.add_argument("file", help="Excel file path")
-    p.add_argument("output", help="Output CSV file")
-    p.add_argument("--sheet", "-s", help="Sheet name")
+    p.add_argument("output", help="Output CSV file (directory with --all-sheets)")
+    scope = p.add_mutually_exclusive_group()
+    scope.add_argument("--sheet", "-s", help="Sheet name")
+    scope.add_argument("--all-sheets", action="store_true", help="Export every sheet to its own file")
+    p.add_argument("--workers", type=int, help="Parallel processes for --all-sheets (default: CPU count)")
+    p.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows per write batch")
     
     # to-json
     p = subparsers.add_parser("to-json", help="Export sheet to JSON")
     p.add_argument("file", help="Excel file path")
-    p.add_argument("output", help="Output JSON file")
-    p.add_argument("--sheet", "-s", help="Sheet name")
+    p.add_argument("output", help="Output JSON file (directory with --all-sheets)")
+    scope = p.add_mutually_exclusive_group()
+    scope.add_argument("--sheet", "-s", help="Sheet name")
+    scope.add_argument("--all-sheets", action="store_true", help="Export every sheet to its own file")
+    p.add_argument("--workers", type=int, help="Parallel processes for --all-sheets (default: CPU count)")
+    p.add_argument("--ndjson", action="store_true", help="Write one JSON object per line")
+    p.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows per write batch")
     
     # to-markdown
     p = subparsers.add_parser("to-markdown", help="Export sheet to markdown")
     p.add_argument("file", help="Excel file path")
-    p.add_argument("--sheet", "-s", help="Sheet name")
-    
-    args = parser.parse_args()
+    scope = p.add_mutually_exclusive_group()
+    scope.add_argument("--sheet", "-s", help="Sheet name")
+    scope.add_argument("--all-sheets", action="store_true", help="Export every sheet to its own file")
+    p.add_argument("--output-dir", help="Directory for --all-sheets output")
+    p.add_argument("--workers", type=int, help="Parallel processes for --all-sheets (default: CPU count)")
+    add_markdown_args(p)
+    
+    # to-parquet / to-arrow
+    for name, label in (("to-parquet", "Parquet"), ("to-arrow", "Arrow IPC")):
+        p = subparsers.add_parser(name, help=f"Export sheet to {label} (requires pyarrow)")
+        p.add_argument("file", help="Excel file path")
+        p.add_argument("output", help=f"Output {label} file")
+        p.add_argument("--sheet", "-s", help="Sheet name")
+        p.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                       help="Rows per row group / record batch")
+        p.add_argument("--sample-rows", type=int, default=DEFAULT_SAMPLE_ROWS,
+                       help="Rows used to infer column types")
+        p.add_argument("--types", help="Type overrides, e.g. Amount=float,Code=string")
+        p.add_argument("--no-header", action="store_true", help="First row is data; name columns A, B, ...")
+        if name == "to-parquet":
+            p.add_argument("--compression", choices=["snappy", "zstd", "gzip", "none"], default="snappy")
+    
+    # batch
+    p = subparsers.add_parser("batch", help="Apply many edits with one load/save")
+    p.add_argument("file", help="Excel file path")
+    p.add_argument("--ops", help="JSONL/JSON file of operations (default: stdin)")
+    p.add_argument("--dry-run", action="store_true", help="Apply operations but don't save")
+    
+    # serve
+    p = subparsers.add_parser("serve", help="Run the workbook cache daemon")
+    p.add_argument("--socket", help="Unix socket path (default: ~/.cache/excel-cli/excel.sock)")
+    p.add_argument("--memory-mb", type=int, default=DEFAULT_DAEMON_MEMORY_MB,
+                   help="Approximate memory budget for cached workbooks")
+    p.add_argument("--status", action="store_true", help="Show a running daemon's cache stats")
+    p.add_argument("--stop", action="store_true", help="Stop a running daemon")
+    
+    return parser, subparsers
+
+
+def main(argv: Optional[list] = None):
+    parser, _ = build_parser()
+    args = parser.parse_args(argv)
     
     if not args.command:
         parser.print_help()
@@ -1086,28 +6907,42 @@ def main():
         "read": cmd_read,
         "cell": cmd_cell,
         "create": cmd_create,
-        "write": cmd_write,
+        "write": mutation(op_write, create=True),
         "from-csv": cmd_from_csv,
+        "append": cmd_append,
+        "sort": cmd_sort,
         "from-json": cmd_from_json,
-        "edit": cmd_edit,
-        "add-sheet": cmd_add_sheet,
-        "rename-sheet": cmd_rename_sheet,
-        "delete-sheet": cmd_delete_sheet,
-        "copy-sheet": cmd_copy_sheet,
-        "insert-rows": cmd_insert_rows,
-        "insert-cols": cmd_insert_cols,
-        "delete-rows": cmd_delete_rows,
-        "delete-cols": cmd_delete_cols,
-        "merge": cmd_merge,
-        "unmerge": cmd_unmerge,
-        "format": cmd_format,
-        "resize": cmd_resize,
-        "freeze": cmd_freeze,
+        "edit": mutation(op_edit),
+        "recalc": mutation(op_recalc),
+        "add-sheet": mutation(op_add_sheet),
+        "rename-sheet": mutation(op_rename_sheet),
+        "delete-sheet": mutation(op_delete_sheet),
+        "copy-sheet": mutation(op_copy_sheet),
+        "insert-rows": mutation(op_insert_rows),
+        "insert-cols": mutation(op_insert_cols),
+        "delete-rows": mutation(op_delete_rows),
+        "delete-cols": mutation(op_delete_cols),
+        "merge": mutation(op_merge),
+        "unmerge": mutation(op_unmerge),
+        "format": mutation(op_format),
+        "resize": mutation(op_resize),
+        "freeze": mutation(op_freeze),
         "find": cmd_find,
         "replace": cmd_replace,
+        "profile": cmd_profile,
+        "aggregate": cmd_aggregate,
+        "diff": cmd_diff,
+        "query": cmd_query,
+        "apply-diff": mutation(op_apply_diff),
+        "join": cmd_join,
+        "dedupe": cmd_dedupe,
         "to-csv": cmd_to_csv,
         "to-json": cmd_to_json,
         "to-markdown": cmd_to_markdown,
+        "to-parquet": cmd_to_parquet,
+        "to-arrow": cmd_to_arrow,
+        "batch": cmd_batch,
+        "serve": cmd_serve,
     }
     
     try: